@@ -2,29 +2,104 @@
 """
 The main actor in alfred-todoist.
 
-This script takes the given input, parses it out, and sends it to Todoist
-using the user's api key.
+This script takes the given input, parses it out, and journals it in the
+outbox. A background flusher then sends it to Todoist using the user's api
+key.
 """
 import sys
+
+if __name__ == '__main__':
+	# Hand the run to the warm daemon, if it is enabled, before importing
+	# anything else.
+	import daemon
+	daemon.delegate('addtask')
+
 from workflow import Workflow3
 
 from parse import TaskParser
+from outbox import Outbox, start_flusher
 
 
 INBOX_ID = 0
 
 
+class NameResolver:
+	"""
+	Looks up the IDs of Todoist objects by name.
+
+	The objects in `api.state[resource]` are indexed into an exact-match
+	table and a case-folded table. The index is only rebuilt when the state
+	changes, i.e. when the object list is replaced, grows or shrinks, or the
+	api's sync token moves on.
+
+	Exact matches win over case-insensitive ones. If several objects share a
+	name, the first one in the state is used.
+	"""
+	def __init__(self, resource):
+		self.resource = resource
+		self.exact = {}
+		self.folded = {}
+		self._objects = None
+		self._size = None
+		self._sync_token = None
+
+	def index(self, api):
+		objects = api.state[self.resource]
+		sync_token = getattr(api, 'sync_token', None)
+		if (objects is self._objects and len(objects) == self._size and
+				sync_token == self._sync_token):
+			return
+		exact = {}
+		folded = {}
+		for obj in objects:
+			exact.setdefault(obj['name'], obj['id'])
+			folded.setdefault(obj['name'].lower(), obj['id'])
+		self.exact = exact
+		self.folded = folded
+		self._objects = objects
+		self._size = len(objects)
+		self._sync_token = sync_token
+
+	def resolve(self, name, api):
+		"""
+		Find the ID of the object called `name`.
+
+		Args:
+			name (str): Name of the label or project
+			api: Anything with a Todoist-style `state`
+		Returns:
+			The object's ID, or None if there is no object with that name.
+		"""
+		self.index(api)
+		try:
+			return self.exact[name]
+		except KeyError:
+			return self.folded.get(name.lower())
+
+
+resolvers = {
+	'labels': NameResolver('labels'),
+	'projects': NameResolver('projects'),
+}
+
+
 def label_ids_from_names(label_names, api):
-	labels = api.state['labels']
-	return [label['id'] for label in labels if label['name'] in label_names]
+	resolver = resolvers['labels']
+	label_ids = []
+	for name in label_names:
+		label_id = resolver.resolve(name, api)
+		if label_id is not None and label_id not in label_ids:
+			label_ids.append(label_id)
+	return label_ids
 
 
 def project_id_from_name(project_name, api):
-	projects = api.state['projects']
-	for project in projects:
-		if project['name'] == project_name:
-			return project['id']
-	return INBOX_ID
+	if not project_name:
+		return INBOX_ID
+	project_id = resolvers['projects'].resolve(project_name, api)
+	if project_id is None:
+		return INBOX_ID
+	return project_id
 
 
 def convert_priority(priority):
@@ -51,50 +126,51 @@ def should_sync_upfront(task):
 	return bool(task['labels'] or task['project'])
 
 
-def build_api_payload(task, api):
-	if should_sync_upfront(task):
-		# don't bother making upfront api calls if we don't need existing IDs.
-		api.sync()
-		label_ids = label_ids_from_names(task['labels'], api)
-		project_id = project_id_from_name(task['project'], api)
-	else:
-		label_ids = []
-		project_id = INBOX_ID
+def payload_from_state(task, source):
+	"""
+	Build the api payload for a task from already synced state.
+
+	Args:
+		task (dict): The output of `TaskParser.parse`
+		source: The api, or a mirror, whose `state` has the labels and projects
+	Returns:
+		dict
+	"""
 	return {
-		'labels': label_ids,
-		'project': project_id,
+		'labels': label_ids_from_names(task['labels'], source),
+		'project': project_id_from_name(task['project'], source),
 		'priority': convert_priority(task['priority']),
 		'date_string': task['due']
 	}
 
 
-def create_task(task_text, project_id, api,
-				additional_properties=None, notes=None):
-	if additional_properties is None:
-		additional_properties = {}
-	task = api.items.add(task_text, project_id, **additional_properties)
-	api.commit()
-	if notes:
-		for note in notes:
-			api.notes.add(task['id'], note)
-		api.commit()
+def build_api_payload(task, mirror):
+	"""
+	Build the api payload for a task from the local mirror.
 
+	The mirror is only synced when it is stale or missing one of the task's
+	label or project names.
 
-def main(wf):
-	import todoist
+	Args:
+		task (dict): The output of `TaskParser.parse`
+		mirror (TodoistMirror): Labels and projects to resolve names with
+	Returns:
+		dict
+	"""
+	if should_sync_upfront(task):
+		mirror.ensure(task['labels'],
+			[task['project']] if task['project'] else [])
+	return payload_from_state(task, mirror)
 
+
+def main(wf):
 	wf.logger.info("parsing task: '{}'".format(wf.args[0]))
 	task = TaskParser().parse(wf.args[0])
-	api_key = wf.get_password('todoist')
-	api = todoist.TodoistAPI(api_key)
-	payload = build_api_payload(task, api)
-	project_id = payload.pop('project')
-
-	wf.logger.debug("task: {}".format(repr(task['todo'])))
-	wf.logger.debug("project id: {}".format(repr(project_id)))
-	wf.logger.debug("args: {}".format(repr(payload)))
-	create_task(task['todo'], project_id, api,
-				additional_properties=payload, notes=task['notes'])
+	# Journal the task and return to Alfred straight away. The flusher sends
+	# it to Todoist, and keeps it until Todoist has it.
+	entry = Outbox(wf).append(task)
+	wf.logger.debug("journaled task {}: {}".format(entry['id'], repr(task['todo'])))
+	start_flusher(wf)
 
 
 if __name__ == '__main__':
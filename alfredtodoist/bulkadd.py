@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Add many tasks to Todoist at once.
+
+Every non-empty line of the input, or of the clipboard if there is no input,
+is parsed as its own task, using the same syntax as `addtask.py`. The tasks
+are journaled in the outbox together, and the flusher sends them in as few
+sync requests as the api's command limit allows, resolving label and project
+names once for the whole list, and reports how many tasks it sent per second.
+Tasks that cannot be sent stay in the outbox for the next try.
+"""
+import subprocess
+import sys
+from workflow import Workflow3
+
+from outbox import Outbox, start_flusher
+from parse import TaskParser
+
+
+def split_tasks(text):
+	"""
+	Split pasted text into one todo string per non-empty line.
+
+	Args:
+		text (string): Multi-line text
+	Returns:
+		list
+	"""
+	return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def bulk_add(text, outbox):
+	"""
+	Parse every line of `text` and journal the tasks in the outbox.
+
+	Args:
+		text (string): Multi-line text, one task per line
+		outbox (Outbox): Journal to add the tasks to
+	Returns:
+		list
+
+		The new journal entries.
+	"""
+	parser = TaskParser()
+	return outbox.extend([parser.parse(line) for line in split_tasks(text)])
+
+
+def main(wf):
+	from workflow.notify import notify
+
+	text = wf.args[0] if wf.args and wf.args[0].strip() else None
+	if text is None:
+		text = subprocess.check_output(['pbpaste']).decode('utf-8')
+	entries = bulk_add(text, Outbox(wf))
+	if not entries:
+		return
+	start_flusher(wf)
+	summary = 'Sending {} tasks to Todoist'.format(len(entries))
+	wf.logger.info(summary)
+	notify(summary)
+
+
+if __name__ == '__main__':
+	wf = Workflow3(libraries=['./lib'])
+	sys.exit(wf.run(main))
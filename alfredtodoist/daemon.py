@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+A long-lived process that runs `feedback.py` and `addtask.py` for Alfred.
+
+Every keystroke normally starts a new interpreter, which then imports
+`workflow` and `parse`, reads the workflow's settings and sets up logging
+before doing any work. When the `use_daemon` workflow variable is set, the
+scripts instead hand their arguments to this daemon over a Unix socket and
+print whatever it sends back. The daemon keeps the modules, the `Workflow3`
+object and its caches loaded between keystrokes.
+
+The daemon is started by the first script that finds no daemon listening;
+that script still runs in-process. It exits once it has been idle for
+`IDLE_TIMEOUT` seconds, or after a request if the workflow's code has
+changed since it started.
+
+Only the standard library is imported at the top of this module, so the
+scripts can forward to the daemon before importing anything else.
+"""
+import errno
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+
+
+DAEMON_VARIABLE = 'use_daemon'
+SOCKET_NAME = 'daemon.sock'
+# How long (in seconds) the daemon waits for a request before exiting.
+IDLE_TIMEOUT = 60 * 10
+# How long (in seconds) either side waits on a connected socket.
+REQUEST_TIMEOUT = 10
+# Socket paths longer than this are rejected on macOS.
+MAX_SOCKET_PATH = 100
+# Scripts that can run again in-process if the daemon takes a request but
+# does not answer it, as running them twice only repeats their output.
+RERUNNABLE = ('feedback',)
+
+
+def enabled():
+	"""
+	Check whether the scripts should forward to the daemon.
+
+	The daemon is opt-in, and only used when running under Alfred, which
+	sets the cache directory the socket lives in.
+	"""
+	return (os.getenv(DAEMON_VARIABLE, '').lower() in ('1', 'true', 'yes') and
+		bool(os.getenv('alfred_workflow_cache')))
+
+
+def socket_path(cachedir):
+	"""
+	Path of the daemon's socket for the workflow cached in `cachedir`.
+
+	The socket goes in the cache directory, unless that path is too long for
+	a Unix socket. It then goes in the temp directory, under a name derived
+	from the cache directory.
+	"""
+	path = os.path.join(cachedir, SOCKET_NAME)
+	if len(path) <= MAX_SOCKET_PATH:
+		return path
+	digest = hashlib.sha1(cachedir).hexdigest()[:16]
+	return os.path.join(tempfile.gettempdir(), 'alfredtodoist-{}.sock'.format(digest))
+
+
+def read_all(sock):
+	chunks = []
+	while True:
+		chunk = sock.recv(65536)
+		if not chunk:
+			return ''.join(chunks)
+		chunks.append(chunk)
+
+
+def connect(path):
+	"""
+	Connect to the daemon listening on `path`.
+
+	Returns:
+		socket.socket, or None if no daemon is listening.
+	"""
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(path)
+	except socket.error:
+		sock.close()
+		return None
+	sock.settimeout(REQUEST_TIMEOUT)
+	return sock
+
+
+def send_request(sock, script, args, env):
+	"""
+	Have the daemon run `script` with `args` in the environment `env`.
+
+	Returns:
+		dict
+
+		{
+			'status': int, the script's exit status,
+			'output': unicode, what the script wrote to stdout
+		}
+	"""
+	try:
+		sock.sendall(json.dumps({'script': script, 'args': args, 'env': env}))
+		sock.shutdown(socket.SHUT_WR)
+		return json.loads(read_all(sock))
+	finally:
+		sock.close()
+
+
+def start():
+	"""
+	Start a daemon in the background and return without waiting for it.
+	"""
+	with open(os.devnull, 'r+b') as devnull:
+		subprocess.Popen(
+			[sys.executable, os.path.abspath(__file__)],
+			stdin=devnull, stdout=devnull, stderr=devnull,
+			close_fds=True, preexec_fn=os.setsid)
+
+
+def delegate(script):
+	"""
+	Run `script` in the daemon instead of this process, if it is enabled.
+
+	If the daemon answers, its output is written to stdout and the process
+	exits with the script's status. If no daemon is listening, one is started
+	for the next run and this returns, so the caller carries on in-process.
+
+	Once the request is sent, the daemon may run the script even if it never
+	answers, e.g. it times out behind a slow request or fails after the run.
+	Only scripts in `RERUNNABLE` then carry on in-process. For the others the
+	error is reported and the process exits, so a task is not added twice.
+
+	Args:
+		script (str): Name of the script, e.g. `feedback`
+	"""
+	if not enabled():
+		return
+	cachedir = os.getenv('alfred_workflow_cache')
+	sock = connect(socket_path(cachedir))
+	if sock is None:
+		start()
+		return
+	try:
+		response = send_request(sock, script, sys.argv[1:], dict(os.environ))
+	except (socket.error, socket.timeout, ValueError) as err:
+		if script in RERUNNABLE:
+			return
+		report_failure(script, err)
+		sys.exit(1)
+	sys.stdout.write(response['output'].encode('utf-8'))
+	sys.stdout.flush()
+	sys.exit(response['status'])
+
+
+def report_failure(script, err):
+	"""
+	Tell the user the daemon did not answer a request that cannot be re-run.
+	"""
+	from workflow.notify import notify
+
+	message = u'No answer from the daemon running {}: {}'.format(script, err)
+	sys.stderr.write(message.encode('utf-8') + '\n')
+	notify('Check Todoist', u'The task may not have been added. ' + message)
+
+
+def source_mtimes():
+	"""Modification times of the workflow's python files."""
+	here = os.path.dirname(os.path.abspath(__file__))
+	paths = glob.glob(os.path.join(here, '*.py'))
+	paths += glob.glob(os.path.join(here, 'workflow', '*.py'))
+	return {path: os.stat(path).st_mtime for path in paths}
+
+
+class Daemon:
+	"""
+	Serves script runs, one at a time, on a Unix socket.
+
+	Each request replaces the process's environment, `sys.argv` and
+	`sys.stdout` for the duration of the run, so the scripts' `main`
+	functions run unchanged.
+	"""
+	def __init__(self, wf, path, idle_timeout=IDLE_TIMEOUT):
+		import addtask
+		import feedback
+
+		self.wf = wf
+		self.path = path
+		self.idle_timeout = idle_timeout
+		self.scripts = {'addtask': addtask, 'feedback': feedback}
+		wf.password_cache_ttl = feedback.PASSWORD_CACHE_TTL
+		wf.cache_max_age = feedback.CACHE_MAX_AGE
+		wf.cache_max_bytes = feedback.CACHE_MAX_BYTES
+		self.sources = source_mtimes()
+
+	def reset(self):
+		"""
+		Clear what a run leaves on the workflow object, as a new process
+		would start without it.
+		"""
+		wf = self.wf
+		session_id = os.getenv('_WF_SESSION_ID') or None
+		if session_id != wf._session_id:
+			# The cached password file is scoped to the session.
+			wf.secret_backend = None
+		elif not os.path.exists(getattr(wf.secret_backend, 'filepath', '')):
+			# e.g. removed by `setkey.py` along with the session cache.
+			wf.secret_backend = None
+		wf._items = []
+		wf.variables = {}
+		wf._rerun = 0
+		wf._session_id = session_id
+		if session_id:
+			wf.setvar('_WF_SESSION_ID', session_id)
+
+	def handle(self, request):
+		"""
+		Run a script as if it had been started by Alfred.
+
+		Args:
+			request (dict): `script`, `args` and `env`, as sent by
+				`send_request`
+		Returns:
+			dict
+
+			The script's exit `status` and its `output`.
+		"""
+		from cStringIO import StringIO
+
+		script = self.scripts[request['script']]
+		os.environ.clear()
+		os.environ.update(request['env'])
+		sys.argv = [script.__file__] + request['args']
+		self.reset()
+
+		stdout = sys.stdout
+		sys.stdout = StringIO()
+		try:
+			try:
+				status = self.wf.run(script.main)
+			except SystemExit as err:
+				# Magic arguments exit once they are handled.
+				status = err.code or 0
+			output = sys.stdout.getvalue()
+		finally:
+			sys.stdout = stdout
+		return {'status': status, 'output': output.decode('utf-8')}
+
+	def serve(self):
+		"""
+		Answer requests until idle for `idle_timeout` seconds.
+
+		Returns:
+			bool
+
+			False if another daemon is already serving on `path`.
+		"""
+		lock = open(self.path + '.lock', 'a')
+		try:
+			fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except IOError as err:
+			if err.errno not in (errno.EAGAIN, errno.EACCES):
+				raise
+			lock.close()
+			return False
+
+		server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			# Left behind by a daemon that was killed; the lock says it is
+			# not running any more.
+			if os.path.exists(self.path):
+				os.unlink(self.path)
+			# Created readable by the user only, with no window in which
+			# others could connect.
+			umask = os.umask(0o177)
+			try:
+				server.bind(self.path)
+			finally:
+				os.umask(umask)
+			server.listen(8)
+			server.settimeout(self.idle_timeout)
+			self.wf.logger.debug('daemon listening on {}'.format(self.path))
+			while self.serve_one(server):
+				pass
+		finally:
+			server.close()
+			if os.path.exists(self.path):
+				os.unlink(self.path)
+			lock.close()
+		return True
+
+	def serve_one(self, server):
+		"""
+		Answer a single request.
+
+		Returns:
+			bool
+
+			False once the daemon should exit.
+		"""
+		try:
+			conn, _ = server.accept()
+		except socket.timeout:
+			self.wf.logger.debug('daemon idle, exiting')
+			return False
+		conn.settimeout(REQUEST_TIMEOUT)
+		try:
+			response = self.handle(json.loads(read_all(conn)))
+			conn.sendall(json.dumps(response))
+		except Exception as err:
+			self.wf.logger.exception(err)
+		finally:
+			conn.close()
+		if source_mtimes() != self.sources:
+			self.wf.logger.debug('workflow code changed, exiting')
+			return False
+		return True
+
+
+def main():
+	from workflow import Workflow3
+
+	wf = Workflow3(libraries=['./lib'])
+	Daemon(wf, socket_path(wf.cachedir)).serve()
+
+
+if __name__ == '__main__':
+	main()
@@ -6,12 +6,145 @@ This script parses out the user's input and provides it back in an easy
 to read manner.
 """
 import sys
+
+if __name__ == '__main__':
+	# Hand the run to the warm daemon, if it is enabled, before importing
+	# anything else.
+	import daemon
+	daemon.delegate('feedback')
+
+import re
 from workflow import Workflow3, PasswordNotFound
+from workflow.background import is_running, run_in_background
 
+from mirror import TodoistMirror
+from outbox import Outbox, resume_flush
 from parse import TaskParser
 
 
-def transform_for_feedback(task):
+PASSWORD_CACHE_TTL = 60
+# Budget for the cache directory, kept by the workflow's cache janitor.
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+SYNCER_NAME = 'sync_mirror'
+MAX_SUGGESTIONS = 20
+# A label or project name being typed at the end of the text.
+partial_name_regex = re.compile(r'(?:^|\s)(?P<marker>[@#])(?P<prefix>[-\w]*)$',
+	re.UNICODE)
+non_ascii_regex = re.compile(u'[^\x00-\x7f]')
+
+
+def format_name(marker, name):
+	"""
+	Write a label or project name the way the parser reads it back.
+
+	Project names that contain spaces are wrapped in parentheses.
+
+	Returns:
+		string, or None if `TaskParser` cannot read the name back, e.g. a
+		label with a hyphen or a project with an `&`.
+	"""
+	written = [marker + name]
+	if marker == '#':
+		written.append(u'#({})'.format(name))
+	for text in written:
+		match = TaskParser.token_regex.match(text)
+		if (match and match.end() == len(text) and
+				match.group(match.lastindex) == name):
+			return text
+	return None
+
+
+def candidate_names(prefix, names):
+	"""
+	Drop the names `Workflow.filter` cannot match, before it scores them.
+
+	Every rule `filter` matches on needs the characters of `prefix` to
+	appear in the name, in order. That is checked with a regex, which
+	is much cheaper than scoring the name. Non-ASCII names are kept, as
+	`filter` folds them to ASCII before matching.
+	"""
+	pattern = re.compile('.*?'.join(re.escape(c) for c in prefix),
+		re.IGNORECASE | re.UNICODE)
+	return [name for name in names
+		if pattern.search(name) or non_ascii_regex.search(name)]
+
+
+def suggest_names(wf, text, mirror):
+	"""
+	Suggest labels or projects for a name being typed at the end of `text`.
+
+	Names come from the local mirror only. A name that is already typed out
+	in full is not suggested, nor is one the parser could not read back.
+
+	Args:
+		wf (Workflow3): Used to rank the names
+		text (string): The user's input so far
+		mirror (TodoistMirror): Labels and projects to suggest from
+	Returns:
+		list
+
+		Tuples of (name, text with the name completed), best match first.
+	"""
+	match = partial_name_regex.search(text)
+	if not match:
+		return []
+	marker, prefix = match.group('marker', 'prefix')
+	resource = 'labels' if marker == '@' else 'projects'
+	names = [obj['name'] for obj in mirror.tables[resource].itervalues()]
+	if any(name.lower() == prefix.lower() for name in names):
+		return []
+	if prefix:
+		names = candidate_names(prefix, names)
+	completions = {}
+	for name in names:
+		completions[name] = format_name(marker, name)
+	names = [name for name in names if completions[name]]
+	if prefix:
+		names = wf.filter(prefix, names, max_results=MAX_SUGGESTIONS)
+	else:
+		names = sorted(names, key=lambda name: name.lower())[:MAX_SUGGESTIONS]
+	head = text[:match.start('marker')]
+	return [(name, head + completions[name] + ' ') for name in names]
+
+
+def refresh_mirror(wf, mirror):
+	"""
+	Sync a stale mirror in the background, and have Alfred run the script
+	filter again until the sync is done.
+
+	After a failed sync, the next one waits for `TodoistMirror.retry_due`,
+	rather than starting on the next keystroke.
+	"""
+	if (not mirror.fresh and mirror.retry_due() and
+			not is_running(SYNCER_NAME)):
+		run_in_background(SYNCER_NAME,
+			[sys.executable, wf.workflowfile('syncmirror.py')])
+	if is_running(SYNCER_NAME):
+		wf.rerun = 0.5
+
+
+def outbox_warning(wf):
+	"""
+	Tell the user about tasks the flusher has failed to send.
+
+	Returns:
+		tuple, or None
+
+		The title and subtitle of the item to show.
+	"""
+	outbox = Outbox(wf)
+	if not outbox.waiting():
+		return None
+	failure = outbox.failure()
+	if failure is None:
+		return None
+	count = len(outbox.entries())
+	return ('{} task(s) not sent to Todoist yet'.format(count),
+		u'Will retry. Last error: {}'.format(failure['error']))
+
+
+def transform_for_feedback(wf, task):
 	task = {k: v for k, v in task.iteritems()}
 	task['labels'] = ', '.join(task['labels'])
 	if not task['due']:
@@ -40,19 +173,37 @@ def main(wf):
 	wf.logger.info("parsing task: '{}'".format(task_text))
 	task = TaskParser().parse(task_text)
 	todo = task.pop('todo')
-	task = transform_for_feedback(task)
+	task = transform_for_feedback(wf, task)
 	msg = [': '.join([k, str(v)]) for k, v in task.iteritems()]
 	msg = ' | '.join(msg)
 
 	feedback = msg.format(msg, **task)
 	wf.logger.debug('parsed message: ' + feedback)
+
+	# Only read from disk here; this runs on every keystroke.
+	mirror = TodoistMirror(wf, api=None)
+	refresh_mirror(wf, mirror)
+	for name, completed in suggest_names(wf, task_text, mirror):
+		wf.add_item(title=name,
+			subtitle='Complete with ' + name,
+			autocomplete=completed,
+			valid=False)
 	wf.add_item(title='Add task: ' + todo,
 		subtitle=feedback,
 		arg=task_text,
 		valid=True)
+	warning = outbox_warning(wf)
+	if warning:
+		wf.add_item(*warning, valid=False)
+	resume_flush(wf)
 	wf.send_feedback()
 
 
 if __name__ == '__main__':
 	wf = Workflow3(libraries=['./lib'])
+	# This runs on every keystroke. Caching the key for the session saves
+	# spawning `security` each time.
+	wf.password_cache_ttl = PASSWORD_CACHE_TTL
+	wf.cache_max_age = CACHE_MAX_AGE
+	wf.cache_max_bytes = CACHE_MAX_BYTES
 	sys.exit(wf.run(main))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Send the tasks waiting in the outbox to Todoist.
+
+Started in the background by `addtask.py` and `bulkadd.py`, and by `feedback.py` and
+`syncmirror.py` while tasks are waiting. Only one flusher runs at a time;
+tasks journaled while it is running are picked up before it exits.
+
+When more than one task is sent, e.g. after `bulkadd.py`, the number of
+tasks sent and the rate they were sent at are shown as a notification.
+
+If the tasks cannot be sent (no network, a bad api key, an api error), the
+failure is recorded in the outbox and logged, and the first failure in a row
+is shown as a notification. The tasks stay in the journal for the next try.
+"""
+import sys
+import time
+from workflow import Workflow3
+
+from addtask import build_api_payload, payload_from_state
+from mirror import TodoistMirror
+from outbox import Outbox
+
+
+def names_used(tasks):
+	"""
+	Returns:
+		tuple
+
+		The sorted label names and project names used by `tasks`.
+	"""
+	labels = set()
+	projects = set()
+	for task in tasks:
+		labels.update(task['labels'])
+		if task['project']:
+			projects.add(task['project'])
+	return sorted(labels), sorted(projects)
+
+
+def payload_builder(mirror, tasks):
+	"""
+	Make the `build_payload` function `Outbox.flush` needs.
+
+	The names used by `tasks` are resolved up front, with at most one sync.
+	A task journaled later that uses other names has them resolved when its
+	payload is built.
+
+	Args:
+		mirror (TodoistMirror): Labels and projects to resolve names with
+		tasks (list): The tasks waiting in the outbox
+	Returns:
+		callable
+	"""
+	labels, projects = names_used(tasks)
+	if labels or projects:
+		mirror.ensure(labels, projects)
+	known_labels = set(labels)
+	known_projects = set(projects)
+
+	def build_payload(task):
+		if (known_labels.issuperset(task['labels']) and
+				(not task['project'] or task['project'] in known_projects)):
+			return payload_from_state(task, mirror)
+		known_labels.update(task['labels'])
+		known_projects.add(task['project'])
+		return build_api_payload(task, mirror)
+
+	return build_payload
+
+
+def send_outbox(wf, outbox):
+	"""
+	Returns:
+		int
+
+		The number of entries sent.
+	"""
+	import todoist
+
+	api_key = wf.get_password('todoist')
+	api = todoist.TodoistAPI(api_key)
+	mirror = TodoistMirror(wf, api)
+	tasks = [entry['task'] for entry in outbox.entries()]
+	return outbox.flush(api, payload_builder(mirror, tasks))
+
+
+def throughput(sent, seconds):
+	"""
+	Returns:
+		string
+
+		e.g. `Added 30 tasks in 1.20s (25.0 tasks/s)`
+	"""
+	return 'Added {} tasks in {:.2f}s ({:.1f} tasks/s)'.format(
+		sent, seconds, sent / seconds if seconds else 0.0)
+
+
+def main(wf):
+	from workflow.notify import notify
+
+	outbox = Outbox(wf)
+	start = time.time()
+	try:
+		sent = send_outbox(wf, outbox)
+	except Exception as err:
+		failures = outbox.record_failure(err)
+		wf.logger.exception("could not send tasks to todoist ({} failure(s) in a row): {}".format(
+			failures, err))
+		if failures == 1:
+			notify('Tasks not sent to Todoist',
+				u'They will be sent later. {}'.format(err))
+		return
+	outbox.clear_failure()
+	summary = throughput(sent, time.time() - start)
+	wf.logger.info(summary)
+	if sent > 1:
+		notify('Tasks sent to Todoist', summary)
+
+
+if __name__ == '__main__':
+	wf = Workflow3(libraries=['./lib'])
+	sys.exit(wf.run(main))
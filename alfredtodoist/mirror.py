@@ -0,0 +1,166 @@
+"""
+A local copy of the user's Todoist labels and projects.
+
+Resolving label and project names to IDs only needs a small slice of the
+account, so instead of a full `api.sync()` on every task, the mirror keeps
+the labels, projects and the sync token in the workflow's data directory and
+only asks Todoist for what has changed since the last sync.
+"""
+import json
+import time
+
+
+MIRROR_NAME = 'todoist_mirror'
+# How long (in seconds) the mirror is trusted before it is refreshed, even if
+# every name can be resolved from it.
+MAX_AGE = 60 * 60 * 24
+RESOURCE_TYPES = ['labels', 'projects']
+# How long (in seconds) to wait before syncing again after a failed sync. It
+# doubles with each failure in a row, up to `MAX_RETRY_DELAY`.
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 60 * 60
+
+
+class TodoistMirror:
+	"""
+	Labels and projects stored with `Workflow.store_data`.
+
+	The mirror exposes a `state` dict shaped like `TodoistAPI.state`, so it
+	can be used anywhere the api's state is read.
+	"""
+	def __init__(self, wf, api, max_age=MAX_AGE):
+		self.wf = wf
+		self.api = api
+		self.max_age = max_age
+		data = wf.stored_data(MIRROR_NAME) or {}
+		self.sync_token = data.get('sync_token', '*')
+		self.synced_at = data.get('synced_at', 0)
+		# Failed syncs in a row, and the time of the last one
+		self.failures = data.get('failures', 0)
+		self.failed_at = data.get('failed_at', 0)
+		# Copied, as `apply` changes them and `stored_data` may return the
+		# same object again
+		self.tables = {
+			resource: dict(data.get(resource, {})) for resource in RESOURCE_TYPES
+		}
+		self._state = None
+
+	@property
+	def state(self):
+		# Built once per change, so lookups keyed on the state's lists can
+		# tell when the mirror has been updated.
+		if self._state is None:
+			self._state = {
+				resource: self.tables[resource].values()
+				for resource in RESOURCE_TYPES
+			}
+		return self._state
+
+	@property
+	def fresh(self):
+		return time.time() - self.synced_at < self.max_age
+
+	def retry_due(self, now=None):
+		"""
+		Whether enough time has passed since the last failed sync to try
+		again.
+		"""
+		if not self.failures:
+			return True
+		delay = min(RETRY_DELAY * 2 ** (self.failures - 1), MAX_RETRY_DELAY)
+		return (now or time.time()) >= self.failed_at + delay
+
+	def record_failure(self):
+		"""
+		Record a failed sync and save the mirror.
+
+		Returns:
+			int
+
+			The number of failed syncs in a row.
+		"""
+		self.failures += 1
+		self.failed_at = time.time()
+		self.save()
+		return self.failures
+
+	def has_names(self, resource, names):
+		"""
+		Check that every name in `names` is in the mirrored `resource`.
+
+		Args:
+			resource (str): `labels` or `projects`
+			names (list): Names to look for
+		Returns:
+			bool
+		"""
+		# Names are matched case-insensitively when resolved, so they are here
+		# as well.
+		known = {obj['name'].lower() for obj in self.tables[resource].itervalues()}
+		return all(name.lower() in known for name in names)
+
+	def apply(self, response):
+		"""
+		Apply a sync response to the mirror.
+
+		A full sync replaces the tables. Otherwise only the objects in the
+		response are added, updated or removed.
+
+		Args:
+			response (dict): The decoded response of the sync endpoint
+		"""
+		for resource in RESOURCE_TYPES:
+			if response.get('full_sync'):
+				self.tables[resource] = {}
+			table = self.tables[resource]
+			for obj in response.get(resource, []):
+				if obj.get('is_deleted'):
+					table.pop(obj['id'], None)
+				else:
+					table[obj['id']] = {'id': obj['id'], 'name': obj['name']}
+		self.sync_token = response['sync_token']
+		self.synced_at = time.time()
+		self.failures = 0
+		self._state = None
+
+	def sync(self):
+		"""
+		Fetch the labels and projects changed since the last sync and save
+		the updated mirror.
+		"""
+		response = self.api.session.post(self.api.get_api_url() + 'sync', data={
+			'token': self.api.token,
+			'sync_token': self.sync_token,
+			'resource_types': json.dumps(RESOURCE_TYPES),
+		})
+		response.raise_for_status()
+		self.apply(response.json())
+		self.save()
+
+	def save(self):
+		data = {
+			'sync_token': self.sync_token,
+			'synced_at': self.synced_at,
+		}
+		if self.failures:
+			data.update(failures=self.failures, failed_at=self.failed_at)
+		data.update(self.tables)
+		self.wf.store_data(MIRROR_NAME, data)
+
+	def ensure(self, label_names, project_names):
+		"""
+		Make sure the mirror can resolve the given names.
+
+		Nothing is sent to Todoist if the mirror is fresh and already knows
+		every name. Otherwise a delta sync is made.
+
+		Args:
+			label_names (list): Label names to resolve
+			project_names (list): Project names to resolve
+		"""
+		if (self.fresh and self.has_names('labels', label_names) and
+				self.has_names('projects', project_names)):
+			return
+		self.wf.logger.debug('syncing mirror from token: {}'.format(
+			self.sync_token))
+		self.sync()
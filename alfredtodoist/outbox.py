@@ -0,0 +1,358 @@
+"""
+A local journal of tasks waiting to be sent to Todoist.
+
+`addtask.py` appends the parsed task to the journal and returns straight
+away. `flushoutbox.py`, started in the background, sends the journal to
+Todoist in batches and removes whatever Todoist has accepted.
+
+Every command is given its uuid (and temp id) when the task is journaled.
+Todoist only applies a command uuid once, so a batch that is sent again
+after a dropped connection does not create duplicate tasks.
+
+When a flush fails, the failure is recorded next to the journal. `feedback.py`
+and `syncmirror.py` start the flusher again while entries are waiting, backing
+off after each failure in a row.
+"""
+import json
+import os
+import sys
+import time
+import uuid
+
+from workflow.util import LockFile, atomic_writer
+
+
+OUTBOX_FILENAME = 'outbox.jsonl'
+FAILURE_FILENAME = 'outbox-failure.json'
+FLUSHER_NAME = 'flush_outbox'
+# The sync api accepts at most 100 commands per request.
+MAX_COMMANDS = 100
+# Seconds to wait before flushing again after a failed flush. The wait
+# doubles with each failure in a row, up to `MAX_RETRY_DELAY`.
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 60 * 60
+
+
+class SyncError(Exception):
+	"""
+	Todoist refused a whole sync request, e.g. for a bad api key.
+
+	The api returns these errors rather than raising them.
+	"""
+
+
+def new_uuid():
+	return str(uuid.uuid4())
+
+
+def new_entry(task):
+	"""
+	Wrap a parsed task in a journal entry, with the uuids and temp ids of its
+	commands fixed up front.
+
+	Args:
+		task (dict): The output of `TaskParser.parse`
+	Returns:
+		dict
+	"""
+	return {
+		'id': new_uuid(),
+		'task': task,
+		'item': {'temp_id': new_uuid(), 'uuid': new_uuid()},
+		'notes': [
+			{'temp_id': new_uuid(), 'uuid': new_uuid()} for _ in task['notes']
+		],
+	}
+
+
+def entry_commands(entry, project_id, properties):
+	"""
+	Build the sync commands that add the entry's task and its notes.
+
+	Args:
+		entry (dict): Journal entry, as made by `new_entry`
+		project_id (int): Project to add the task to
+		properties (dict): Any other item properties (labels, priority, ...)
+	Returns:
+		list
+	"""
+	args = dict(properties, content=entry['task']['todo'], project_id=project_id)
+	commands = [{
+		'type': 'item_add',
+		'temp_id': entry['item']['temp_id'],
+		'uuid': entry['item']['uuid'],
+		'args': args,
+	}]
+	for note, ids in zip(entry['task']['notes'], entry['notes']):
+		commands.append({
+			'type': 'note_add',
+			'temp_id': ids['temp_id'],
+			'uuid': ids['uuid'],
+			'args': {'item_id': entry['item']['temp_id'], 'content': note},
+		})
+	return commands
+
+
+def send_commands(api, commands, limit=MAX_COMMANDS):
+	"""
+	Send sync commands in as few requests as the command limit allows.
+
+	A note can end up in a later request than the item it belongs to. Temp
+	ids Todoist has already mapped to real ids are swapped in before each
+	request is sent.
+
+	Args:
+		api (todoist.TodoistAPI): API to send the commands through
+		commands (list): Sync commands, in the order they must be applied
+		limit (int): Maximum number of commands per request
+	Returns:
+		dict
+
+		The combined `sync_status` of every request, keyed by command uuid.
+	Raises:
+		SyncError: If a response has an `error` or no `sync_status`. The
+			requests before it have been applied.
+	"""
+	status = {}
+	temp_ids = {}
+	for start in range(0, len(commands), limit):
+		chunk = commands[start:start + limit]
+		for command in chunk:
+			item_id = command['args'].get('item_id')
+			if item_id in temp_ids:
+				command['args']['item_id'] = temp_ids[item_id]
+		api.queue.extend(chunk)
+		response = api.commit(raise_on_error=False) or {}
+		if 'error' in response or 'sync_status' not in response:
+			raise SyncError(response.get('error', 'no sync status in the response'))
+		status.update(response['sync_status'])
+		temp_ids.update(response.get('temp_id_mapping', {}))
+	return status
+
+
+def start_flusher(wf):
+	"""
+	Send the outbox to Todoist from a background process.
+	"""
+	from workflow.background import run_in_background
+
+	cmd = [sys.executable, wf.workflowfile('flushoutbox.py')]
+	run_in_background(FLUSHER_NAME, cmd)
+
+
+def resume_flush(wf):
+	"""
+	Start the flusher if entries are waiting and a retry is due.
+
+	Cheap enough to call on every keystroke while nothing is waiting: it only
+	checks that the journal does not exist.
+	"""
+	outbox = Outbox(wf)
+	if outbox.waiting() and outbox.retry_due():
+		start_flusher(wf)
+
+
+class Outbox:
+	"""
+	Append-only journal of entries, one JSON document per line, in the
+	workflow's data directory.
+	"""
+	def __init__(self, wf, filename=OUTBOX_FILENAME):
+		self.wf = wf
+		self.path = wf.datafile(filename)
+		self.failure_path = wf.datafile(FAILURE_FILENAME)
+
+	def waiting(self):
+		"""Whether any entries are waiting to be sent."""
+		return os.path.exists(self.path)
+
+	def failure(self):
+		"""
+		The last failed flush, if the flushes since have failed too.
+
+		Returns:
+			dict, or None
+
+			{
+				'failures': int, number of failed flushes in a row,
+				'failed_at': float, time of the last one,
+				'error': unicode, its error message
+			}
+		"""
+		try:
+			with open(self.failure_path, 'rb') as fp:
+				return json.load(fp)
+		except (IOError, ValueError):
+			return None
+
+	def record_failure(self, error):
+		"""
+		Record a failed flush.
+
+		Returns:
+			int
+
+			The number of failed flushes in a row.
+		"""
+		failure = self.failure() or {'failures': 0}
+		failure = {
+			'failures': failure['failures'] + 1,
+			'failed_at': time.time(),
+			'error': unicode(error),
+		}
+		with atomic_writer(self.failure_path, 'wb') as fp:
+			json.dump(failure, fp)
+		return failure['failures']
+
+	def clear_failure(self):
+		if os.path.exists(self.failure_path):
+			os.unlink(self.failure_path)
+
+	def retry_due(self, now=None):
+		"""
+		Whether enough time has passed since the last failed flush to try
+		again.
+		"""
+		failure = self.failure()
+		if failure is None:
+			return True
+		delay = min(RETRY_DELAY * 2 ** (failure['failures'] - 1),
+			MAX_RETRY_DELAY)
+		return (now or time.time()) >= failure['failed_at'] + delay
+
+	def append(self, task):
+		"""
+		Journal a parsed task.
+
+		The line is flushed and synced to disk before returning, so the task
+		survives the process being killed straight after.
+
+		Args:
+			task (dict): The output of `TaskParser.parse`
+		Returns:
+			dict
+
+			The new journal entry.
+		"""
+		return self.extend([task])[0]
+
+	def extend(self, tasks):
+		"""
+		Journal several parsed tasks with a single write, as `append` does.
+
+		Args:
+			tasks (list): Outputs of `TaskParser.parse`
+		Returns:
+			list
+
+			The new journal entries.
+		"""
+		entries = [new_entry(task) for task in tasks]
+		with LockFile(self.path):
+			with open(self.path, 'ab') as fp:
+				fp.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+				fp.flush()
+				os.fsync(fp.fileno())
+		return entries
+
+	def entries(self):
+		"""
+		Read every journaled entry, oldest first.
+
+		A line that cannot be decoded (e.g. cut short by a crash mid-append)
+		is skipped.
+		"""
+		if not os.path.exists(self.path):
+			return []
+		entries = []
+		with open(self.path, 'rb') as fp:
+			for line in fp:
+				try:
+					entries.append(json.loads(line))
+				except ValueError:
+					self.wf.logger.warning(
+						'skipping unreadable outbox line: {}'.format(repr(line)))
+		return entries
+
+	def remove(self, entry_ids):
+		"""
+		Drop the given entries from the journal.
+
+		The journal is re-read under the lock, so entries appended since the
+		last `entries` call are kept.
+		"""
+		entry_ids = set(entry_ids)
+		with LockFile(self.path):
+			remaining = [e for e in self.entries() if e['id'] not in entry_ids]
+			if not remaining:
+				os.unlink(self.path)
+				return
+			with atomic_writer(self.path, 'wb') as fp:
+				for entry in remaining:
+					fp.write(json.dumps(entry) + '\n')
+
+	def next_batch(self, limit=MAX_COMMANDS):
+		"""
+		The oldest entries whose commands fit in one request.
+
+		An entry with more commands than `limit` is returned on its own, and
+		is sent over several requests.
+		"""
+		batch = []
+		size = 0
+		for entry in self.entries():
+			entry_size = 1 + len(entry['notes'])
+			if batch and size + entry_size > limit:
+				break
+			batch.append(entry)
+			size += entry_size
+		return batch
+
+	def flush(self, api, build_payload, limit=MAX_COMMANDS):
+		"""
+		Send the journal to Todoist, one batch per request, until it is empty.
+
+		Entries are removed once Todoist has answered for all of their
+		commands. Commands Todoist rejects are logged and dropped, as sending
+		them again would fail the same way. If a request fails, the exception
+		is raised and the remaining entries stay in the journal.
+
+		Args:
+			api (todoist.TodoistAPI): API to send the commands through
+			build_payload (callable): Called with a parsed task, returns the
+				item properties, including `project`, as
+				`addtask.build_api_payload` does.
+			limit (int): Maximum number of commands per request
+		Returns:
+			int
+
+			The number of entries sent.
+		"""
+		sent = 0
+		while True:
+			batch = self.next_batch(limit)
+			if not batch:
+				return sent
+			commands = []
+			for entry in batch:
+				properties = build_payload(entry['task'])
+				project_id = properties.pop('project')
+				commands.extend(entry_commands(entry, project_id, properties))
+			status = send_commands(api, commands, limit)
+
+			done = []
+			for entry in batch:
+				uuids = [entry['item']['uuid']] + [n['uuid'] for n in entry['notes']]
+				if not all(command_uuid in status for command_uuid in uuids):
+					continue
+				for command_uuid in uuids:
+					if status[command_uuid] != 'ok':
+						self.wf.logger.error('todoist rejected {}: {}'.format(
+							command_uuid, status[command_uuid]))
+				done.append(entry['id'])
+			if not done:
+				# Nothing was accepted or rejected; try again on the next run
+				# rather than resending the same batch in a loop.
+				return sent
+			self.remove(done)
+			sent += len(done)
@@ -8,56 +8,133 @@ class TaskParser:
 	"""
 	For parsing a string of todo text into its various parts.
 	"""
-	label_regex = r'(?<=@)\w+'
-	priority_regex = r'(?P<prefix>!!|p)(?P<priority>[1234])'
-	project_regex = r'''#([`{\("'](?P<project_space>[\w ]+)[`}\)"']|(?P<project>[-\w]+))'''
-
-	def _pop_labels(self, text):
-		labels = [g for g in re.findall(self.label_regex, text)]
-		for label in labels:
-			text = text.replace('@' + label, '')
-		return labels, text
-
-	def _pop_priority(self, text):
-		priority = re.search(self.priority_regex, text)
-		if priority:
-			priority_number = priority.group('priority')
-			replacement = priority.group('prefix') + priority_number
-			text = text.replace(replacement, '')
-		else:
-			priority_number = ''
-		return priority_number, text
+	# Every alternative starts with a literal character, which lets the regex
+	# engine skip straight to the next possible token. The group that matched
+	# last names the token; `token_kinds` maps it to the kind of token.
+	token_regex = re.compile(r'''
+		@(?P<label>\w+)
+		|!!(?P<priority>[1234])
+		|p(?P<p_priority>[1234])
+		|\#(?:[`{\("'](?P<project_space>[\w\ ]+)[`}\)"']|(?P<project>[-\w]+))
+		|due:(?P<due>)
+		|note:(?P<note>)
+		''', re.VERBOSE | re.UNICODE)
+	token_kinds = {
+		'label': 'label',
+		'priority': 'priority',
+		'p_priority': 'priority',
+		'project_space': 'project',
+		'project': 'project',
+		'due': 'due',
+		'note': 'note',
+	}
+
+	def tokenize(self, text):
+		"""
+		Split the todo text into tokens with a single scan.
+
+		Labels, priority and project are cut out of the text wherever they
+		appear. `due:` and `note:` only act as markers; their values are
+		whatever is left between one marker and the next.
+
+		The todo is what is left of the text between the other tokens, so it
+		has no single span and is not one of the tokens; see `parse`.
 
-	def _pop_project(self, text):
-		project = re.search(self.project_regex, text)
-		if project:
-			for groupname in ['project_space', 'project']:
-				if project.group(groupname):
-					project_name = project.group(groupname)
+		Args:
+			text (string): The text to tokenize
+		Returns:
+			list
 
-			text = re.sub(self.project_regex, '', text)
+			Tuples of (kind, value, start, end), where kind is one of `label`,
+			`priority`, `project`, `due` or `note`, and `start`/`end` is the
+			span of the token within `text`.
+		"""
+		return self._scan(text)[0]
+
+	def _scan(self, text):
+		"""
+		Returns:
+			tuple
+
+			The tokens, as returned by `tokenize`, and the todo.
+		"""
+		tokens = []
+		# Text left over once labels, priority and project are cut out, and
+		# the `due:`/`note:` markers found in it, as
+		# (kind, start, end, offset into the leftover text).
+		leftover = []
+		leftover_len = 0
+		markers = []
+		priority = None
+		project = None
+		last = 0
+		token_kinds = self.token_kinds
+		for match in self.token_regex.finditer(text):
+			kind = token_kinds[match.lastgroup]
+			start, end = match.span()
+			if kind == 'label':
+				tokens.append((kind, match.group(match.lastindex), start, end))
+			elif kind == 'priority':
+				# Only the first priority counts, but every copy of it is
+				# removed from the text.
+				if priority is None:
+					priority = match.group()
+					tokens.append(
+						(kind, match.group(match.lastindex), start, end))
+				elif match.group() != priority:
+					continue
+			elif kind == 'project':
+				if project is None:
+					project = match.group(match.lastindex)
+					tokens.append((kind, project, start, end))
+			else:
+				markers.append((kind, start, end, leftover_len + start - last))
+				continue
+			leftover.append(text[last:start])
+			leftover_len += start - last
+			last = end
+
+		if last:
+			leftover.append(text[last:])
+			leftover = ''.join(leftover)
 		else:
-			project_name = ''
-		return project_name, text
-
-	def _pop_due_date(self, text):
-		if 'due:' not in text:
-			return '', text
-		# if `note:` follows `due:`, get all of the text up until then. If
-		# there is no note, this just gets the entire string after `due:`.
-		due_text = text.split('due:')[1]
-		due_text = due_text.split('note:')[0]
-		return due_text.strip(), text.replace('due:' + due_text, '')
-
-	def _pop_notes(self, text):
-		if 'note:' not in text:
-			return [], text
-		note_fragments = text.split('note:')
-		notes = []
-		for fragment in note_fragments[1:]:
-			notes.append(fragment.strip())
-			text = note_fragments[0].strip()
-		return notes, text
+			leftover = text
+		leftover_len = len(leftover)
+		if not markers:
+			return tokens, leftover.strip()
+
+		# `due` runs from the first `due:` up to the next marker. It is
+		# removed before the notes are split out, so any other `due:` is
+		# treated as plain text.
+		due_from = due_to = leftover_len
+		for i, (kind, start, end, offset) in enumerate(markers):
+			if kind != 'due':
+				continue
+			if i + 1 < len(markers):
+				next_start, due_to = markers[i + 1][1], markers[i + 1][3]
+			else:
+				next_start, due_to = len(text), leftover_len
+			due_from = offset
+			tokens.append((kind,
+				leftover[offset + 4:due_to].strip(), end, next_start))
+			break
+
+		def without_due(begin, finish):
+			if finish <= due_from or begin >= due_to:
+				return leftover[begin:finish].strip()
+			return (leftover[begin:due_from] + leftover[due_to:finish]).strip()
+
+		notes = [marker for marker in markers if marker[0] == 'note']
+		for i, (kind, start, end, offset) in enumerate(notes):
+			if i + 1 < len(notes):
+				next_start, next_offset = notes[i + 1][1], notes[i + 1][3]
+			else:
+				next_start, next_offset = len(text), leftover_len
+			tokens.append((kind,
+				without_due(offset + 5, next_offset), end, next_start))
+
+		todo_offset = notes[0][3] if notes else leftover_len
+		return tokens, without_due(0, todo_offset)
 
 	def parse(self, text):
 		"""
@@ -80,6 +157,22 @@ class TaskParser:
 			* #"grocery shopping"
 			* #'grocery shopping'
 
+		The text is read left to right, each token once. The multi-pass
+		parser this replaced cut out each kind of token from the whole text in
+		turn, with `str.replace`, which gave different results in a few
+		cases:
+			* A label that starts another one (`@ab @abc`) no longer leaves the
+			  rest of the longer one (`c`) in the todo.
+			* A priority inside a project name is part of the name: `#p1x` is
+			  project `p1x` with no priority, and `#xp1 !!2` is project `xp1`
+			  with priority `2`. Both used to be project `x`, priority `1`.
+			* A second `due:` straight after the first (`due: due: buy`) is
+			  kept in the todo (`due: buy`) rather than both being removed
+			  (`buy`).
+			* Letters outside ASCII, such as accented ones, are part of a
+			  label or project name. A name used to end at the first one,
+			  and the rest of it was left in the todo.
+
 		Example:
 			TaskParser.parse('get milk !!3 #{grocery shopping} @errands @grocery_store due: tomorrow note: get whole milk note: check the expiration date')
 			{
@@ -105,29 +198,30 @@ class TaskParser:
 				'todo': str
 			}
 		"""
-		# Parse the todo in order from more rigidly defined specs to more
-		# free-flowing text. `TaskParser` does rely somewhat on the order of
-		# parsing. By popping things like labels and priority out of the text,
-		# it makes it easier to deal with things like due dates and notes.
+		# The text is scanned once, cutting out the rigidly defined properties
+		# (labels, priority, project) wherever they appear. What is left is
+		# split on the `due:` and `note:` markers found during the same scan.
 		#
-		# Notes is a special case, in that it relies on `due` to be parsed
-		# first. This could be updated, to check for `due`, but by keeping the
-		# order of `due` being parsed first, the notes parsing is simpler, but
-		# just as effective.
+		# Notes is a special case, in that it relies on `due` to be removed
+		# first. Any text after a `note:` marker, up to the next `note:`, is
+		# part of that note once the due date has been taken out.
 		#
 		# The actual todo is considered any text left over after all of the
 		# other properties have been parsed out.
-		labels, text = self._pop_labels(text)
-		priority, text = self._pop_priority(text)
-		project, text = self._pop_project(text)
-		due, text = self._pop_due_date(text)
-		notes, text = self._pop_notes(text)
-
-		return {
-			'labels': labels,
-			'priority': priority,
-			'project': project,
-			'due': due,
-			'notes': notes,
-			'todo': text.strip()
+		tokens, todo = self._scan(text)
+		task = {
+			'labels': [],
+			'priority': '',
+			'project': '',
+			'due': '',
+			'notes': [],
+			'todo': todo
 		}
+		for kind, value, _, _ in tokens:
+			if kind == 'label':
+				task['labels'].append(value)
+			elif kind == 'note':
+				task['notes'].append(value)
+			else:
+				task[kind] = value
+		return task
@@ -5,9 +5,15 @@ Save the user's Todoist api key in the keychain.
 import sys
 from workflow import Workflow3
 
+from mirror import MIRROR_NAME
+
 
 def main(wf):
 	wf.save_password('todoist', wf.args[0])
+	# The mirrored labels and projects belong to the previous key's account.
+	wf.store_data(MIRROR_NAME, None)
+	# Drop any key cached by running sessions.
+	wf.clear_session_cache(current=True)
 
 
 if __name__ == '__main__':
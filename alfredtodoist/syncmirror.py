@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Bring the local mirror of labels and projects up to date.
+
+Started in the background by `feedback.py` when the mirror it suggests names
+from is stale. Once the mirror is synced, tasks still waiting in the outbox
+are sent too. A failed sync is recorded in the mirror, and `feedback.py`
+backs off before starting another one.
+"""
+import sys
+from workflow import Workflow3
+
+from mirror import TodoistMirror
+from outbox import resume_flush
+
+
+def main(wf):
+	import todoist
+
+	api_key = wf.get_password('todoist')
+	mirror = TodoistMirror(wf, todoist.TodoistAPI(api_key))
+	try:
+		mirror.sync()
+	except Exception as err:
+		failures = mirror.record_failure()
+		wf.logger.exception("could not sync the mirror ({} failure(s) in a row): {}".format(
+			failures, err))
+		return
+	wf.logger.info("mirror synced to token: {}".format(mirror.sync_token))
+	resume_flush(wf)
+
+
+if __name__ == '__main__':
+	wf = Workflow3(libraries=['./lib'])
+	sys.exit(wf.run(main))
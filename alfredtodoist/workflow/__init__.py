@@ -13,7 +13,7 @@
 import os
 
 # Workflow objects
-from .workflow import Workflow, manager
+from .workflow import FilterIndex, Workflow, data_memo, manager
 from .workflow3 import Variables, Workflow3
 
 # Exceptions
@@ -67,9 +67,11 @@ __licence__ = 'MIT'
 __copyright__ = 'Copyright 2014-2017 Dean Jackson'
 
 __all__ = [
+    'FilterIndex',
     'Variables',
     'Workflow',
     'Workflow3',
+    'data_memo',
     'manager',
     'PasswordNotFound',
     'KeychainError',
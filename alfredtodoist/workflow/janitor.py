@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""
+Keep the workflow's cache directory within a size and entry budget.
+
+Nothing removes session files, stale caches, ``.argcache`` or ``.pid``
+files from the cache directory until the user runs ``workflow:delcache``.
+When any of :attr:`Workflow.cache_max_bytes`,
+:attr:`~Workflow.cache_max_entries` or :attr:`~Workflow.cache_max_age` is
+set, :class:`~workflow.Workflow` starts this module in the background
+(at most once every :attr:`~Workflow.cache_janitor_interval` seconds) to
+remove the least recently used files until the cache fits.
+
+A workflow run doesn't scan the cache directory. It appends the names of
+the cache files it read to an access log with :func:`record_access`,
+leaving out those modified within the interval, as their modification
+time is recent enough. The janitor merges the log into a small index of
+access times, then scans the directory once to find the files to remove.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import errno
+import marshal
+import os
+import stat
+import sys
+import time
+
+from util import atomic_writer
+
+__all__ = ['last_run', 'record_access', 'tidy']
+
+#: Name of the index of access times in the cache directory
+INDEX_NAME = '__workflow_cache_index'
+#: Name of the access log the workflow appends to
+ACCESS_LOG_NAME = '__workflow_cache_access'
+#: Files used in the last ``GRACE`` seconds are never removed
+GRACE = 60
+#: Files that are in use for as long as they exist, or are kept within
+#: bounds by other means
+KEEP_SUFFIXES = ('.lock', '.log', '.log.1', '.sock', '.sqlite',
+                 '.sqlite-shm', '.sqlite-wal')
+
+
+def record_access(cachedir, accesses):
+    """Append the times cache files were used to the access log.
+
+    Each line is written with a single ``write()`` to a file opened in
+    append mode, so processes appending at the same time don't mix
+    their lines.
+
+    :param cachedir: the workflow's cache directory
+    :type cachedir: ``unicode``
+    :param accesses: names of files in ``cachedir`` and the times they
+        were used
+    :type accesses: ``dict``
+
+    """
+    if not accesses:
+        return
+    lines = ''.join(['{0:.3f}\t{1}\n'.format(t, name)
+                     for name, t in accesses.items()])
+    with open(os.path.join(cachedir, ACCESS_LOG_NAME), 'ab') as fp:
+        fp.write(lines.encode('utf-8'))
+
+
+def last_run(cachedir):
+    """Time the janitor last ran in ``cachedir``, or ``None``.
+
+    This is the modification time of the index, which the janitor
+    rewrites every time it runs.
+
+    """
+    try:
+        return os.stat(os.path.join(cachedir, INDEX_NAME)).st_mtime
+    except OSError:
+        return None
+
+
+def _read_index(cachedir):
+    """Load the index and merge the access log into it."""
+    try:
+        with open(os.path.join(cachedir, INDEX_NAME), 'rb') as fp:
+            index = marshal.load(fp)
+    except (IOError, EOFError, ValueError, TypeError):
+        index = {}
+
+    # Processes append to a new log while this one is read
+    log_path = os.path.join(cachedir, ACCESS_LOG_NAME)
+    reading = log_path + '.reading'
+    try:
+        os.rename(log_path, reading)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return index
+
+    with open(reading, 'rb') as fp:
+        for line in fp:
+            try:
+                t, name = line.decode('utf-8').rstrip('\n').split('\t', 1)
+                t = float(t)
+            except ValueError:  # line cut short
+                continue
+            if t > index.get(name, 0):
+                index[name] = t
+    os.unlink(reading)
+    return index
+
+
+def _pid_alive(path):
+    """Whether the process in PID file ``path`` is running."""
+    try:
+        with open(path, 'rb') as fp:
+            pid = int(fp.read().strip())
+        os.kill(pid, 0)
+    except (IOError, ValueError):
+        return False
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
+
+
+def _protected(name):
+    return (name.startswith((INDEX_NAME, ACCESS_LOG_NAME)) or
+            name.endswith(KEEP_SUFFIXES))
+
+
+def tidy(cachedir, max_bytes=None, max_entries=None, max_age=None,
+         now=None):
+    """Remove files from ``cachedir`` until it is within budget.
+
+    A file was last used at the later of its modification time and the
+    last time it was recorded by :func:`record_access`. Files unused for
+    more than ``max_age`` seconds and ``.pid`` files of processes that
+    have exited are removed first. Then the least recently used files
+    are removed until there are no more than ``max_entries`` of them,
+    taking up no more than ``max_bytes``. Files used in the last
+    :const:`GRACE` seconds, log, lock and SQLite files are kept.
+
+    :param cachedir: the workflow's cache directory
+    :type cachedir: ``unicode``
+    :param max_bytes: total size of the files, or ``None`` for no limit
+    :type max_bytes: ``int``
+    :param max_entries: number of files, or ``None`` for no limit
+    :type max_entries: ``int``
+    :param max_age: seconds since a file was last used, or ``None`` for
+        no limit
+    :type max_age: ``int``
+    :returns: names of the removed files
+    :rtype: ``list``
+
+    """
+    now = now or time.time()
+    index = _read_index(cachedir)
+
+    files = []  # (last used, name, size)
+    removed = []
+    for name in os.listdir(cachedir):
+        if _protected(name):
+            continue
+        path = os.path.join(cachedir, name)
+        try:
+            st = os.lstat(path)
+        except OSError:  # removed in the meantime
+            continue
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        used = max(index.get(name, 0), st.st_mtime)
+        if now - used < GRACE:
+            pass
+        elif name.endswith('.pid'):
+            if not _pid_alive(path):
+                removed.append(name)
+            continue
+        elif max_age is not None and now - used > max_age:
+            removed.append(name)
+            continue
+        files.append((used, name, st.st_size))
+
+    files.sort(reverse=True)  # least recently used last
+    total = sum(size for _, _, size in files)
+    while files and ((max_entries is not None and len(files) > max_entries) or
+                     (max_bytes is not None and total > max_bytes)):
+        used, name, size = files[-1]
+        if now - used < GRACE:
+            break
+        files.pop()
+        total -= size
+        removed.append(name)
+
+    for name in removed:
+        try:
+            os.unlink(os.path.join(cachedir, name))
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+
+    kept = {name: used for used, name, _ in files}
+    with atomic_writer(os.path.join(cachedir, INDEX_NAME), 'wb') as fp:
+        marshal.dump(kept, fp, 2)
+
+    return removed
+
+
+def _limit(value):
+    return None if value == '-' else int(value)
+
+
+if __name__ == '__main__':  # pragma: nocover
+    if len(sys.argv) != 5:
+        print('Usage : janitor.py <cachedir> <max_bytes> <max_entries> '
+              '<max_age>\n\nUse - for no limit.')
+        sys.exit(1)
+
+    tidy(sys.argv[1].decode('utf-8'), *[_limit(v) for v in sys.argv[2:]])
@@ -22,21 +22,30 @@ up your Python script to best utilise the :class:`Workflow` object.
 from __future__ import print_function, unicode_literals
 
 import binascii
+from collections import Mapping, namedtuple, OrderedDict
 import cPickle
+from cStringIO import StringIO
 from copy import deepcopy
+import errno
+import heapq
 import json
 import logging
 import logging.handlers
+import marshal
+import mmap
 import os
 import pickle
 import plistlib
 import re
 import shutil
+import stat
 import string
+import struct
 import subprocess
 import sys
 import time
 import unicodedata
+import zlib
 
 try:
     import xml.etree.cElementTree as ET
@@ -99,6 +108,10 @@ ICON_WEB = os.path.join(ICON_ROOT, 'BookmarkIcon.icns')
 # Used by `fold_to_ascii` method
 ####################################################################
 
+#: Number of folded strings :func:`fold_to_ascii` is sure to remember.
+#: Up to twice as many are kept.
+FOLD_CACHE_SIZE = 10000
+
 ASCII_REPLACEMENTS = {
     'À': 'A',
     'Á': 'A',
@@ -435,6 +448,57 @@ MATCH_ALLCHARS = 64
 #: Combination of all other ``MATCH_*`` constants
 MATCH_ALL = 127
 
+# Scoring of :const:`MATCH_ALLCHARS` matches by `fuzzy_score`
+#: Points for each matched character
+FUZZY_SCORE_MATCH = 16
+#: Penalty for the first skipped character between two matches
+FUZZY_PENALTY_GAP_START = 3
+#: Penalty for every further skipped character
+FUZZY_PENALTY_GAP_EXTENSION = 1
+#: Bonus for matching the first character of a word
+FUZZY_BONUS_BOUNDARY = 8
+#: Bonus for matching the upper-case letter in a camelCase transition
+FUZZY_BONUS_CAMEL = 7
+#: Bonus for matching straight after the previous match
+FUZZY_BONUS_CONSECUTIVE = 4
+#: Highest score of a :const:`MATCH_ALLCHARS` match
+FUZZY_MAX_SCORE = 50.0
+
+#: Fewest items :meth:`Workflow.filter` scores in worker processes.
+#: Below this, forking the workers takes longer than scoring the items.
+PARALLEL_MIN_ITEMS = 10000
+
+
+####################################################################
+# Used by `DataMemo`
+####################################################################
+
+# Most data files kept in memory
+MEMO_MAX_ENTRIES = 64
+# Most bytes of data files kept in memory
+MEMO_MAX_BYTES = 8 * 1024 * 1024
+
+
+####################################################################
+# Used by `Workflow.cached_data`
+####################################################################
+
+# How long (in seconds) to wait for another process to regenerate
+# a stale cache before using the stale data
+CACHE_LOCK_WAIT = 3.0
+
+# How often (in seconds) the cache janitor runs, if a cache budget is set
+JANITOR_INTERVAL = 3600
+
+
+####################################################################
+# Used by `SQLiteStore`
+####################################################################
+
+# How long (in seconds) to wait for another process to finish writing
+# to the database
+SQLITE_TIMEOUT = 5.0
+
 
 ####################################################################
 # Used by `Workflow.check_update`
@@ -482,6 +546,9 @@ class PasswordExists(KeychainError):
 # Helper functions
 ####################################################################
 
+_non_ascii = re.compile(r'[^\x00-\x7f]').search
+
+
 def isascii(text):
     """Test if ``text`` contains only ASCII characters.
 
@@ -491,11 +558,154 @@ def isascii(text):
     :rtype: ``Boolean``
 
     """
+    # Much quicker than encoding `text` and catching the error
+    return _non_ascii(text) is None
+
+
+class _FoldTable(dict):
+    """:meth:`unicode.translate` table of ASCII replacements.
+
+    The replacement for each character is worked out the first time the
+    character is looked up: from :const:`ASCII_REPLACEMENTS` if it's
+    there, otherwise by dropping whatever isn't ASCII from its NFKD
+    decomposition.
+
+    """
+
+    def __missing__(self, code):
+        char = unichr(code)
+        char = ASCII_REPLACEMENTS.get(char, char)
+        folded = self[code] = unicode(
+            unicodedata.normalize('NFKD', char).encode('ascii', 'ignore'))
+        return folded
+
+
+_fold_table = _FoldTable()
+
+# Recently folded strings. New ones go in `_folded`; when it is full, it
+# replaces `_folded_before`, and strings looked up from there are moved
+# back into `_folded`. Strings not used since the last swap are dropped.
+_folded = {}
+_folded_before = {}
+
+
+def fold_to_ascii(text):
+    """Convert non-ASCII characters to closest ASCII equivalent.
+
+    See :meth:`Workflow.fold_to_ascii`.
+
+    The last :const:`FOLD_CACHE_SIZE` or so strings folded are
+    remembered, so folding the same search keys again for every query is
+    only a dictionary lookup.
+
+    :param text: text to convert
+    :type text: ``unicode``
+    :returns: text containing only ASCII characters
+    :rtype: ``unicode``
+
+    """
+    global _folded, _folded_before
+
     try:
-        text.encode('ascii')
-    except UnicodeEncodeError:
-        return False
-    return True
+        return _folded[text]
+    except KeyError:
+        pass
+
+    folded = _folded_before.get(text)
+    if folded is None:
+        if isascii(text):
+            folded = text
+        else:
+            folded = text.translate(_fold_table)
+
+    if len(_folded) >= FOLD_CACHE_SIZE:
+        _folded_before, _folded = _folded, {}
+    _folded[text] = folded
+    return folded
+
+
+def fuzzy_score(value, lower, query):
+    """Score how well the characters of ``query`` match ``value`` in order.
+
+    The shortest stretch of ``value`` that ends at the earliest possible
+    place and contains ``query`` as a subsequence is found with one
+    forward and one backward scan. Each matched character then scores
+    :const:`FUZZY_SCORE_MATCH`, plus bonuses for starting a word, a
+    camelCase hump or following on from the previous match, minus
+    penalties for the characters skipped in between. The cost is linear
+    in the length of ``value``, unlike a ``.*?``-style regex, which can
+    backtrack heavily when the match fails.
+
+    :param value: search key
+    :type value: ``unicode``
+    :param lower: ``value.lower()``
+    :type lower: ``unicode``
+    :param query: lowercase query
+    :type query: ``unicode``
+    :returns: score between 0 (no match) and :const:`FUZZY_MAX_SCORE`
+    :rtype: ``float``
+
+    """
+    # Forward: where the earliest subsequence match ends
+    end = 0
+    for c in query:
+        end = lower.find(c, end) + 1
+        if not end:
+            return 0
+    # Backward: the latest positions of each character before `end`
+    positions = []
+    start = end
+    for c in reversed(query):
+        start = lower.rfind(c, 0, start)
+        positions.append(start)
+    positions.reverse()
+
+    if len(lower) != len(value):  # case change altered the length
+        value = lower
+
+    score = 0
+    previous = None
+    for p in positions:
+        score += FUZZY_SCORE_MATCH
+        if p == 0 or not value[p - 1].isalnum():
+            bonus = FUZZY_BONUS_BOUNDARY
+        elif value[p - 1].islower() and value[p].isupper():
+            bonus = FUZZY_BONUS_CAMEL
+        else:
+            bonus = 0
+        if previous is None:
+            # A match on the first character counts double
+            bonus *= 2
+        elif p == previous + 1:
+            bonus = max(bonus, FUZZY_BONUS_CONSECUTIVE)
+        else:
+            gap = p - previous - 1
+            score -= (FUZZY_PENALTY_GAP_START +
+                      FUZZY_PENALTY_GAP_EXTENSION * (gap - 1))
+        score += bonus
+        previous = p
+
+    best = ((FUZZY_SCORE_MATCH + FUZZY_BONUS_BOUNDARY) * len(query) +
+            FUZZY_BONUS_BOUNDARY)
+    return FUZZY_MAX_SCORE * max(score, 1) / best
+
+
+def search_features(value):
+    """Precompute what :meth:`Workflow.filter` matches a query against.
+
+    :param value: search key of an item
+    :type value: ``unicode``
+    :returns: ``(value, lowercase value, set of lowercase characters,
+        lowercase capitals, atoms, initials of atoms)``
+    :rtype: ``tuple``
+
+    """
+    lower = value.lower()
+    capitals = ''.join([c for c in value if c in INITIALS]).lower()
+    atoms = [s.lower() for s in split_on_delimiters(value)]
+    initials = ''.join([s[0] for s in atoms if s])
+    return (value, lower, frozenset(lower), capitals, frozenset(atoms),
+            initials)
 
 
 ####################################################################
@@ -698,11 +908,586 @@ class PickleSerializer(object):
         return pickle.dump(obj, file_obj, protocol=-1)
 
 
+class CompactJSONSerializer(object):
+    """Wrapper around :mod:`json` without indentation or spaces.
+
+    Smaller and quicker to save than :class:`JSONSerializer`, but not
+    meant to be read.
+
+    """
+
+    @classmethod
+    def load(cls, file_obj):
+        """Load serialized object from open JSON file.
+
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+        :returns: object loaded from JSON file
+        :rtype: object
+
+        """
+        return json.load(file_obj)
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        """Serialize object ``obj`` to open JSON file.
+
+        :param obj: Python object to serialize
+        :type obj: JSON-serializable data structure
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+
+        """
+        # `json.dumps` uses the C encoder, unlike `json.dump`
+        return file_obj.write(json.dumps(obj, separators=(',', ':'),
+                                         encoding='utf-8'))
+
+
+class MarshalSerializer(object):
+    """Wrapper around :mod:`marshal`.
+
+    The quickest serializer for plain data: ``None``, booleans, numbers,
+    strings and lists, tuples, sets and dicts of them. Other objects
+    can't be saved with it. The format may change between Python
+    versions, so only use it for data that can be thrown away, e.g. in
+    the cache.
+
+    """
+
+    @classmethod
+    def load(cls, file_obj):
+        """Load serialized object from open marshal file.
+
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+        :returns: object loaded from marshal file
+        :rtype: object
+
+        """
+        # `marshal.load` only accepts real files
+        return marshal.loads(file_obj.read())
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        """Serialize object ``obj`` to open marshal file.
+
+        :param obj: Python object to serialize
+        :type obj: plain data
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+
+        """
+        return file_obj.write(marshal.dumps(obj, 2))
+
+
+class CompressedSerializer(object):
+    """Compress the output of another serializer with :mod:`zlib`.
+
+    Worth it for large data that compress well, e.g. lists of similar
+    dicts, as fewer bytes are written and read.
+
+    >>> manager.register('json.zlib', CompressedSerializer(JSONSerializer))
+
+    :param serializer: serializer to compress the output of
+    :type serializer: object with ``load()`` and ``dump()`` methods
+    :param level: :mod:`zlib` compression level, ``1`` (fastest) to
+        ``9`` (smallest)
+    :type level: ``int``
+
+    """
+
+    def __init__(self, serializer, level=1):
+        """Create new :class:`CompressedSerializer` object."""
+        self.serializer = serializer
+        self.level = level
+
+    def load(self, file_obj):
+        """Load serialized object from open compressed file.
+
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+        :returns: object loaded from file
+        :rtype: object
+
+        """
+        return self.serializer.load(StringIO(zlib.decompress(file_obj.read())))
+
+    def dump(self, obj, file_obj):
+        """Serialize and compress object ``obj`` to open file.
+
+        :param obj: Python object to serialize
+        :type obj: any object the wrapped serializer accepts
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+
+        """
+        buf = StringIO()
+        self.serializer.dump(obj, buf)
+        return file_obj.write(zlib.compress(buf.getvalue(), self.level))
+
+
+class RecordSerializer(object):
+    """Save a mapping as records that can be read one at a time.
+
+    :meth:`load` returns a :class:`LazyRecords` mapping instead of
+    reading the whole file. The file is memory-mapped, and a record is
+    only read and unpickled when its key is looked up, so getting one
+    record out of a large dataset is quick and needs little memory.
+
+    The file is a header, the records and a hash table of the records'
+    offsets. Each record is its key (marshalled) and value (pickled).
+    Keys must be strings or numbers. ASCII ``str`` keys are saved as
+    ``unicode``, so either finds the record, as with a ``dict``.
+
+    """
+
+    @classmethod
+    def load(cls, file_obj):
+        """Open records saved in ``file_obj``.
+
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+        :returns: mapping of the saved records
+        :rtype: :class:`LazyRecords`
+
+        """
+        try:
+            fileno = file_obj.fileno()
+        except AttributeError:  # e.g. data from `SQLiteStore`
+            return LazyRecords(file_obj.read())
+        # The mapping stays valid after the file is closed
+        return LazyRecords(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        """Save mapping ``obj`` as records to open file.
+
+        :param obj: mapping to save
+        :type obj: ``dict``
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+
+        """
+        chunks = []
+        slots = []
+        offset = LazyRecords.header.size
+        for key, value in obj.iteritems():
+            key = LazyRecords.encode_key(key)
+            value = cPickle.dumps(value, -1)
+            chunks += [LazyRecords.record.pack(len(key), len(value)),
+                       key, value]
+            slots.append((zlib.crc32(key) & 0xffffffff, offset))
+            offset += LazyRecords.record.size + len(key) + len(value)
+
+        # Open addressing, at most half full
+        size = 1
+        while size < len(slots) * 2:
+            size *= 2
+        table = [(0, 0)] * size
+        for crc, record in slots:
+            i = crc & (size - 1)
+            while table[i][1]:
+                i = (i + 1) & (size - 1)
+            table[i] = (crc, record)
+
+        file_obj.write(LazyRecords.header.pack(
+            LazyRecords.magic, len(slots), size, offset))
+        file_obj.write(b''.join(chunks))
+        file_obj.write(b''.join([LazyRecords.slot.pack(crc, record)
+                                 for crc, record in table]))
+
+
+class LazyRecords(Mapping):
+    """Read-only mapping of records saved by :class:`RecordSerializer`.
+
+    Looking up a key reads one slot of the hash table and the record it
+    points to. Iterating reads every key, but no values.
+
+    :param data: contents of a records file
+    :type data: :class:`mmap.mmap` or ``str``
+
+    """
+
+    magic = b'AWRECS01'
+    #: magic, number of records, number of slots, offset of hash table
+    header = struct.Struct(b'<8sQQQ')
+    #: length of key, length of value
+    record = struct.Struct(b'<II')
+    #: CRC-32 of key, offset of record (``0`` if slot is empty)
+    slot = struct.Struct(b'<QQ')
+
+    def __init__(self, data):
+        """Create new :class:`LazyRecords` object."""
+        magic, self._count, self._size, self._table = (
+            self.header.unpack(data[:self.header.size]))
+        if magic != self.magic:
+            raise ValueError('not a records file')
+        self._data = data
+
+    @staticmethod
+    def encode_key(key):
+        """Marshal ``key`` so that equal keys give the same bytes."""
+        if isinstance(key, str):
+            try:
+                key = key.decode('ascii')
+            except UnicodeDecodeError:
+                pass
+        elif isinstance(key, (int, long)):
+            key = int(key)
+        return marshal.dumps(key, 2)
+
+    def __len__(self):
+        """Number of records."""
+        return self._count
+
+    def _read(self, offset):
+        """Key and value (both still encoded) of record at ``offset``."""
+        end = offset + self.record.size
+        key_length, value_length = self.record.unpack(self._data[offset:end])
+        key = self._data[end:end + key_length]
+        return key, self._data[end + key_length:
+                               end + key_length + value_length]
+
+    def __getitem__(self, key):
+        """Read and unpickle the value of ``key``."""
+        try:
+            key = self.encode_key(key)
+        except ValueError:
+            raise KeyError(key)
+        crc = zlib.crc32(key) & 0xffffffff
+        mask = self._size - 1
+        i = crc & mask
+        while True:
+            start = self._table + i * self.slot.size
+            slot_crc, offset = self.slot.unpack(
+                self._data[start:start + self.slot.size])
+            if not offset:
+                raise KeyError(marshal.loads(key))
+            if slot_crc == crc:
+                record_key, value = self._read(offset)
+                if record_key == key:
+                    return cPickle.loads(value)
+            i = (i + 1) & mask
+
+    def __iter__(self):
+        """Keys, in the order they were saved."""
+        offset = self.header.size
+        for _ in xrange(self._count):
+            key, value = self._read(offset)
+            yield marshal.loads(key)
+            offset += self.record.size + len(key) + len(value)
+
+
 # Set up default manager and register built-in serializers
 manager = SerializerManager()
 manager.register('cpickle', CPickleSerializer)
 manager.register('pickle', PickleSerializer)
 manager.register('json', JSONSerializer)
+manager.register('compactjson', CompactJSONSerializer)
+manager.register('marshal', MarshalSerializer)
+manager.register('cpickle.zlib', CompressedSerializer(CPickleSerializer))
+manager.register('records', RecordSerializer)
+
+
+class DataMemo(object):
+    """Loaded data files, kept in memory while the files are unchanged.
+
+    Used by :meth:`Workflow.cached_data` and :meth:`Workflow.stored_data`
+    so that reading the same file again costs one ``stat`` instead of
+    opening and deserializing it. A file counts as unchanged while its
+    modification time, size and inode are the same. Files are written
+    by :func:`~workflow.util.atomic_writer`, which replaces the inode.
+
+    The least recently used files are dropped once there are more than
+    ``max_entries`` of them or their combined size is over ``max_bytes``.
+    Set ``max_entries`` to ``0`` to turn the memo off.
+
+    A configured instance of this class is available at
+    :attr:`workflow.data_memo`.
+
+    :param max_entries: most files to keep
+    :type max_entries: ``int``
+    :param max_bytes: most bytes (of the files, not the loaded objects)
+        to keep
+    :type max_bytes: ``int``
+
+    """
+
+    def __init__(self, max_entries=MEMO_MAX_ENTRIES,
+                 max_bytes=MEMO_MAX_BYTES):
+        """Create new :class:`DataMemo`."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        #: ``path: (signature, data, size)``, least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        """Number of files kept."""
+        return len(self._entries)
+
+    def load(self, path, load, st=None):
+        """Return the data in the file at ``path``.
+
+        The data are loaded with ``load`` unless the file is unchanged
+        since they were last loaded.
+
+        The same object is returned until the file changes, so it must
+        not be modified.
+
+        :param path: path of file to load
+        :type path: ``unicode``
+        :param load: called with the open file to load the data
+        :type load: ``callable``
+        :param st: result of :func:`os.stat` for ``path``, if the caller
+            already has it
+        :raises: ``OSError`` if the file doesn't exist
+
+        """
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.discard(path)
+                raise
+        signature = (st.st_mtime, st.st_size, st.st_ino)
+
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            if entry[0] == signature:
+                self._entries[path] = entry
+                self.hits += 1
+                return entry[1]
+            self._bytes -= entry[2]
+
+        # If the file is replaced after `stat`, the data are stored under
+        # the old signature and are loaded again next time
+        with open(path, 'rb') as file_obj:
+            data = load(file_obj)
+
+        if self.max_entries and st.st_size <= self.max_bytes:
+            self._entries[path] = (signature, data, st.st_size)
+            self._bytes += st.st_size
+            while (len(self._entries) > self.max_entries or
+                   self._bytes > self.max_bytes):
+                _, (_, _, size) = self._entries.popitem(last=False)
+                self._bytes -= size
+
+        return data
+
+    def discard(self, path):
+        """Forget the data loaded from ``path``.
+
+        :param path: path of file
+        :type path: ``unicode``
+
+        """
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self):
+        """Forget every loaded file."""
+        self._entries.clear()
+        self._bytes = 0
+
+
+data_memo = DataMemo()
+
+
+#: What :meth:`SQLiteStore.stat` returns: the attributes of
+#: :func:`os.stat` that :meth:`Workflow.cached_data` uses
+StoreStat = namedtuple('StoreStat', ['st_mtime', 'st_size', 'st_ino'])
+
+
+class SQLiteStore(object):
+    """Key-value store in a single SQLite database.
+
+    An alternative to one file per name for :meth:`Workflow.store_data`
+    and :meth:`Workflow.cache_data`. Set :attr:`Workflow.data_store` or
+    :attr:`Workflow.cache_store` to use it.
+
+    Values are saved with the serializers registered with
+    :attr:`manager`, and the name of the serializer is saved with them.
+    The database is in WAL mode, so processes reading it don't block the
+    one writing it.
+
+    :param filepath: path of the database. It is created if it doesn't
+        exist.
+    :type filepath: ``unicode``
+
+    """
+
+    def __init__(self, filepath):
+        """Create new :class:`SQLiteStore` object."""
+        self.filepath = filepath
+        self._conn = None
+        self._inode = None
+
+    @property
+    def conn(self):
+        """Connection to the database, opened on first use.
+
+        The database isn't checked on every use. Call :meth:`check` to
+        open it again if it has been deleted or replaced since.
+
+        """
+        if self._conn is not None:
+            return self._conn
+
+        # Imported here, as it slows down importing this module
+        import sqlite3
+
+        conn = sqlite3.connect(self.filepath, timeout=SQLITE_TIMEOUT)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS store ('
+                         'name TEXT PRIMARY KEY, '
+                         'serializer TEXT NOT NULL, '
+                         'data BLOB NOT NULL, '
+                         'updated REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS store_updated '
+                         'ON store (updated)')
+        self._conn = conn
+        self._inode = os.stat(self.filepath).st_ino
+        return conn
+
+    def check(self):
+        """Close the connection if the database has been deleted or
+        replaced since it was opened, so the next use opens it again.
+
+        :meth:`Workflow.run` calls this at the start of every run.
+
+        """
+        if self._conn is None:
+            return
+        try:
+            inode = os.stat(self.filepath).st_ino
+        except OSError:
+            inode = None
+        if inode != self._inode:
+            self.close()
+
+    def close(self):
+        """Close the connection to the database."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stat(self, name):
+        """When the value of ``name`` was saved and its size.
+
+        :param name: name of value
+        :type name: ``unicode``
+        :returns: :class:`StoreStat`, or ``None`` if there's no value
+            saved under ``name``
+
+        """
+        row = self.conn.execute(
+            'SELECT updated, length(data) FROM store WHERE name = ?',
+            (name,)).fetchone()
+        if row is None:
+            return None
+        return StoreStat(row[0], row[1], 0)
+
+    def load(self, name):
+        """Return the value of ``name``, or ``None`` if there isn't one.
+
+        :param name: name of value
+        :type name: ``unicode``
+        :raises: ``ValueError`` if the value's serializer isn't
+            registered
+
+        """
+        row = self.conn.execute(
+            'SELECT serializer, data FROM store WHERE name = ?',
+            (name,)).fetchone()
+        if row is None:
+            return None
+        serializer = manager.serializer(row[0])
+        if serializer is None:
+            raise ValueError(
+                'Unknown serializer `{0}`. Register a corresponding '
+                'serializer with `manager.register()` '
+                'to load this data.'.format(row[0]))
+        return serializer.load(StringIO(str(row[1])))
+
+    def save(self, name, data, serializer_name):
+        """Save ``data`` under ``name``, replacing any previous value.
+
+        :param name: name of value
+        :type name: ``unicode``
+        :param data: value to save
+        :param serializer_name: name of a serializer registered with
+            :attr:`manager`
+        :type serializer_name: ``unicode``
+
+        """
+        buf = StringIO()
+        manager.serializer(serializer_name).dump(data, buf)
+        with self.conn as conn:
+            conn.execute('INSERT OR REPLACE INTO store '
+                         '(name, serializer, data, updated) '
+                         'VALUES (?, ?, ?, ?)',
+                         (name, serializer_name,
+                          buffer(buf.getvalue()), time.time()))
+
+    def delete(self, name):
+        """Delete the value of ``name``, if there is one."""
+        with self.conn as conn:
+            conn.execute('DELETE FROM store WHERE name = ?', (name,))
+
+    def delete_matching(self, filter_func):
+        """Delete the values ``filter_func`` returns ``True`` for.
+
+        :param filter_func: called with the filename each value would
+            have if it were saved in a file (``name.serializer``), as
+            :meth:`Workflow.clear_cache` calls it with filenames
+        :type filter_func: ``callable``
+
+        """
+        rows = self.conn.execute('SELECT name, serializer FROM store')
+        names = [(name,) for name, serializer in rows.fetchall()
+                 if filter_func('{0}.{1}'.format(name, serializer))]
+        with self.conn as conn:
+            conn.executemany('DELETE FROM store WHERE name = ?', names)
+
+    def delete_prefix(self, prefix, keep=None):
+        """Delete the values whose names start with ``prefix``.
+
+        Uses the index on names, so no other values are read.
+
+        :param prefix: start of names to delete
+        :type prefix: ``unicode``
+        :param keep: don't delete names starting with this
+        :type keep: ``unicode``
+
+        """
+        query = 'DELETE FROM store WHERE name >= ? AND name < ?'
+        params = [prefix, _prefix_end(prefix)]
+        if keep:
+            query += ' AND NOT (name >= ? AND name < ?)'
+            params += [keep, _prefix_end(keep)]
+        with self.conn as conn:
+            conn.execute(query, params)
+
+    def purge(self, max_age):
+        """Delete values saved more than ``max_age`` seconds ago.
+
+        :param max_age: age in seconds
+        :type max_age: ``int``
+
+        """
+        with self.conn as conn:
+            conn.execute('DELETE FROM store WHERE updated < ?',
+                         (time.time() - max_age,))
+
+
+def _prefix_end(prefix):
+    """Smallest string greater than every string starting with ``prefix``."""
+    return prefix[:-1] + unichr(ord(prefix[-1]) + 1)
 
 
 class Item(object):
@@ -822,6 +1607,12 @@ class Settings(dict):
         self._filepath = filepath
         self._nosave = False
         self._original = {}
+        #: Called with the path of the settings file, a function that
+        #: writes its contents to a file object and ``locked=True``
+        #: instead of saving straight away. If it returns ``True``, it
+        #: has taken over the save. :class:`Workflow` sets this to
+        #: buffer saves when :attr:`Workflow.write_behind` is on.
+        self.defer_write = None
         if os.path.exists(self._filepath):
             self._load()
         elif defaults:
@@ -850,39 +1641,557 @@ class Settings(dict):
         you probably are, ``self._filepath`` will be ``settings.json``
         in your workflow's data directory (see :attr:`~Workflow.datadir`).
         """
-        if self._nosave:
-            return
+        if self._nosave:
+            return
+
+        data = {}
+        data.update(self)
+
+        def dump(fp):
+            json.dump(data, fp, sort_keys=True, indent=2, encoding='utf-8')
+
+        if self.defer_write is not None and self.defer_write(
+                self._filepath, dump, locked=True):
+            return
+
+        with LockFile(self._filepath, 0.5):
+            with atomic_writer(self._filepath, 'wb') as fp:
+                dump(fp)
+
+    # dict methods
+    def __setitem__(self, key, value):
+        """Implement :class:`dict` interface."""
+        if self._original.get(key) != value:
+            super(Settings, self).__setitem__(key, value)
+            self.save()
+
+    def __delitem__(self, key):
+        """Implement :class:`dict` interface."""
+        super(Settings, self).__delitem__(key)
+        self.save()
+
+    def update(self, *args, **kwargs):
+        """Override :class:`dict` method to save on update."""
+        super(Settings, self).update(*args, **kwargs)
+        self.save()
+
+    def setdefault(self, key, value=None):
+        """Override :class:`dict` method to save on update."""
+        ret = super(Settings, self).setdefault(key, value)
+        self.save()
+        return ret
+
+
+class KeychainBackend(object):
+    """Store passwords in the macOS Keychain.
+
+    Every call runs the ``security`` command-line program.
+
+    :param call_security: callable with the signature of
+        :meth:`Workflow._call_security`
+
+    """
+
+    def __init__(self, call_security):
+        """Create new :class:`KeychainBackend` object."""
+        self._call_security = call_security
+
+    def save(self, service, account, password):
+        """Save ``password`` for ``service/account``.
+
+        If the account exists, the old password will first be deleted
+        (Keychain throws an error otherwise).
+
+        """
+        try:
+            self._call_security('add-generic-password', service, account,
+                                '-w', password)
+
+        except PasswordExists:
+            if self.get(service, account) == password:
+                return
+
+            self.delete(service, account)
+            self._call_security('add-generic-password', service,
+                                account, '-w', password)
+
+    def get(self, service, account):
+        """Return password for ``service/account``.
+
+        Raise :class:`PasswordNotFound` if it doesn't exist.
+
+        """
+        output = self._call_security('find-generic-password', service,
+                                     account, '-g')
+
+        # Parsing of `security` output is adapted from python-keyring
+        # by Jason R. Coombs
+        # https://pypi.python.org/pypi/keyring
+        m = re.search(
+            r'password:\s*(?:0x(?P<hex>[0-9A-F]+)\s*)?(?:"(?P<pw>.*)")?',
+            output)
+
+        if m:
+            groups = m.groupdict()
+            h = groups.get('hex')
+            password = groups.get('pw')
+            if h:
+                password = unicode(binascii.unhexlify(h), 'utf-8')
+
+        return password
+
+    def delete(self, service, account):
+        """Delete password for ``service/account``.
+
+        Raise :class:`PasswordNotFound` if it doesn't exist.
+
+        """
+        self._call_security('delete-generic-password', service, account)
+
+
+class FileBackend(object):
+    """Store passwords in a JSON file readable only by the user.
+
+    Intended for testing and for systems without a Keychain. The file
+    is not encrypted.
+
+    :param filepath: path of the JSON file
+    :type filepath: ``unicode``
+
+    """
+
+    def __init__(self, filepath):
+        """Create new :class:`FileBackend` object."""
+        self.filepath = filepath
+
+    def _load(self):
+        if not os.path.exists(self.filepath):
+            return {}
+        with open(self.filepath, 'rb') as fp:
+            return json.load(fp)
+
+    def _write(self, data):
+        with atomic_writer(self.filepath, 'wb') as fp:
+            os.chmod(fp.name, 0o600)
+            json.dump(data, fp, encoding='utf-8')
+
+    def save(self, service, account, password):
+        """Save ``password`` for ``service/account``."""
+        with LockFile(self.filepath, 0.5):
+            data = self._load()
+            data.setdefault(service, {})[account] = password
+            self._write(data)
+
+    def get(self, service, account):
+        """Return password for ``service/account``.
+
+        Raise :class:`PasswordNotFound` if it doesn't exist.
+
+        """
+        try:
+            return self._load()[service][account]
+        except KeyError:
+            raise PasswordNotFound()
+
+    def delete(self, service, account):
+        """Delete password for ``service/account``.
+
+        Raise :class:`PasswordNotFound` if it doesn't exist.
+
+        """
+        with LockFile(self.filepath, 0.5):
+            data = self._load()
+            try:
+                del data[service][account]
+            except KeyError:
+                raise PasswordNotFound()
+            self._write(data)
+
+
+class CachingBackend(object):
+    """Cache passwords read from another backend for ``ttl`` seconds.
+
+    Each Script Filter run is a new process, so passwords are cached in
+    memory *and* in a file readable only by the user. Every cache hit
+    saves a call to the wrapped backend, i.e. a ``security`` process
+    for :class:`KeychainBackend`. The number of calls saved is
+    available as :attr:`calls_saved`. Hits are counted in memory and
+    only added to the cache file when it is next written, so a hit
+    doesn't write anything.
+
+    Expired entries are ignored and dropped from the file when it is
+    written. Saving or deleting a password updates the cache.
+
+    :param backend: backend to cache
+    :param filepath: path of the cache file
+    :type filepath: ``unicode``
+    :param ttl: number of seconds a password is cached for
+    :type ttl: ``int``
+
+    """
+
+    def __init__(self, backend, filepath, ttl=60):
+        """Create new :class:`CachingBackend` object."""
+        self.backend = backend
+        self.filepath = filepath
+        self.ttl = ttl
+        self._data = None
+        self._hits = 0
+
+    @property
+    def data(self):
+        """Cache contents: ``entries`` and ``calls_saved``."""
+        if self._data is None:
+            data = {}
+            if os.path.exists(self.filepath):
+                try:
+                    with open(self.filepath, 'rb') as fp:
+                        data = json.load(fp)
+                except ValueError:  # corrupt cache is just a miss
+                    data = {}
+            data.setdefault('entries', {})
+            data.setdefault('calls_saved', 0)
+            self._data = data
+        return self._data
+
+    @property
+    def calls_saved(self):
+        """Number of backend calls answered from the cache."""
+        return self.data['calls_saved'] + self._hits
+
+    def _key(self, service, account):
+        return '{0}\n{1}'.format(service, account)
+
+    def _write(self):
+        data = self.data
+        now = time.time()
+        for key, entry in data['entries'].items():
+            if entry[1] <= now:
+                del data['entries'][key]
+        data['calls_saved'] += self._hits
+        self._hits = 0
+        with atomic_writer(self.filepath, 'wb') as fp:
+            os.chmod(fp.name, 0o600)
+            json.dump(self.data, fp, encoding='utf-8')
+
+    def _set(self, service, account, password):
+        self.data['entries'][self._key(service, account)] = [
+            password, time.time() + self.ttl]
+        self._write()
+
+    def save(self, service, account, password):
+        """Save ``password`` in the wrapped backend and the cache."""
+        self.backend.save(service, account, password)
+        self._set(service, account, password)
+
+    def get(self, service, account):
+        """Return password for ``service/account``, from cache if fresh.
+
+        Raise :class:`PasswordNotFound` if it doesn't exist.
+
+        """
+        entry = self.data['entries'].get(self._key(service, account))
+        if entry and entry[1] > time.time():
+            self._hits += 1
+            return entry[0]
+
+        password = self.backend.get(service, account)
+        self._set(service, account, password)
+        return password
+
+    def delete(self, service, account):
+        """Delete password from the wrapped backend and the cache."""
+        self.data['entries'].pop(self._key(service, account), None)
+        self._write()
+        self.backend.delete(service, account)
+
+
+class FilterIndex(object):
+    """Search keys of a list of items, prepared once for
+    :meth:`Workflow.filter`.
+
+    :meth:`Workflow.filter` normally works out the lowercase, folded,
+    capitals, atoms and initials of every item's search key on every
+    call. Pass a :class:`FilterIndex` as ``items`` instead, and those
+    are only worked out when the index is built, so repeated queries
+    against the same items (e.g. on every keystroke) only run the
+    matching rules.
+
+    With ``ngrams=True``, the index also maps every character and
+    trigram of the folded, lowercase keys to the items containing
+    them. :meth:`Workflow.filter` then only runs the matching rules on
+    items that contain every character of the query, or, if
+    ``match_on`` only has rules that need the query as one piece
+    (:const:`MATCH_STARTSWITH`, :const:`MATCH_ATOM` and
+    :const:`MATCH_SUBSTRING`), every trigram of it.
+
+    Items can be added and removed without building the index again.
+
+    The index holds no reference to ``key``, so it can be pickled,
+    e.g. saved with :meth:`Workflow.cache_data` and loaded again with
+    :meth:`Workflow.cached_data`, as long as the items can be pickled.
+
+    :param items: items to index
+    :type items: ``list`` or ``tuple``
+    :param key: function to get the search key from an item.
+        Must return a ``unicode`` string.
+    :type key: ``callable``
+    :param ngrams: also build the character and trigram index
+    :type ngrams: ``Boolean``
+
+    """
+
+    def __init__(self, items, key=lambda x: x, ngrams=False):
+        """Create new :class:`FilterIndex`."""
+        #: ``(item, features, folded features)`` for every item whose
+        #: search key is not empty, or ``None`` where an item was
+        #: removed. See :func:`search_features`.
+        self.entries = []
+        #: Positions in :attr:`entries` of the items containing each
+        #: character and trigram, or ``None`` if ``ngrams`` is not set
+        self.postings = {} if ngrams else None
+        self._size = 0
+        for item in items:
+            self.add(item, key)
+
+    def __len__(self):
+        """Number of indexed items."""
+        return self._size
+
+    def items(self):
+        """Indexed items, in the order they were added."""
+        return [entry[0] for entry in self.entries if entry is not None]
+
+    def add(self, item, key=lambda x: x):
+        """Add ``item`` to the index.
+
+        :param item: item to add. Ignored if its search key is empty.
+        :param key: function to get the search key from ``item``
+        :type key: ``callable``
+
+        """
+        value = key(item).strip()
+        if value == '':
+            return
+        features = search_features(value)
+        folded = fold_to_ascii(value)
+        if folded != value:
+            folded_features = search_features(folded)
+        else:
+            folded_features = features
+        position = len(self.entries)
+        self.entries.append((item, features, folded_features))
+        self._size += 1
+        if self.postings is not None:
+            for gram in self._ngrams(folded_features[1]):
+                self.postings.setdefault(gram, set()).add(position)
+
+    def remove(self, item):
+        """Remove the first indexed item equal to ``item``.
+
+        :raises: ``ValueError`` if ``item`` is not in the index
+
+        """
+        for position, entry in enumerate(self.entries):
+            if entry is not None and entry[0] == item:
+                break
+        else:
+            raise ValueError('item not in index: {0!r}'.format(item))
+        # Positions of later items must not change, so the entry is
+        # blanked rather than deleted
+        self.entries[position] = None
+        self._size -= 1
+        if self.postings is not None:
+            for gram in self._ngrams(entry[2][1]):
+                self.postings[gram].discard(position)
+
+    def candidates(self, words, match_on):
+        """Entries that can match every one of ``words``.
+
+        :param words: lowercase query words
+        :type words: ``list``
+        :param match_on: ``MATCH_*`` rules in use
+        :type match_on: ``int``
+        :returns: ``(position, entry)`` tuples
+        :rtype: ``list``
+
+        """
+        entries = self.entries
+        positions = self._narrow(words, match_on)
+        if positions is None:
+            return [(i, entry) for i, entry in enumerate(entries)
+                    if entry is not None]
+        return [(i, entries[i]) for i in sorted(positions)]
+
+    def _narrow(self, words, match_on):
+        """Positions of the items containing the grams of ``words``, or
+        ``None`` if the index can't narrow them down.
+
+        """
+        if self.postings is None:
+            return None
+        contiguous = not match_on & (MATCH_CAPITALS | MATCH_INITIALS |
+                                     MATCH_ALLCHARS)
+        postings = []
+        for word in words:
+            # The postings are of folded keys, which contain the same
+            # ASCII characters, in the same order, as the originals
+            if not isascii(word):
+                continue
+            if contiguous and len(word) >= 3:
+                grams = self._ngrams(word)
+            else:
+                grams = set(word)
+            for gram in grams:
+                if gram not in self.postings:
+                    return set()
+                postings.append(self.postings[gram])
+        if not postings:
+            return None
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+    @staticmethod
+    def _ngrams(text):
+        """Characters and trigrams of ``text`` that don't contain spaces.
+
+        Query words never do.
+
+        """
+        grams = set(text)
+        grams.update([text[i:i + 3] for i in xrange(len(text) - 2)])
+        return set([gram for gram in grams if ' ' not in gram])
+
+    def positions(self, selected=None):
+        """Index of the positions of items in this index.
+
+        Filtering the returned index yields the positions (in
+        :attr:`entries`) of matching items instead of the items. The
+        search features are shared, not worked out again.
+
+        :param selected: positions to include. Default is all of them.
+        :type selected: ``list``
+        :returns: new index
+        :rtype: :class:`FilterIndex`
+
+        """
+        if selected is None:
+            selected = xrange(len(self.entries))
+        entries = self.entries
+        index = FilterIndex([])
+        index.entries = [(i,) + entries[i][1:] for i in selected
+                         if entries[i] is not None]
+        index._size = len(index.entries)
+        return index
+
+
+def _score_chunk(conn, job, positions):
+    """Score a chunk of the items of a parallel filter.
+
+    Run in the worker processes of :meth:`Workflow._score_parallel`,
+    which inherit ``job`` and ``positions`` when they are forked.
+
+    :param conn: end of the pipe to send the results to
+    :type conn: :class:`multiprocessing.Connection`
+    :param job: ``(workflow, query, items, key, ascending, max_results,
+        match_on, fold_diacritics, min_score)``
+    :type job: ``tuple``
+    :param positions: positions of the items to score
+    :type positions: ``list``
+
+    Sends ``(True, results)``, where each result is ``(sort key, position,
+    score, rule)`` of one of the chunk's best matches, or ``(False,
+    traceback)`` if scoring fails.
 
-        data = {}
-        data.update(self)
+    """
+    (wf, query, items, key, ascending, max_results, match_on,
+     fold_diacritics, min_score) = job
+    try:
+        # Score positions rather than items, so they can be sent back
+        if isinstance(items, FilterIndex):
+            candidates = items.positions(positions)
+            item_at = lambda i: items.entries[i][0]
+        else:
+            candidates = positions
+            item_at = items.__getitem__
+            key = (lambda k: lambda i: k(items[i]))(key)
+        results = wf._score_items(query, candidates, key, match_on,
+                                  fold_diacritics, min_score)
+
+        # Rank on the items, as in the serial path, so ties at the edge
+        # of the chunk's best matches are broken the same way
+        results = ((sortkey, (item_at(i), score, rule), i)
+                   for sortkey, (i, score, rule) in results)
+        if max_results:
+            select = heapq.nlargest if ascending else heapq.nsmallest
+            results = select(max_results, results)
+        conn.send((True, [(sortkey, i, score, rule)
+                          for sortkey, (_, score, rule), i in results]))
+    except Exception:
+        import traceback
+        conn.send((False, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+@uninterruptible
+def _write_files(pending):
+    """Write files buffered by :meth:`Workflow._defer_write`.
+
+    :param pending: ``{path: (contents, time, locked)}``. Files with
+        ``locked`` set are written holding a :class:`LockFile`.
+    :type pending: :class:`~collections.OrderedDict`
 
-        with LockFile(self._filepath, 0.5):
-            with atomic_writer(self._filepath, 'wb') as fp:
-                json.dump(data, fp, sort_keys=True, indent=2,
-                          encoding='utf-8')
+    """
+    for path, (contents, _, locked) in pending.items():
+        if locked:
+            with LockFile(path, 0.5):
+                with atomic_writer(path, 'wb') as fp:
+                    fp.write(contents)
+        else:
+            with atomic_writer(path, 'wb') as fp:
+                fp.write(contents)
 
-    # dict methods
-    def __setitem__(self, key, value):
-        """Implement :class:`dict` interface."""
-        if self._original.get(key) != value:
-            super(Settings, self).__setitem__(key, value)
-            self.save()
 
-    def __delitem__(self, key):
-        """Implement :class:`dict` interface."""
-        super(Settings, self).__delitem__(key)
-        self.save()
+def _write_files_detached(pending):
+    """Call :func:`_write_files` in a detached grandchild process.
 
-    def update(self, *args, **kwargs):
-        """Override :class:`dict` method to save on update."""
-        super(Settings, self).update(*args, **kwargs)
-        self.save()
+    The grandchild closes stdio and any inherited pipes and sockets,
+    so nothing waits on it to reach EOF. Returns once the intermediate
+    child has exited.
 
-    def setdefault(self, key, value=None):
-        """Override :class:`dict` method to save on update."""
-        ret = super(Settings, self).setdefault(key, value)
-        self.save()
-        return ret
+    :raises: ``OSError`` if the first fork fails
+
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+
+    status = 1
+    try:
+        os.setsid()
+        if not os.fork():
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            try:
+                fds = [int(name) for name in os.listdir(b'/dev/fd')]
+            except OSError:
+                fds = []
+            for fd in fds:
+                try:
+                    mode = os.fstat(fd).st_mode
+                except OSError:
+                    continue
+                if fd > 2 and (stat.S_ISSOCK(mode) or stat.S_ISFIFO(mode)):
+                    os.close(fd)
+            _write_files(pending)
+        status = 0
+    finally:
+        os._exit(status)
 
 
 class Workflow(object):
@@ -963,8 +2272,44 @@ class Workflow(object):
         self._version = UNSET
         # Version from last workflow run
         self._last_version_run = UNSET
-        # Cache for regex patterns created for filter keys
-        self._search_pattern_cache = {}
+        self._secret_backend = None
+        #: Number of seconds passwords are cached for after being read
+        #: from the Keychain. ``0`` (the default) disables the cache.
+        #: See :class:`CachingBackend`.
+        self.password_cache_ttl = 0
+        #: :class:`SQLiteStore` that :meth:`store_data` and
+        #: :meth:`stored_data` use instead of one file per name in
+        #: :attr:`datadir`. ``None`` (the default) uses files.
+        self.data_store = None
+        #: Same as :attr:`data_store`, for :meth:`cache_data` and
+        #: :meth:`cached_data`
+        self.cache_store = None
+        #: Budget for :attr:`cachedir`: total size in bytes, number of
+        #: files and seconds since a file was last used. If any is set,
+        #: :mod:`~workflow.janitor` is run in the background every
+        #: :attr:`cache_janitor_interval` seconds to remove the least
+        #: recently used files. ``None`` (the default) is no limit.
+        self.cache_max_bytes = None
+        #: See :attr:`cache_max_bytes`
+        self.cache_max_entries = None
+        #: See :attr:`cache_max_bytes`
+        self.cache_max_age = None
+        #: Seconds between runs of the cache janitor
+        self.cache_janitor_interval = JANITOR_INTERVAL
+        # Cache files read this run and when, for the janitor
+        self._cache_accesses = {}
+        #: Buffer the files written by :meth:`cache_data`,
+        #: :meth:`store_data` and :attr:`settings` while :meth:`run` is
+        #: running, and write them in a background process once your
+        #: workflow's function has returned (i.e. after its feedback has
+        #: been sent). The data are saved when :meth:`cache_data` etc.
+        #: is called, and read back from the buffer until written.
+        #: Writes to :attr:`cache_store` and :attr:`data_store` aren't
+        #: buffered. Default is ``False``.
+        self.write_behind = False
+        # path: (contents, time, locked), see `_defer_write`
+        self._pending_writes = OrderedDict()
+        self._running = False
         # Magic arguments
         #: The prefix for all magic arguments. Default is ``workflow:``
         self.magic_prefix = 'workflow:'
@@ -1462,6 +2807,7 @@ class Workflow(object):
             self.logger.debug('reading settings from %s', self.settings_path)
             self._settings = Settings(self.settings_path,
                                       self._default_settings)
+            self._settings.defer_write = self._defer_write
         return self._settings
 
     @property
@@ -1554,19 +2900,30 @@ class Workflow(object):
 
         Returns ``None`` if there are no data stored under ``name``.
 
+        The data are kept in :attr:`data_memo` until the file changes,
+        and the same object is returned until then, so don't modify it.
+
         .. versionadded:: 1.8
 
         :param name: name of datastore
 
         """
+        if self.data_store is not None:
+            data = self.data_store.load(name)
+            self.logger.debug('stored data loaded from %s: %s',
+                              self.data_store.filepath, name)
+            return data
+
         metadata_path = self.datafile('.{0}.alfred-workflow'.format(name))
 
-        if not os.path.exists(metadata_path):
+        if metadata_path in self._pending_writes:
+            serializer_name = self._pending_writes[metadata_path][0]
+        elif not os.path.exists(metadata_path):
             self.logger.debug('no data stored for `%s`', name)
             return None
-
-        with open(metadata_path, 'rb') as file_obj:
-            serializer_name = file_obj.read().strip()
+        else:
+            serializer_name = data_memo.load(
+                metadata_path, lambda file_obj: file_obj.read().strip())
 
         serializer = manager.serializer(serializer_name)
 
@@ -1581,6 +2938,10 @@ class Workflow(object):
         filename = '{0}.{1}'.format(name, serializer_name)
         data_path = self.datafile(filename)
 
+        if data_path in self._pending_writes:
+            self.logger.debug('stored data not written yet: %s', data_path)
+            return serializer.load(StringIO(self._pending_writes[data_path][0]))
+
         if not os.path.exists(data_path):
             self.logger.debug('no data stored: %s', name)
             if os.path.exists(metadata_path):
@@ -1588,8 +2949,7 @@ class Workflow(object):
 
             return None
 
-        with open(data_path, 'rb') as file_obj:
-            data = serializer.load(file_obj)
+        data = data_memo.load(data_path, serializer.load)
 
         self.logger.debug('stored data loaded: %s', data_path)
 
@@ -1618,6 +2978,8 @@ class Workflow(object):
         def delete_paths(paths):
             """Clear one or more data stores"""
             for path in paths:
+                data_memo.discard(path)
+                self._pending_writes.pop(path, None)
                 if os.path.exists(path):
                     os.unlink(path)
                     self.logger.debug('deleted data file: %s', path)
@@ -1644,6 +3006,15 @@ class Workflow(object):
                 'Invalid serializer `{0}`. Register your serializer with '
                 '`manager.register()` first.'.format(serializer_name))
 
+        if self.data_store is not None:
+            if data is None:
+                self.data_store.delete(name)
+            else:
+                self.data_store.save(name, data, serializer_name)
+            self.logger.debug('saved data to %s: %s',
+                              self.data_store.filepath, name)
+            return
+
         if data is None:  # Delete cached data
             delete_paths((metadata_path, data_path))
             return
@@ -1658,45 +3029,217 @@ class Workflow(object):
             with atomic_writer(data_path, 'wb') as file_obj:
                 serializer.dump(data, file_obj)
 
-        _store()
+        # `data` may be changed after it is saved, so it isn't memoized
+        data_memo.discard(metadata_path)
+        data_memo.discard(data_path)
+        if self._defer_write(metadata_path,
+                             lambda file_obj: file_obj.write(serializer_name)):
+            self._defer_write(data_path,
+                              lambda file_obj: serializer.dump(data, file_obj))
+        else:
+            _store()
 
         self.logger.debug('saved data: %s', data_path)
 
-    def cached_data(self, name, data_func=None, max_age=60):
+    def cached_data(self, name, data_func=None, max_age=60, stale_ok=False,
+                    refresh=None):
         """Return cached data if younger than ``max_age`` seconds.
 
         Retrieve data from cache or re-generate and re-cache data if
         stale/non-existant. If ``max_age`` is 0, return cached data no
         matter how old.
 
+        Only one process regenerates a stale cache at a time. Others
+        calling :meth:`cached_data` meanwhile wait (for up to
+        :const:`CACHE_LOCK_WAIT` seconds) and return its data instead of
+        calling ``data_func`` as well.
+
+        With ``stale_ok=True``, stale data are returned straight away,
+        and ``refresh`` is started in the background (via
+        :func:`~workflow.background.run_in_background`) to update the
+        cache. Only one refresh of ``name`` runs at a time. Use
+        :meth:`cache_refreshing` to tell whether it is still running,
+        e.g. to set :attr:`Workflow3.rerun`. ``data_func`` is then only
+        called if nothing is cached yet; if it isn't set either, the
+        refresh is started and ``None`` is returned.
+
         :param name: name of datastore
         :param data_func: function to (re-)generate data.
         :type data_func: ``callable``
         :param max_age: maximum age of cached data in seconds
         :type max_age: ``int``
+        :param stale_ok: return stale data and refresh them in the
+            background
+        :type stale_ok: ``Boolean``
+        :param refresh: command that saves new data for ``name`` with
+            :meth:`cache_data`, e.g. ``['/usr/bin/python',
+            wf.workflowfile('update.py')]``. Required with ``stale_ok``.
+        :type refresh: ``list``
         :returns: cached data, return value of ``data_func`` or ``None``
             if ``data_func`` is not set
 
-        """
-        serializer = manager.serializer(self.cache_serializer)
+        Data loaded from the cache are kept in :attr:`data_memo` until
+        the cache file changes, and the same object is returned until
+        then, so don't modify it.
 
-        cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
-        age = self.cached_data_age(name)
+        """
+        if stale_ok and not refresh:
+            raise ValueError('`stale_ok` requires a `refresh` command')
 
-        if (age < max_age or max_age == 0) and os.path.exists(cache_path):
+        st = self._cache_stat(name)
 
-            with open(cache_path, 'rb') as file_obj:
-                self.logger.debug('loading cached data: %s', cache_path)
-                return serializer.load(file_obj)
+        if st is not None:
+            fresh = time.time() - st.st_mtime < max_age or max_age == 0
+            if fresh or stale_ok:
+                if not fresh:
+                    self.logger.debug('cached data stale: %s', name)
+                    self._refresh_cache(name, refresh)
+                self.logger.debug('loading cached data: %s', name)
+                return self._load_cache(name, st)
 
         if not data_func:
+            if stale_ok:
+                self._refresh_cache(name, refresh)
+            return None
+
+        return self._regenerate_cache(name, data_func, st)
+
+    def _cache_path(self, name):
+        """Path of the cache file of ``name``."""
+        return self.cachefile('%s.%s' % (name, self.cache_serializer))
+
+    def _cache_stat(self, name):
+        """:func:`os.stat` of cache ``name`` (or the :class:`StoreStat`
+        if :attr:`cache_store` is set), or ``None`` if it doesn't exist.
+
+        """
+        if self.cache_store is not None:
+            return self.cache_store.stat(name)
+        cache_path = self._cache_path(name)
+        if cache_path in self._pending_writes:
+            contents, written, _ = self._pending_writes[cache_path]
+            return StoreStat(written, len(contents), 0)
+        try:
+            return os.stat(cache_path)
+        except OSError:
+            return None
+
+    def _load_cache(self, name, st=None):
+        """Load the data cached under ``name``.
+
+        :param st: as returned by :meth:`_cache_stat`
+        :raises: ``OSError`` if there are none
+
+        """
+        if self.cache_store is not None:
+            data = self.cache_store.load(name)
+            if data is None:
+                raise OSError(errno.ENOENT, 'no cached data', name)
+            return data
+        serializer = manager.serializer(self.cache_serializer)
+        cache_path = self._cache_path(name)
+        if cache_path in self._pending_writes:
+            return serializer.load(StringIO(self._pending_writes[cache_path][0]))
+        # The janitor counts a file's modification time as a use, so reads
+        # of a file modified within its interval needn't be logged
+        now = time.time()
+        if st is None or now - st.st_mtime >= self.cache_janitor_interval:
+            self._cache_accesses[os.path.basename(cache_path)] = now
+        return data_memo.load(cache_path, serializer.load, st)
+
+    def _regenerate_cache(self, name, data_func, st):
+        """Call ``data_func`` and cache its result, unless another process
+        is already doing so.
+
+        The process that gets the lock on the cache file regenerates the
+        data. The others wait up to :const:`CACHE_LOCK_WAIT` seconds for
+        the cache file to be replaced and return its data. If it isn't,
+        they return the stale data, if there are any, or call
+        ``data_func`` themselves.
+
+        :param st: :meth:`_cache_stat` of ``name`` when the cache was
+            found to be stale, or ``None`` if it didn't exist
+
+        """
+        # The lock is on the path of the cache file, even if the data
+        # are cached in `cache_store`
+        cache_path = self._cache_path(name)
+
+        def replaced():
+            """:meth:`_cache_stat` of ``name`` if it has been written
+            since ``st``, else ``None``."""
+            new = self._cache_stat(name)
+            if new is None:
+                return None
+            if st is None or (new.st_mtime, new.st_ino) != (st.st_mtime,
+                                                            st.st_ino):
+                return new
             return None
 
+        lock = LockFile(cache_path)
+        if lock.acquire(blocking=False):
+            try:
+                # Another process may have finished between the cache
+                # being found stale and the lock being acquired
+                new = replaced()
+                if new is not None:
+                    self.logger.debug('cache regenerated by another '
+                                      'process: %s', cache_path)
+                    return self._load_cache(name, new)
+
+                data = data_func()
+                self.cache_data(name, data)
+                # Written through, even with `write_behind` on, so the
+                # processes waiting for the lock find the new cache
+                self._write_now(cache_path)
+                return data
+            finally:
+                lock.release()
+
+        self.logger.debug('waiting for cache to be regenerated: %s',
+                          cache_path)
+        deadline = time.time() + CACHE_LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(lock.delay)
+            new = replaced()
+            if new is not None:
+                return self._load_cache(name, new)
+
+        if st is not None:
+            self.logger.debug('cache not regenerated in time, using stale '
+                              'data: %s', cache_path)
+            try:
+                return self._load_cache(name)
+            except OSError:  # deleted in the meantime
+                pass
+
         data = data_func()
         self.cache_data(name, data)
-
         return data
 
+    def cache_refreshing(self, name):
+        """Whether cache ``name`` is being refreshed in the background.
+
+        See the ``stale_ok`` option of :meth:`cached_data`.
+
+        :param name: name of datastore
+        :returns: ``True`` if the refresh of ``name`` is running
+        :rtype: ``Boolean``
+
+        """
+        from background import is_running
+
+        return is_running(self._refresh_job_name(name))
+
+    def _refresh_cache(self, name, refresh):
+        """Start ``refresh`` in the background, unless it's running."""
+        from background import run_in_background
+
+        run_in_background(self._refresh_job_name(name), refresh)
+
+    def _refresh_job_name(self, name):
+        return '__workflow_cache_refresh_{0}'.format(name)
+
     def cache_data(self, name, data):
         """Save ``data`` to cache under ``name``.
 
@@ -1708,21 +3251,93 @@ class Workflow(object):
                 the cache serializer
 
         """
+        if self.cache_store is not None:
+            if data is None:
+                self.cache_store.delete(name)
+            else:
+                self.cache_store.save(name, data, self.cache_serializer)
+            self.logger.debug('cached data in %s: %s',
+                              self.cache_store.filepath, name)
+            return
+
         serializer = manager.serializer(self.cache_serializer)
 
         cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
+        data_memo.discard(cache_path)
 
         if data is None:
+            self._pending_writes.pop(cache_path, None)
             if os.path.exists(cache_path):
                 os.unlink(cache_path)
                 self.logger.debug('deleted cache file: %s', cache_path)
             return
 
-        with atomic_writer(cache_path, 'wb') as file_obj:
+        def dump(file_obj):
             serializer.dump(data, file_obj)
 
+        if not self._defer_write(cache_path, dump):
+            with atomic_writer(cache_path, 'wb') as file_obj:
+                dump(file_obj)
+
         self.logger.debug('cached data: %s', cache_path)
 
+    def _defer_write(self, path, dump, locked=False):
+        """Buffer a file until :meth:`flush_writes`, if
+        :attr:`write_behind` is on and :meth:`run` is running.
+
+        :param path: path of the file
+        :param dump: function that writes the file's contents to the
+            file object it is called with
+        :type dump: ``callable``
+        :param locked: hold a :class:`LockFile` on ``path`` to write it
+        :type locked: ``Boolean``
+        :returns: ``True`` if the file was buffered, ``False`` if the
+            caller should write it now
+        :rtype: ``Boolean``
+
+        """
+        if not (self.write_behind and self._running):
+            return False
+        file_obj = StringIO()
+        dump(file_obj)
+        # Re-added, so files are written in the order they were last saved
+        self._pending_writes.pop(path, None)
+        self._pending_writes[path] = (file_obj.getvalue(), time.time(), locked)
+        return True
+
+    def _write_now(self, path):
+        """Write ``path`` now if :meth:`_defer_write` buffered it."""
+        if path in self._pending_writes:
+            _write_files(OrderedDict([(path, self._pending_writes.pop(path))]))
+
+    def flush_writes(self, detach=False):
+        """Write the files buffered because :attr:`write_behind` is on.
+
+        :meth:`run` calls this with ``detach=True`` after your workflow's
+        function has returned.
+
+        :param detach: write the files in a background process, so
+            whatever reads this process's output (i.e. Alfred) needn't
+            wait for them
+        :type detach: ``Boolean``
+
+        """
+        if not self._pending_writes:
+            return
+
+        pending, self._pending_writes = self._pending_writes, OrderedDict()
+        if detach and hasattr(os, 'fork'):
+            try:
+                _write_files_detached(pending)
+                self.logger.debug('writing %d file(s) in the background',
+                                  len(pending))
+                return
+            except OSError as err:
+                self.logger.warning('could not fork to write files: %s', err)
+
+        _write_files(pending)
+        self.logger.debug('wrote %d file(s)', len(pending))
+
     def cached_data_fresh(self, name, max_age):
         """Whether cache `name` is less than `max_age` seconds old.
 
@@ -1749,16 +3364,16 @@ class Workflow(object):
         :rtype: ``int``
 
         """
-        cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
+        st = self._cache_stat(name)
 
-        if not os.path.exists(cache_path):
+        if st is None:
             return 0
 
-        return time.time() - os.stat(cache_path).st_mtime
+        return time.time() - st.st_mtime
 
     def filter(self, query, items, key=lambda x: x, ascending=False,
                include_score=False, min_score=0, max_results=0,
-               match_on=MATCH_ALL, fold_diacritics=True):
+               match_on=MATCH_ALL, fold_diacritics=True, processes=0):
         """Fuzzy search filter. Returns list of ``items`` that match ``query``.
 
         ``query`` is case-insensitive. Any item that does not contain the
@@ -1769,11 +3384,12 @@ class Workflow(object):
 
         :param query: query to test items against
         :type query: ``unicode``
-        :param items: iterable of items to test
-        :type items: ``list`` or ``tuple``
+        :param items: iterable of items to test, or a :class:`FilterIndex`
+            of them
+        :type items: ``list``, ``tuple`` or :class:`FilterIndex`
         :param key: function to get comparison key from ``items``.
             Must return a ``unicode`` string. The default simply returns
-            the item.
+            the item. Ignored if ``items`` is a :class:`FilterIndex`.
         :type key: ``callable``
         :param ascending: set to ``True`` to get worst matches first
         :type ascending: ``Boolean``
@@ -1782,9 +3398,11 @@ class Workflow(object):
             ``(item, score, rule)``.
         :type include_score: ``Boolean``
         :param min_score: If non-zero, ignore results with a score lower
-            than this.
+            than this. They are dropped before the results are ranked.
         :type min_score: ``int``
         :param max_results: If non-zero, prune results list to this length.
+            Only the best ``max_results`` matches are kept while ranking,
+            so this is much cheaper than sorting every match.
         :type max_results: ``int``
         :param match_on: Filter option flags. Bitwise-combined list of
             ``MATCH_*`` constants (see below).
@@ -1792,6 +3410,13 @@ class Workflow(object):
         :param fold_diacritics: Convert search keys to ASCII-only
             characters if ``query`` only contains ASCII characters.
         :type fold_diacritics: ``Boolean``
+        :param processes: Number of worker processes to score ``items``
+            in. ``None`` starts one per CPU. The default, ``0``, scores
+            them in this process. Ignored if there are fewer than
+            :const:`PARALLEL_MIN_ITEMS` items or if fork isn't available.
+            ``items`` that aren't a sequence, e.g. a generator, are read
+            into a list first.
+        :type processes: ``int``
         :returns: list of ``items`` matching ``query`` or list of
             ``(item, score, rule)`` `tuples` if ``include_score`` is ``True``.
             ``rule`` is the ``MATCH_*`` rule that matched the item.
@@ -1828,14 +3453,14 @@ class Workflow(object):
             Combination of all the above.
 
 
-        :const:`MATCH_ALLCHARS` is considerably slower than the other
-        tests and provides much less accurate results.
+        :const:`MATCH_ALLCHARS` matches are scored by :func:`fuzzy_score`,
+        which favours characters at the start of words and in runs, and
+        never score more than :const:`FUZZY_MAX_SCORE`.
 
         **Examples:**
 
         To ignore :const:`MATCH_ALLCHARS` (tends to provide the worst
-        matches and is expensive to run), use
-        ``match_on=MATCH_ALL ^ MATCH_ALLCHARS``.
+        matches), use ``match_on=MATCH_ALL ^ MATCH_ALLCHARS``.
 
         To match only on capitals, use ``match_on=MATCH_CAPITALS``.
 
@@ -1857,63 +3482,334 @@ class Workflow(object):
         altered.
 
         """
+        # Remove preceding/trailing spaces
+        if query:
+            query = query.strip()
+
         if not query:
+            if isinstance(items, FilterIndex):
+                return items.items()
             return items
 
-        # Remove preceding/trailing spaces
-        query = query.strip()
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        if processes > 1 and not isinstance(items, (FilterIndex, list,
+                                                    tuple)):
+            # The workers need the length and to index the items
+            items = list(items)
+        if (processes > 1 and len(items) >= PARALLEL_MIN_ITEMS and
+                hasattr(os, 'fork')):
+            results = self._score_parallel(query, items, key, ascending,
+                                           max_results, match_on,
+                                           fold_diacritics, min_score,
+                                           processes)
+        else:
+            results = self._score_items(query, items, key, match_on,
+                                        fold_diacritics, min_score)
+        return self._rank(results, ascending, max_results, include_score)
+
+    def _score_parallel(self, query, items, key, ascending, max_results,
+                        match_on, fold_diacritics, min_score, processes):
+        """Score ``items`` in ``processes`` forked worker processes.
+
+        The items are split into one chunk per worker. Each worker ranks
+        its chunk as :meth:`_rank` would and sends back the best
+        ``max_results`` as positions in ``items``, which are swapped back
+        for the items here. As the best of the whole list are among the
+        best of each chunk, ranking the merged results gives the same
+        order as scoring every item in this process.
+
+        :returns: list of ``(sort key, (item, score, rule))``
+
+        """
+        # Imported here, as it slows down importing this module
+        import multiprocessing
+
+        # Read the user's override here, rather than have every worker
+        # load the settings file
+        fold_diacritics = self.settings.get('__workflow_diacritic_folding',
+                                            fold_diacritics)
+
+        if isinstance(items, FilterIndex):
+            words = [s.strip().lower() for s in query.split(' ')]
+            selected = [i for i, _ in
+                        items.candidates([w for w in words if w], match_on)]
+            item_at = lambda i: items.entries[i][0]
+        else:
+            selected = range(len(items))
+            item_at = items.__getitem__
+        if not selected:
+            return []
+
+        job = (self, query, items, key, ascending, max_results, match_on,
+               fold_diacritics, min_score)
+        size = -(-len(selected) // processes)
+        # Workers flush stdout when they exit, which would repeat
+        # anything still in its buffer
+        sys.stdout.flush()
+        workers = []
+        try:
+            for start in xrange(0, len(selected), size):
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                # Forked, so the arguments are inherited, not pickled
+                worker = multiprocessing.Process(
+                    target=_score_chunk,
+                    args=(writer, job, selected[start:start + size]))
+                worker.daemon = True
+                worker.start()
+                writer.close()
+                workers.append((worker, reader))
+
+            scored = []
+            for worker, reader in workers:
+                ok, results = reader.recv()
+                if not ok:
+                    raise RuntimeError(
+                        'filter worker failed:\n{0}'.format(results))
+                scored.extend(results)
+        finally:
+            for worker, reader in workers:
+                reader.close()
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+        return [(sortkey, (item_at(i), score, rule))
+                for sortkey, i, score, rule in scored]
+
+    def _rank(self, results, ascending, max_results, include_score):
+        """Sort scored items into the list :meth:`filter` returns.
+
+        :param results: iterable of ``(sort key, (item, score, rule))``
+
+        """
+        # sort on keys, then discard the keys
+        if max_results:
+            # Same order as sorting every match, but only the best
+            # `max_results` are held on to while ranking
+            select = heapq.nlargest if ascending else heapq.nsmallest
+            results = select(max_results, results)
+        else:
+            results = sorted(results, reverse=ascending)
+        results = [t[1] for t in results]
+
+        # return list of ``(item, score, rule)``
+        if include_score:
+            return results
+        # just return list of items
+        return [t[0] for t in results]
+
+    def ifilter(self, query, items, key=lambda x: x, include_score=False,
+                min_score=0, max_results=0, match_on=MATCH_ALL,
+                fold_diacritics=True, stop_on=MATCH_STARTSWITH):
+        """Fuzzy search filter that yields matches as they are found.
+
+        Takes the same arguments as :meth:`filter`, but matches are not
+        ranked: they are yielded in the order of ``items``. Once
+        ``max_results`` matches by one of the ``stop_on`` rules have been
+        yielded, the remaining items are not tested at all.
+
+        Use this when ``items`` is already in a useful order (e.g. most
+        recently used first) and a few strong matches are enough.
+
+        :param stop_on: ``MATCH_*`` rules that count towards
+            ``max_results``. Default is :const:`MATCH_STARTSWITH`.
+        :type stop_on: ``int``
+        :returns: generator of ``items`` matching ``query`` or of
+            ``(item, score, rule)`` `tuples` if ``include_score`` is ``True``.
+
+        """
+        if query:
+            query = query.strip()
 
         if not query:
-            return items
+            if isinstance(items, FilterIndex):
+                items = items.items()
+            for item in items:
+                yield item
+            return
+
+        strong = 0
+        for _, result in self._score_items(query, items, key, match_on,
+                                           fold_diacritics, min_score):
+            yield result if include_score else result[0]
+            if max_results and result[2] & stop_on:
+                strong += 1
+                if strong >= max_results:
+                    return
+
+    def filter_many(self, queries, items, key=lambda x: x, ascending=False,
+                    include_score=False, min_score=0, max_results=0,
+                    match_on=MATCH_ALL, fold_diacritics=True):
+        """Filter ``items`` against each of ``queries`` in a single pass.
+
+        Returns the same as calling :meth:`filter` once per query with
+        the same arguments, but each item's search key is only fetched,
+        folded and lowercased once, however many queries it is tested
+        against.
+
+        :param queries: queries to test items against
+        :type queries: ``list`` of ``unicode``
+        :returns: a list of results for each query, as :meth:`filter`
+            returns them
+        :rtype: ``list``
+
+        See :meth:`filter` for the other arguments.
+
+        """
+        # Use user override if there is one
+        fold_diacritics = self.settings.get('__workflow_diacritic_folding',
+                                            fold_diacritics)
+
+        # Lowercase words of each query, with whether keys are folded
+        # for them, as `_filter_item` works out per item
+        parsed = []
+        for query in queries:
+            words = [s.strip() for s in (query or '').split(' ')]
+            parsed.append([(word.lower(), fold_diacritics and isascii(word))
+                           for word in words if word])
+        pending = [(i, words) for i, words in enumerate(parsed) if words]
+        scored = [[] for _ in queries]
+        match_features = self._match_features
+
+        def score_queries(item, lower, features_for):
+            for i, words in pending:
+                score = 0
+                for word, fold in words:
+                    features = features_for(fold, word)
+                    if features is None:
+                        break
+                    s, rule = match_features(features, word, match_on)
+                    if not s:
+                        break
+                    score += s
+                else:
+                    if score and (not min_score or score > min_score):
+                        scored[i].append(((100.0 / score, lower, score),
+                                          (item, score, rule)))
 
+        if pending and isinstance(items, FilterIndex):
+            for entry in items.entries:
+                if entry is None:
+                    continue
+                item, features, folded_features = entry
+                score_queries(item, features[1],
+                              lambda fold, _: (folded_features if fold
+                                               else features))
+
+        elif pending:
+            for item in items:
+                value = key(item).strip()
+                if value == '':
+                    continue
+                # ``[characters, features]`` of the key, unfolded and
+                # folded. Features are only worked out for keys that
+                # contain every character of a word.
+                variants = {}
+
+                def features_for(fold, word):
+                    variant = variants.get(fold)
+                    if variant is None:
+                        folded = fold_to_ascii(value) if fold else value
+                        variant = variants[fold] = [
+                            frozenset(folded.lower()), folded]
+                    if not variant[0].issuperset(word):
+                        return None
+                    if not isinstance(variant[1], tuple):
+                        variant[1] = search_features(variant[1])
+                    return variant[1]
+
+                score_queries(item, value.lower(), features_for)
+
+        if isinstance(items, FilterIndex):
+            everything = items.items()
+        else:
+            everything = items
+        return [self._rank(results, ascending, max_results, include_score)
+                if words else everything
+                for results, words in zip(scored, parsed)]
+
+    def _score_items(self, query, items, key, match_on, fold_diacritics,
+                     min_score):
+        """Score ``items`` (a list or a :class:`FilterIndex`) against
+        stripped ``query``.
+
+        :returns: generator of ``(sort key, (item, score, rule))`` for
+            items that match with a score over ``min_score``
+
+        """
         # Use user override if there is one
         fold_diacritics = self.settings.get('__workflow_diacritic_folding',
                                             fold_diacritics)
 
-        results = []
+        words = [s.strip() for s in query.split(' ')]
+        words = [word for word in words if word != '']
+
+        if isinstance(items, FilterIndex):
+            return self._filter_index(items, words, match_on,
+                                      fold_diacritics, min_score)
+        return self._filter_items(items, key, words, match_on,
+                                  fold_diacritics, min_score)
 
+    def _filter_items(self, items, key, words, match_on, fold_diacritics,
+                      min_score):
+        """Score ``items`` against every word in ``words``.
+
+        :returns: generator of ``(sort key, (item, score, rule))``
+
+        """
         for item in items:
             skip = False
             score = 0
-            words = [s.strip() for s in query.split(' ')]
             value = key(item).strip()
             if value == '':
                 continue
             for word in words:
-                if word == '':
-                    continue
                 s, rule = self._filter_item(value, word, match_on,
                                             fold_diacritics)
 
                 if not s:  # Skip items that don't match part of the query
                     skip = True
+                    break
                 score += s
 
             if skip:
                 continue
 
-            if score:
+            if score and (not min_score or score > min_score):
                 # use "reversed" `score` (i.e. highest becomes lowest) and
                 # `value` as sort key. This means items with the same score
                 # will be sorted in alphabetical not reverse alphabetical order
-                results.append(((100.0 / score, value.lower(), score),
-                                (item, score, rule)))
-
-        # sort on keys, then discard the keys
-        results.sort(reverse=ascending)
-        results = [t[1] for t in results]
+                yield ((100.0 / score, value.lower(), score),
+                       (item, score, rule))
 
-        if min_score:
-            results = [r for r in results if r[1] > min_score]
+    def _filter_index(self, index, words, match_on, fold_diacritics,
+                      min_score):
+        """Score the items in ``index`` against every word in ``words``.
 
-        if max_results and len(results) > max_results:
-            results = results[:max_results]
+        :returns: generator of ``(sort key, (item, score, rule))``
 
-        # return list of ``(item, score, rule)``
-        if include_score:
-            return results
-        # just return list of items
-        return [t[0] for t in results]
+        """
+        # Lowercase each word once, and work out whether keys are
+        # folded for it, as `_filter_item` does per item
+        words = [(word.lower(), fold_diacritics and isascii(word))
+                 for word in words]
+        match_features = self._match_features
+
+        candidates = index.candidates([word for word, _ in words], match_on)
+        for _, (item, features, folded_features) in candidates:
+            score = 0
+            for word, fold in words:
+                s, rule = match_features(
+                    folded_features if fold else features, word, match_on)
+                if not s:
+                    break
+                score += s
+            else:
+                if score and (not min_score or score > min_score):
+                    yield ((100.0 / score, features[1], score),
+                           (item, score, rule))
 
     def _filter_item(self, value, query, match_on, fold_diacritics):
         """Filter ``value`` against ``query`` using rules ``match_on``.
@@ -1931,12 +3827,39 @@ class Workflow(object):
 
         # pre-filter any items that do not contain all characters
         # of ``query`` to save on running several more expensive tests
-        if not set(query) <= set(value.lower()):
+        lower = value.lower()
+        if not set(query) <= set(lower):
+
+            return (0, None)
+
+        # item starts with query; checked before working out the rest
+        # of the item's search features, as it needs none of them
+        if match_on & MATCH_STARTSWITH and lower.startswith(query):
+            score = 100.0 - (len(value) / len(query))
+
+            return (score, MATCH_STARTSWITH)
+
+        return self._match_features(search_features(value), query, match_on)
+
+    def _match_features(self, features, query, match_on):
+        """Match lowercase ``query`` against an item's search features
+        using rules ``match_on``.
+
+        :param features: as returned by :func:`search_features`
+        :type features: ``tuple``
+        :returns: ``(score, rule)``
+
+        """
+        value, lower, chars, capitals, atoms, initials = features
+
+        # pre-filter any items that do not contain all characters
+        # of ``query`` to save on running several more expensive tests
+        if not chars.issuperset(query):
 
             return (0, None)
 
         # item starts with query
-        if match_on & MATCH_STARTSWITH and value.lower().startswith(query):
+        if match_on & MATCH_STARTSWITH and lower.startswith(query):
             score = 100.0 - (len(value) / len(query))
 
             return (score, MATCH_STARTSWITH)
@@ -1944,22 +3867,11 @@ class Workflow(object):
         # query matches capitalised letters in item,
         # e.g. of = OmniFocus
         if match_on & MATCH_CAPITALS:
-            initials = ''.join([c for c in value if c in INITIALS])
-            if initials.lower().startswith(query):
-                score = 100.0 - (len(initials) / len(query))
+            if capitals.startswith(query):
+                score = 100.0 - (len(capitals) / len(query))
 
                 return (score, MATCH_CAPITALS)
 
-        # split the item into "atoms", i.e. words separated by
-        # spaces or other non-word characters
-        if (match_on & MATCH_ATOM or
-                match_on & MATCH_INITIALS_CONTAIN or
-                match_on & MATCH_INITIALS_STARTSWITH):
-            atoms = [s.lower() for s in split_on_delimiters(value)]
-            # print('atoms : %s  -->  %s' % (value, atoms))
-            # initials of the atoms
-            initials = ''.join([s[0] for s in atoms if s])
-
         if match_on & MATCH_ATOM:
             # is `query` one of the atoms in item?
             # similar to substring, but scores more highly, as it's
@@ -1988,40 +3900,22 @@ class Workflow(object):
             return (score, MATCH_INITIALS_CONTAIN)
 
         # `query` is a substring of item
-        if match_on & MATCH_SUBSTRING and query in value.lower():
+        if match_on & MATCH_SUBSTRING and query in lower:
             score = 90.0 - (len(value) / len(query))
 
             return (score, MATCH_SUBSTRING)
 
-        # finally, assign a score based on how close together the
-        # characters in `query` are in item.
+        # finally, all characters of `query` appear in item in order;
+        # score how well they line up with item's words.
         if match_on & MATCH_ALLCHARS:
-            search = self._search_for_query(query)
-            match = search(value)
-            if match:
-                score = 100.0 / ((1 + match.start()) *
-                                 (match.end() - match.start() + 1))
+            score = fuzzy_score(value, lower, query)
+            if score:
 
                 return (score, MATCH_ALLCHARS)
 
         # Nothing matched
         return (0, None)
 
-    def _search_for_query(self, query):
-        if query in self._search_pattern_cache:
-            return self._search_pattern_cache[query]
-
-        # Build pattern: include all characters
-        pattern = []
-        for c in query:
-            # pattern.append('[^{0}]*{0}'.format(re.escape(c)))
-            pattern.append('.*?{0}'.format(re.escape(c)))
-        pattern = ''.join(pattern)
-        search = re.compile(pattern, re.IGNORECASE).search
-
-        self._search_pattern_cache[query] = search
-        return search
-
     def run(self, func, text_errors=False):
         """Call ``func`` to run your workflow.
 
@@ -2043,6 +3937,13 @@ class Workflow(object):
 
         """
         start = time.time()
+        self._running = True
+
+        # A run in a long-lived process, e.g. a daemon, opens databases
+        # deleted or replaced since the last run again
+        for store in (self.data_store, self.cache_store):
+            if store is not None:
+                store.check()
 
         # Write to debugger to ensure "real" output starts on a new line
         print('.', file=sys.stderr)
@@ -2093,11 +3994,55 @@ class Workflow(object):
             return 1
 
         finally:
+            self._running = False
+            try:
+                self.flush_writes(detach=True)
+            except Exception as err:
+                self.logger.exception('could not write files: %s', err)
+            self._tend_cache()
             self.logger.debug('---------- finished in %0.3fs ----------',
                               time.time() - start)
 
         return 0
 
+    def _tend_cache(self):
+        """Record the cache files read this run and start the cache
+        janitor if it's due.
+
+        Only reads of files not modified within
+        :attr:`cache_janitor_interval` are recorded, so a run that only
+        reads fresh caches or writes doesn't touch the access log.
+
+        Does nothing unless a cache budget (:attr:`cache_max_bytes`,
+        :attr:`cache_max_entries` or :attr:`cache_max_age`) is set.
+        Errors are logged, not raised.
+
+        """
+        limits = (self.cache_max_bytes, self.cache_max_entries,
+                  self.cache_max_age)
+        if all(limit is None for limit in limits):
+            return
+
+        import janitor
+
+        try:
+            accesses, self._cache_accesses = self._cache_accesses, {}
+            janitor.record_access(self.cachedir, accesses)
+
+            last_run = janitor.last_run(self.cachedir)
+            if (last_run is not None and
+                    time.time() - last_run < self.cache_janitor_interval):
+                return
+
+            from background import run_in_background
+
+            cmd = [sys.executable, os.path.splitext(janitor.__file__)[0] +
+                   '.py', self.cachedir]
+            cmd += ['-' if limit is None else str(limit) for limit in limits]
+            run_in_background('__workflow_cache_janitor', cmd)
+        except Exception as err:
+            self.logger.exception('cache janitor failed: %s', err)
+
     # Alfred feedback methods ------------------------------------------
 
     def add_item(self, title, subtitle='', modifier_subtitles=None, arg=None,
@@ -2380,6 +4325,48 @@ class Workflow(object):
     # Keychain password storage methods
     ####################################################################
 
+    @property
+    def secret_backend(self):
+        """Backend used to save, get and delete passwords.
+
+        By default, a :class:`KeychainBackend`. If
+        :attr:`password_cache_ttl` is set, it is wrapped in a
+        :class:`CachingBackend` whose cache file is in :attr:`cachedir`.
+
+        Set this to any object with ``save(service, account, password)``,
+        ``get(service, account)`` and ``delete(service, account)``
+        methods to store passwords elsewhere.
+
+        """
+        if self._secret_backend is None:
+            backend = KeychainBackend(self._call_security)
+            if self.password_cache_ttl:
+                backend = CachingBackend(
+                    backend, self.cachefile(self._password_cache_name),
+                    self.password_cache_ttl)
+                self._remove_stale_password_caches()
+            self._secret_backend = backend
+
+        return self._secret_backend
+
+    @secret_backend.setter
+    def secret_backend(self, backend):
+        """Set backend used to store passwords."""
+        self._secret_backend = backend
+
+    @property
+    def _password_cache_name(self):
+        """Filename of password cache in :attr:`cachedir`."""
+        return '.passwords.json'
+
+    def _remove_stale_password_caches(self):
+        """Remove password caches no other run will read.
+
+        :class:`Workflow` has a single cache file, which drops expired
+        entries itself. See :class:`~workflow.Workflow3`.
+
+        """
+
     def save_password(self, account, password, service=None):
         """Save account credentials.
 
@@ -2402,23 +4389,8 @@ class Workflow(object):
         if not service:
             service = self.bundleid
 
-        try:
-            self._call_security('add-generic-password', service, account,
-                                '-w', password)
-            self.logger.debug('saved password : %s:%s', service, account)
-
-        except PasswordExists:
-            self.logger.debug('password exists : %s:%s', service, account)
-            current_password = self.get_password(account, service)
-
-            if current_password == password:
-                self.logger.debug('password unchanged')
-
-            else:
-                self.delete_password(account, service)
-                self._call_security('add-generic-password', service,
-                                    account, '-w', password)
-                self.logger.debug('save_password : %s:%s', service, account)
+        self.secret_backend.save(service, account, password)
+        self.logger.debug('saved password : %s:%s', service, account)
 
     def get_password(self, account, service=None):
         """Retrieve the password saved at ``service/account``.
@@ -2438,22 +4410,7 @@ class Workflow(object):
         if not service:
             service = self.bundleid
 
-        output = self._call_security('find-generic-password', service,
-                                     account, '-g')
-
-        # Parsing of `security` output is adapted from python-keyring
-        # by Jason R. Coombs
-        # https://pypi.python.org/pypi/keyring
-        m = re.search(
-            r'password:\s*(?:0x(?P<hex>[0-9A-F]+)\s*)?(?:"(?P<pw>.*)")?',
-            output)
-
-        if m:
-            groups = m.groupdict()
-            h = groups.get('hex')
-            password = groups.get('pw')
-            if h:
-                password = unicode(binascii.unhexlify(h), 'utf-8')
+        password = self.secret_backend.get(service, account)
 
         self.logger.debug('got password : %s:%s', service, account)
 
@@ -2475,7 +4432,7 @@ class Workflow(object):
         if not service:
             service = self.bundleid
 
-        self._call_security('delete-generic-password', service, account)
+        self.secret_backend.delete(service, account)
 
         self.logger.debug('deleted password : %s:%s', service, account)
 
@@ -2602,8 +4559,13 @@ class Workflow(object):
             the file will be deleted.
             By default, *all* files will be deleted.
         :type filter_func: ``callable``
+
+        If :attr:`cache_store` is set, ``filter_func`` is also called with
+        the filename each value in it would have, and the values it
+        returns ``True`` for are deleted. The database itself is kept.
         """
-        self._delete_directory_contents(self.cachedir, filter_func)
+        self._delete_directory_contents(self.cachedir, filter_func,
+                                        self.cache_store)
 
     def clear_data(self, filter_func=lambda f: True):
         """Delete all files in workflow's :attr:`datadir`.
@@ -2614,11 +4576,17 @@ class Workflow(object):
             the file will be deleted.
             By default, *all* files will be deleted.
         :type filter_func: ``callable``
+
+        If :attr:`data_store` is set, ``filter_func`` is also called with
+        the filename each value in it would have, and the values it
+        returns ``True`` for are deleted. The database itself is kept.
         """
-        self._delete_directory_contents(self.datadir, filter_func)
+        self._delete_directory_contents(self.datadir, filter_func,
+                                        self.data_store)
 
     def clear_settings(self):
         """Delete workflow's :attr:`settings_path`."""
+        self._pending_writes.pop(self.settings_path, None)
         if os.path.exists(self.settings_path):
             os.unlink(self.settings_path)
             self.logger.debug('deleted : %r', self.settings_path)
@@ -2712,11 +4680,7 @@ class Workflow(object):
         :rtype: ``unicode``
 
         """
-        if isascii(text):
-            return text
-        text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
-        return unicode(unicodedata.normalize('NFKD',
-                       text).encode('ascii', 'ignore'))
+        return fold_to_ascii(text)
 
     def dumbify_punctuation(self, text):
         """Convert non-ASCII punctuation to closest ASCII equivalent.
@@ -2739,7 +4703,7 @@ class Workflow(object):
         text = ''.join([DUMB_PUNCTUATION.get(c, c) for c in text])
         return text
 
-    def _delete_directory_contents(self, dirpath, filter_func):
+    def _delete_directory_contents(self, dirpath, filter_func, store=None):
         """Delete all files in a directory.
 
         :param dirpath: path to directory to clear
@@ -2747,11 +4711,26 @@ class Workflow(object):
         :param filter_func function to determine whether a file shall be
             deleted or not.
         :type filter_func ``callable``
+        :param store: :class:`SQLiteStore` in ``dirpath`` to delete
+            values from instead of deleting its database
+        :type store: :class:`SQLiteStore`
 
         """
+        keep = ()
+        if store is not None:
+            store.delete_matching(filter_func)
+            database = os.path.basename(store.filepath)
+            keep = (database, database + '-wal', database + '-shm')
+
+        for path in list(self._pending_writes):
+            filename = os.path.basename(path)
+            if (os.path.dirname(path) == dirpath and filename not in keep and
+                    filter_func(filename)):
+                del self._pending_writes[path]
+
         if os.path.exists(dirpath):
             for filename in os.listdir(dirpath):
-                if not filter_func(filename):
+                if filename in keep or not filter_func(filename):
                     continue
                 path = os.path.join(dirpath, filename)
                 if os.path.isdir(path):
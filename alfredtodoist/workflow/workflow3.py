@@ -28,8 +28,18 @@ from __future__ import print_function, unicode_literals, absolute_import
 import json
 import os
 import sys
+import time
 
-from .workflow import ICON_WARNING, Workflow
+from .workflow import (
+    ICON_WARNING,
+    MATCH_ALL,
+    MATCH_ALLCHARS,
+    MATCH_ATOM,
+    MATCH_SUBSTRING,
+    FilterIndex,
+    Workflow,
+    isascii,
+)
 
 
 class Variables(dict):
@@ -598,6 +608,34 @@ class Workflow3(Workflow):
         """New cache name/key based on session ID."""
         return self._session_prefix + name
 
+    @property
+    def _password_cache_name(self):
+        """Password cache is scoped to the current session."""
+        return self._mk_session_name('passwords.json')
+
+    def _remove_stale_password_caches(self):
+        """Remove the password caches of past sessions.
+
+        A new session has a new cache file, so the files of past
+        sessions would keep the password on disk until the session
+        cache is cleared. A file last written more than
+        :attr:`password_cache_ttl` seconds ago only holds expired
+        entries and is removed.
+
+        """
+        cutoff = time.time() - self.password_cache_ttl
+        for filename in os.listdir(self.cachedir):
+            if (not filename.startswith('_wfsess-') or
+                    not filename.endswith('-passwords.json') or
+                    filename == self._password_cache_name):
+                continue
+            path = self.cachefile(filename)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+            except OSError:  # removed by another run
+                pass
+
     def cache_data(self, name, data, session=False):
         """Cache API with session-scoped expiry.
 
@@ -622,7 +660,8 @@ class Workflow3(Workflow):
 
         return super(Workflow3, self).cache_data(name, data)
 
-    def cached_data(self, name, data_func=None, max_age=60, session=False):
+    def cached_data(self, name, data_func=None, max_age=60, session=False,
+                    stale_ok=False, refresh=None):
         """Cache API with session-scoped expiry.
 
         .. versionadded:: 1.25
@@ -634,8 +673,12 @@ class Workflow3(Workflow):
             max_age (int): Maximum allowable age of cache in seconds.
             session (bool, optional): Whether to scope the cache
                 to the current session.
+            stale_ok (bool, optional): Return stale data and run
+                ``refresh`` in the background.
+            refresh (list, optional): Command that updates the cache.
 
-        ``name``, ``data_func`` and ``max_age`` are the same as for the
+        ``name``, ``data_func``, ``max_age``, ``stale_ok`` and
+        ``refresh`` are the same as for the
         :meth:`~workflow.Workflow.cached_data` method on
         :class:`~workflow.Workflow`.
 
@@ -646,7 +689,134 @@ class Workflow3(Workflow):
         if session:
             name = self._mk_session_name(name)
 
-        return super(Workflow3, self).cached_data(name, data_func, max_age)
+        return super(Workflow3, self).cached_data(name, data_func, max_age,
+                                                  stale_ok, refresh)
+
+    def cache_refreshing(self, name, session=False):
+        """Whether a cache is being refreshed in the background.
+
+        Args:
+            name (str): Cache key
+            session (bool, optional): Whether the cache is scoped
+                to the current session.
+
+        Returns:
+            bool: ``True`` if the refresh started by
+                :meth:`cached_data` is still running.
+
+        """
+        if session:
+            name = self._mk_session_name(name)
+
+        return super(Workflow3, self).cache_refreshing(name)
+
+    def filter(self, query, items, key=lambda x: x, ascending=False,
+               include_score=False, min_score=0, max_results=0,
+               match_on=MATCH_ALL, fold_diacritics=True, processes=0,
+               incremental=None):
+        """Fuzzy search filter that can refine the previous query's results.
+
+        Takes the same arguments as :meth:`~workflow.Workflow.filter`,
+        plus ``incremental``.
+
+        Args:
+            incremental (str, optional): Name of the list of ``items``.
+                If set, the positions of the matching items are saved in
+                the session cache under this name. When the next query
+                extends this one (``gr``, then ``gro``), only those items
+                are tested. Any other query, e.g. after a backspace, tests
+                every item again.
+
+        A hash of the search keys of ``items`` is saved with the
+        positions, so if the list has changed since (e.g. an item was
+        renamed, even if the length is the same), every item is tested
+        again. Items are always scored in this process when
+        ``incremental`` is set, so ``processes`` is ignored.
+
+        """
+        if not incremental or not query or not query.strip():
+            return super(Workflow3, self).filter(
+                query, items, key, ascending, include_score, min_score,
+                max_results, match_on, fold_diacritics, processes)
+
+        query = query.strip()
+        fold_diacritics = self.settings.get('__workflow_diacritic_folding',
+                                            fold_diacritics)
+        name = 'filter-{0}'.format(incremental)
+        if isinstance(items, FilterIndex):
+            # A removed item leaves a gap, which changes the hash too
+            keys = tuple(entry and entry[1][0] for entry in items.entries)
+        else:
+            keys = tuple(key(item) for item in items)
+        state = {
+            'query': query,
+            'count': len(keys),
+            # Cheaper to compare than the keys, and much smaller to save
+            'keys_hash': hash(keys),
+            'match_on': match_on,
+            'fold_diacritics': fold_diacritics,
+        }
+        previous = self.cached_data(name, max_age=0, session=True)
+        selected = None
+        if self._refines(previous, state):
+            selected = previous['positions']
+            self.logger.debug('refining %d of %d items for %r', len(selected),
+                              len(items), query)
+
+        # Score positions, which are mapped back to items once the
+        # matching positions are saved
+        if isinstance(items, FilterIndex):
+            candidates = items.positions(selected)
+            entries = items.entries
+
+            def item_at(position):
+                return entries[position][0]
+
+            candidate_key = None
+        else:
+            if selected is None:
+                selected = xrange(len(items))
+            candidates = selected
+
+            def item_at(position):
+                return items[position]
+
+            def candidate_key(position):
+                return keys[position]
+
+        scored = list(self._score_items(query, candidates, candidate_key,
+                                        match_on, fold_diacritics, 0))
+        state['positions'] = [result[1][0] for result in scored]
+        self.cache_data(name, state, session=True)
+
+        results = ((sort_key, (item_at(position), score, rule))
+                   for sort_key, (position, score, rule) in scored
+                   if not min_score or score > min_score)
+        return self._rank(results, ascending, max_results, include_score)
+
+    def _refines(self, previous, state):
+        """Whether every item matching ``state['query']`` also matched
+        ``previous['query']``, so only ``previous['positions']`` need to
+        be tested.
+
+        """
+        if not previous:
+            return False
+        for key in ('count', 'keys_hash', 'match_on', 'fold_diacritics'):
+            if previous.get(key) != state[key]:
+                return False
+        if not state['query'].startswith(previous['query']):
+            return False
+        # An item can match an extended word as an atom without the
+        # shorter word being an atom. It is still a substring, though.
+        match_on = state['match_on']
+        if (match_on & MATCH_ATOM and
+                not match_on & (MATCH_SUBSTRING | MATCH_ALLCHARS)):
+            return False
+        # Keys are only folded for ASCII words, so a word that gains a
+        # non-ASCII character is matched against different keys.
+        words = zip(previous['query'].split(' '), state['query'].split(' '))
+        return all(isascii(old) == isascii(new) for old, new in words)
 
     def clear_session_cache(self, current=False):
         """Remove session data from the cache.
@@ -668,6 +838,12 @@ class Workflow3(Workflow):
             return filename.startswith('_wfsess-') \
                 and not filename.startswith(self._session_prefix)
 
+        if self.cache_store is not None:
+            # Deleted by prefix first, so `clear_cache` finds none left
+            # to test one by one
+            self.cache_store.delete_prefix(
+                '_wfsess-', keep=None if current else self._session_prefix)
+
         self.clear_cache(_is_session_file)
 
     @property
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+
+from mock import Mock
+
+import pytest
+
+
+class FakeWorkflow():
+	"""
+	Stands in for `Workflow3`: keeps `store_data` in memory and puts data
+	files in `datadir`.
+	"""
+	def __init__(self, datadir):
+		self.datadir = datadir
+		self.stored = {}
+		self.logger = Mock()
+
+	def datafile(self, filename):
+		return os.path.join(self.datadir, filename)
+
+	def stored_data(self, name):
+		return self.stored.get(name)
+
+	def store_data(self, name, data):
+		self.stored[name] = data
+
+
+@pytest.fixture
+def fake_wf(tmpdir):
+	return FakeWorkflow(str(tmpdir))
+
+
+@pytest.fixture
+def accepting_api():
+	"""An api whose commit accepts every queued command."""
+	api = Mock()
+	api.queue = []
+	api.requests = []
+
+	def commit(raise_on_error=True):
+		commands = list(api.queue)
+		del api.queue[:]
+		api.requests.append(commands)
+		return {'sync_status': {cmd['uuid']: 'ok' for cmd in commands}}
+
+	api.commit.side_effect = commit
+	return api
@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import timeit
+
 from mock import Mock
 
 import pytest
 
 from alfredtodoist.addtask import (
-	INBOX_ID,
+	INBOX_ID, NameResolver,
 	label_ids_from_names, project_id_from_name, convert_priority,
-	build_api_payload, create_task
+	build_api_payload
 	)
 
 
@@ -96,6 +98,72 @@ class TestGettingProjectID():
 		assert proj_id == INBOX_ID
 
 
+@pytest.mark.usefixtures("TodoistAccount", "existing_labels")
+class TestNameResolver():
+	def test_Resolve_GivenDifferentCase_ReturnsId(self):
+		api = TodoistAccount()
+		api.state = {'labels': existing_labels()}
+		assert NameResolver('labels').resolve('Errands', api) == 1
+
+	def test_Resolve_GivenExactAndFoldedMatches_PrefersExact(self):
+		api = TodoistAccount()
+		api.state = {'labels': [
+			{'id': 1, 'name': 'Errands'},
+			{'id': 2, 'name': 'errands'}
+		]}
+		resolver = NameResolver('labels')
+		assert resolver.resolve('errands', api) == 2
+		assert resolver.resolve('ERRANDS', api) == 1
+
+	def test_Resolve_GivenUnchangedState_DoesNotRebuildIndex(self):
+		api = TodoistAccount()
+		api.state = {'labels': existing_labels()}
+		resolver = NameResolver('labels')
+		resolver.resolve('errands', api)
+		index = resolver.exact
+		resolver.resolve('shopping', api)
+		assert resolver.exact is index
+
+	def test_Resolve_GivenNewSyncToken_RebuildsIndex(self):
+		api = TodoistAccount()
+		api.sync_token = 'a'
+		api.state = {'labels': existing_labels()}
+		resolver = NameResolver('labels')
+		resolver.resolve('errands', api)
+		api.state['labels'][0]['name'] = 'chores'
+		api.sync_token = 'b'
+		assert resolver.resolve('chores', api) == 1
+		assert resolver.resolve('errands', api) is None
+
+
+@pytest.mark.performance
+def test_LabelIdsFromNames_Given10kLabels_IsFasterThanLinearScan():
+	api = Mock()
+	api.state = {
+		'labels': [{'id': i, 'name': 'label%d' % i} for i in range(10000)],
+		'projects': [{'id': i, 'name': 'project%d' % i} for i in range(10000)],
+	}
+	names = ['label%d' % i for i in range(0, 10000, 2000)]
+
+	def linear():
+		labels = api.state['labels']
+		[label['id'] for label in labels if label['name'] in names]
+		for project in api.state['projects']:
+			if project['name'] == 'project9999':
+				break
+
+	def indexed():
+		label_ids_from_names(names, api)
+		project_id_from_name('project9999', api)
+
+	build_time = timeit.timeit(indexed, number=1)
+	indexed_time = min(timeit.repeat(indexed, number=20, repeat=5))
+	linear_time = min(timeit.repeat(linear, number=20, repeat=5))
+	print('index build: {:.2f}ms, indexed: {:.3f}ms, linear: {:.2f}ms'.format(
+		build_time * 1000, indexed_time * 1000, linear_time * 1000))
+	assert indexed_time * 10 < linear_time
+
+
 @pytest.mark.usefixtures("TodoistAccount")
 class TestPriorityConversion():
 	def test_ConvertPriority_GivenUiValues_ReturnsApiValues(self):
@@ -117,74 +185,35 @@ class TestPriorityConversion():
 		assert convert_priority(0) == 1
 
 
-@pytest.mark.usefixtures("TodoistAccount", "DummyTask", "existing_labels", "existing_projects")
+@pytest.mark.usefixtures("DummyTask", "existing_labels", "existing_projects")
 class TestApiCalls():
+	def mirror(self, labels=(), projects=()):
+		mirror = Mock()
+		mirror.state = {'labels': list(labels), 'projects': list(projects)}
+		return mirror
+
 	def test_BuildApiPayload_NoLabelsOrProjects_DoesNotSync(self):
-		api = TodoistAccount()
-		task = DummyTask()
-		build_api_payload(task, api)
-		api.sync.assert_not_called()
+		mirror = self.mirror()
+		build_api_payload(DummyTask(), mirror)
+		mirror.ensure.assert_not_called()
 
-	def test_BuildApiPayload_LabelsButNoProjects_ShouldSync(self):
-		api = TodoistAccount()
-		api.state = {'labels': existing_labels(), 'projects': []}
+	def test_BuildApiPayload_LabelsButNoProjects_EnsuresLabels(self):
+		mirror = self.mirror(labels=existing_labels())
 		task = DummyTask()
 		task.update({'labels': ['errands']})
-		build_api_payload(task, api)
-		api.sync.assert_called()
+		assert build_api_payload(task, mirror)['labels'] == [1]
+		mirror.ensure.assert_called_with(['errands'], [])
 
-	def test_BuildApiPayload_ProjectButNoLabels_ShouldSync(self):
-		api = TodoistAccount()
-		api.state = {'labels': [], 'projects': existing_projects()}
+	def test_BuildApiPayload_ProjectButNoLabels_EnsuresProject(self):
+		mirror = self.mirror(projects=existing_projects())
 		task = DummyTask()
-		task.update({'project': 'a project'})
-		build_api_payload(task, api)
-		api.sync.assert_called()
+		task.update({'project': 'hang shelves'})
+		assert build_api_payload(task, mirror)['project'] == 2
+		mirror.ensure.assert_called_with([], ['hang shelves'])
 
-	def test_BuildApiPayload_BothProjectAndLabels_ShouldSync(self):
-		api = TodoistAccount()
-		api.state = {'labels': existing_labels(), 'projects': existing_projects()}
+	def test_BuildApiPayload_BothProjectAndLabels_EnsuresBoth(self):
+		mirror = self.mirror(existing_labels(), existing_projects())
 		task = DummyTask()
 		task.update({'labels': ['errands'], 'project': 'a project'})
-		build_api_payload(task, api)
-		api.sync.assert_called()
-
-	def test_CreateTask_GivenNoPayload_CallsApiWithEmptyPayload(self):
-		api = TodoistAccount()
-		create_task('test todo', 0, api)
-		api.items.add.assert_called_with('test todo', 0)
-
-	def test_CreateTask_GivenPayload_CallsApiWithPayload(self):
-		api = TodoistAccount()
-		payload = {
-			'labels': [1],
-			'priority': 1,
-			'date_string': ''
-		}
-		create_task('test todo', 0, api, additional_properties=payload)
-		api.items.add.assert_called_with('test todo', 0,
-			labels=[1], priority=1, date_string='')
-
-	def test_CreateTask_GivenSingleNote_AddsNoteAfterCreatingTask(self):
-		api = TodoistAccount()
-		api.items.add.return_value = {'id': 1}
-		create_task('test todo', 0, api, notes=['a note'])
-		api.notes.add.assert_called_with(1, 'a note')
-		api.commit.assert_called()
-
-	def test_CreateTask_GivenMultipleNotes_AddsMultipleNotesAfterCreatingTask(self):
-		api = TodoistAccount()
-		api.items.add.return_value = {'id': 1}
-		create_task('test todo', 0, api, notes=['a note', 'second note'])
-		api.notes.add.assert_any_call(1, 'a note')
-		api.notes.add.assert_any_call(1, 'second note')
-		assert api.notes.add.call_count == 2
-		api.commit.assert_called()
-
-	def test_CreateTask_GivenNoNotes_DoesntAddNotes(self):
-		api = TodoistAccount()
-		api.items.add.return_value = {'id': 1}
-		create_task('test todo', 0, api)
-		api.items.add.assert_called()
-		api.notes.add.assert_not_called()
-		api.commit.assert_not_called()
+		build_api_payload(task, mirror)
+		mirror.ensure.assert_called_with(['errands'], ['a project'])
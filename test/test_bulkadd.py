@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from mock import Mock
+
+import pytest
+
+from alfredtodoist.bulkadd import bulk_add, split_tasks
+from alfredtodoist.flushoutbox import payload_builder
+from alfredtodoist.outbox import Outbox
+
+
+@pytest.fixture
+def mirror():
+	mirror = Mock()
+	mirror.state = {
+		'labels': [{'id': 1, 'name': 'errands'}],
+		'projects': [{'id': 5, 'name': 'groceries'}],
+	}
+	mirror.sync_token = 'token'
+	return mirror
+
+
+@pytest.fixture
+def outbox(fake_wf):
+	return Outbox(fake_wf)
+
+
+def flush(outbox, api, mirror, limit=100):
+	tasks = [entry['task'] for entry in outbox.entries()]
+	return outbox.flush(api, payload_builder(mirror, tasks), limit=limit)
+
+
+class TestSplitTasks():
+	def test_SplitTasks_GivenBlankLines_IgnoresThem(self):
+		text = 'buy milk\n\n  call mom @phone \r\n'
+		assert split_tasks(text) == ['buy milk', 'call mom @phone']
+
+
+class TestBulkAdd():
+	def test_BulkAdd_GivenLines_JournalsOneEntryPerLine(self, outbox):
+		entries = bulk_add('buy milk #groceries\n\ncall mom @errands', outbox)
+		assert len(entries) == 2
+		assert [e['task']['todo'] for e in outbox.entries()] == ['buy milk', 'call mom']
+
+	def test_BulkAdd_GivenBlankText_JournalsNothing(self, outbox):
+		assert bulk_add(' \n', outbox) == []
+		assert outbox.entries() == []
+
+	def test_Flush_AfterBulkAdd_SendsOneItemPerLine(self, outbox, mirror, accepting_api):
+		bulk_add('buy milk #groceries\ncall mom @errands', outbox)
+		assert flush(outbox, accepting_api, mirror) == 2
+		commands = accepting_api.requests[0]
+		assert [cmd['args']['content'] for cmd in commands] == ['buy milk', 'call mom']
+		assert commands[0]['args']['project_id'] == 5
+		assert commands[1]['args']['labels'] == [1]
+		assert outbox.entries() == []
+
+	def test_Flush_GivenManyTasks_ResolvesNamesOnce(self, outbox, mirror, accepting_api):
+		bulk_add('\n'.join('task %d #groceries @errands' % i for i in range(30)), outbox)
+		flush(outbox, accepting_api, mirror)
+		assert mirror.ensure.call_count == 1
+		mirror.ensure.assert_called_with(['errands'], ['groceries'])
+
+	def test_Flush_OverCommandLimit_ChunksRequests(self, outbox, mirror, accepting_api):
+		bulk_add('\n'.join('task %d note: a note' % i for i in range(120)), outbox)
+		assert flush(outbox, accepting_api, mirror) == 120
+		assert [len(commands) for commands in accepting_api.requests] == [100, 100, 40]
+
+	def test_Flush_FailingMidway_KeepsUnsentTasks(self, outbox, mirror, accepting_api):
+		bulk_add('\n'.join('task %d' % i for i in range(5)), outbox)
+		commit = accepting_api.commit.side_effect
+		calls = []
+
+		def fail_second(raise_on_error=True):
+			calls.append(1)
+			if len(calls) == 2:
+				raise IOError('network is down')
+			return commit(raise_on_error)
+
+		accepting_api.commit.side_effect = fail_second
+		with pytest.raises(IOError):
+			flush(outbox, accepting_api, mirror, limit=2)
+		assert [e['task']['todo'] for e in outbox.entries()] == ['task 2', 'task 3', 'task 4']
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from alfredtodoist import daemon
+from alfredtodoist.mirror import MIRROR_NAME
+from alfredtodoist.workflow import Workflow3
+from alfredtodoist.workflow.workflow import FileBackend
+
+SCRIPTS = os.path.join(os.path.dirname(__file__), '..', 'alfredtodoist')
+
+
+@pytest.fixture
+def env(tmpdir, monkeypatch):
+	env = {
+		'alfred_workflow_bundleid': 'com.example.test',
+		'alfred_workflow_cache': str(tmpdir.join('cache')),
+		'alfred_workflow_data': str(tmpdir.join('data')),
+		'_WF_SESSION_ID': 'session',
+	}
+	for key, value in env.items():
+		monkeypatch.setenv(key, value)
+	return dict(os.environ)
+
+
+@pytest.fixture
+def wf(env):
+	wf = Workflow3()
+	backend = FileBackend(wf.datafile('passwords.json'))
+	backend.save(wf.bundleid, 'todoist', 'key')
+	wf.secret_backend = backend
+	# A fresh, empty mirror, so feedback does not start a sync.
+	wf.store_data(MIRROR_NAME, {'sync_token': 'token', 'synced_at': time.time()})
+	return wf
+
+
+@pytest.fixture
+def served(wf):
+	"""A daemon serving from a thread, with a short idle timeout."""
+	server = daemon.Daemon(wf, daemon.socket_path(wf.cachedir), idle_timeout=1)
+	thread = threading.Thread(target=server.serve)
+	thread.daemon = True
+	thread.start()
+	for _ in range(100):
+		if os.path.exists(server.path):
+			break
+		time.sleep(0.01)
+	yield server
+	thread.join(5)
+
+
+def request(path, text):
+	sock = daemon.connect(path)
+	response = daemon.send_request(sock, 'feedback', [text], dict(os.environ))
+	return response['status'], json.loads(response['output'])
+
+
+class TestDaemonRequests():
+	def test_Handle_Feedback_WritesItemsAsScriptWould(self, wf, env):
+		response = daemon.Daemon(wf, '').handle(
+			{'script': 'feedback', 'args': ['buy milk @errands'], 'env': env})
+		items = json.loads(response['output'])['items']
+		assert response['status'] == 0
+		assert [item['title'] for item in items] == ['Add task: buy milk']
+
+	def test_Handle_SecondRequest_DoesNotRepeatFirstItems(self, wf, env):
+		server = daemon.Daemon(wf, '')
+		server.handle({'script': 'feedback', 'args': ['buy milk'], 'env': env})
+		response = server.handle(
+			{'script': 'feedback', 'args': ['buy bread'], 'env': env})
+		items = json.loads(response['output'])['items']
+		assert [item['title'] for item in items] == ['Add task: buy bread']
+
+	def test_Request_OverSocket_ReturnsScriptOutput(self, served):
+		status, output = request(served.path, 'buy milk')
+		assert status == 0
+		assert output['items'][0]['title'] == 'Add task: buy milk'
+
+	def test_Serve_WhenIdle_ExitsAndRemovesSocket(self, served):
+		time.sleep(1.5)
+		assert not os.path.exists(served.path)
+		assert daemon.connect(served.path) is None
+
+	def test_Serve_AlreadyServing_ReturnsFalse(self, served, wf):
+		other = daemon.Daemon(wf, served.path)
+		assert other.serve() is False
+
+
+class TestDelegate():
+	def test_Delegate_NotEnabled_ReturnsWithoutConnecting(self, env, monkeypatch):
+		monkeypatch.delenv(daemon.DAEMON_VARIABLE, raising=False)
+		monkeypatch.setattr(daemon, 'connect', pytest.fail)
+		assert daemon.delegate('feedback') is None
+
+	def test_Delegate_NoDaemon_StartsOneAndReturns(self, env, monkeypatch):
+		monkeypatch.setenv(daemon.DAEMON_VARIABLE, '1')
+		started = []
+		monkeypatch.setattr(daemon, 'start', lambda: started.append(True))
+		assert daemon.delegate('feedback') is None
+		assert started == [True]
+
+	@pytest.fixture
+	def silent_daemon(self, env, monkeypatch):
+		"""A daemon that reads one request and closes without replying."""
+		monkeypatch.setenv(daemon.DAEMON_VARIABLE, '1')
+		monkeypatch.setattr(daemon, 'start', pytest.fail)
+		os.makedirs(env['alfred_workflow_cache'])
+		server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		server.bind(daemon.socket_path(env['alfred_workflow_cache']))
+		server.listen(1)
+		requests = []
+
+		def close_without_replying():
+			conn, _ = server.accept()
+			requests.append(json.loads(daemon.read_all(conn)))
+			conn.close()
+
+		thread = threading.Thread(target=close_without_replying)
+		thread.start()
+		yield requests
+		thread.join(5)
+		server.close()
+
+	def test_Delegate_FeedbackNotAnswered_ReturnsToRunInProcess(self, silent_daemon):
+		assert daemon.delegate('feedback') is None
+
+	def test_Delegate_AddtaskNotAnswered_ReportsInsteadOfRerunning(self, silent_daemon,
+			monkeypatch):
+		reported = []
+		monkeypatch.setattr(daemon, 'report_failure',
+			lambda script, err: reported.append(script))
+		with pytest.raises(SystemExit) as exit:
+			daemon.delegate('addtask')
+		assert exit.value.code == 1
+		assert reported == ['addtask']
+		assert [request['script'] for request in silent_daemon] == ['addtask']
+
+	def test_Serve_CreatesSocketReadableOnlyByUser(self, wf):
+		server = daemon.Daemon(wf, daemon.socket_path(wf.cachedir), idle_timeout=1)
+		modes = []
+		server.serve_one = lambda sock: modes.append(os.stat(server.path).st_mode & 0o777)
+		server.serve()
+		assert modes == [0o600]
+
+	def test_SocketPath_LongCacheDir_UsesTempDir(self):
+		path = daemon.socket_path('/' + 'x' * 200)
+		assert len(path) <= daemon.MAX_SOCKET_PATH
+		assert path.endswith('.sock')
+
+
+def run_script(env, text):
+	start = time.time()
+	process = subprocess.Popen(
+		[sys.executable, os.path.join(SCRIPTS, 'feedback.py'), text],
+		env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=SCRIPTS)
+	output, _ = process.communicate()
+	# Without a keychain the run ends in an error item; it is the same
+	# either way.
+	return time.time() - start, (process.returncode, output)
+
+
+@pytest.mark.performance
+def test_FeedbackLatency_WarmDaemon_FasterThanStartup(env):
+	"""
+	Compares a cold `feedback.py` run with one forwarded to a running
+	daemon, and checks they print the same thing.
+	"""
+	cachedir = env['alfred_workflow_cache']
+	server = subprocess.Popen([sys.executable, os.path.join(SCRIPTS, 'daemon.py')],
+		env=env, cwd=SCRIPTS, stderr=open(os.devnull, 'w'))
+	try:
+		path = daemon.socket_path(cachedir)
+		for _ in range(500):
+			if os.path.exists(path):
+				break
+			time.sleep(0.01)
+
+		warm_env = dict(env, **{daemon.DAEMON_VARIABLE: '1'})
+		cold, warm = [], []
+		for _ in range(10):
+			cold_time, cold_output = run_script(env, 'buy milk @errands')
+			warm_time, warm_output = run_script(warm_env, 'buy milk @errands')
+			cold.append(cold_time)
+			warm.append(warm_time)
+			assert warm_output == cold_output
+	finally:
+		server.terminate()
+		server.wait()
+
+	cold_median = sorted(cold)[len(cold) // 2]
+	warm_median = sorted(warm)[len(warm) // 2]
+	print('startup: {:.1f}ms, warm daemon: {:.1f}ms'.format(
+		cold_median * 1000, warm_median * 1000))
+	assert warm_median < cold_median
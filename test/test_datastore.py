@@ -0,0 +1,758 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import contextlib
+import cPickle
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+import pytest
+
+from alfredtodoist.mirror import MIRROR_NAME, TodoistMirror
+from alfredtodoist.workflow import Workflow3
+from alfredtodoist.workflow import background, janitor, workflow
+from alfredtodoist.workflow.workflow import (
+	CompressedSerializer, DataMemo, JSONSerializer, LazyRecords, SQLiteStore,
+	manager,
+	)
+
+
+@pytest.fixture
+def memo(monkeypatch):
+	memo = DataMemo()
+	monkeypatch.setattr(workflow, 'data_memo', memo)
+	return memo
+
+
+@pytest.fixture
+def wf(tmpdir, monkeypatch, memo):
+	monkeypatch.setenv('alfred_workflow_bundleid', 'com.example.test')
+	monkeypatch.setenv('alfred_workflow_cache', str(tmpdir.join('cache')))
+	monkeypatch.setenv('alfred_workflow_data', str(tmpdir.join('data')))
+	monkeypatch.setenv('_WF_SESSION_ID', 'session')
+	return Workflow3()
+
+
+def write_elsewhere(path, data):
+	"""Replace a data file as another process would, bypassing the memo."""
+	with open(path + '.tmp', 'wb') as fp:
+		cPickle.dump(data, fp, protocol=-1)
+	os.rename(path + '.tmp', path)
+
+
+class TestDataMemo():
+	def test_CachedData_Repeated_LoadsFileOnce(self, wf, memo):
+		wf.cache_data('tasks', {'count': 1})
+		first = wf.cached_data('tasks', max_age=0)
+		assert wf.cached_data('tasks', max_age=0) is first
+		assert memo.hits == 1
+
+	def test_CachedData_ReplacedByOtherProcess_LoadsNewData(self, wf):
+		wf.cache_data('tasks', {'count': 1})
+		wf.cached_data('tasks', max_age=0)
+		write_elsewhere(wf.cachefile('tasks.cpickle'), {'count': 2})
+		assert wf.cached_data('tasks', max_age=0) == {'count': 2}
+
+	def test_CachedData_Stale_CallsDataFunc(self, wf):
+		wf.cache_data('tasks', {'count': 1})
+		wf.cached_data('tasks', max_age=0)
+		assert wf.cached_data('tasks', lambda: {'count': 2}, max_age=-1) == {'count': 2}
+
+	def test_CachedData_Deleted_ReturnsNone(self, wf, memo):
+		wf.cache_data('tasks', {'count': 1})
+		wf.cached_data('tasks', max_age=0)
+		wf.cache_data('tasks', None)
+		assert wf.cached_data('tasks', max_age=0) is None
+		assert len(memo) == 0
+
+	def test_StoredData_AfterStoreData_ReturnsNewData(self, wf):
+		wf.store_data('labels', [1])
+		assert wf.stored_data('labels') == [1]
+		wf.store_data('labels', [1, 2], serializer='json')
+		assert wf.stored_data('labels') == [1, 2]
+
+	def test_StoredData_ChangedAfterStoring_ReturnsWhatWasStored(self, wf):
+		data = [1]
+		wf.store_data('labels', data)
+		wf.stored_data('labels')
+		data.append(2)
+		wf.store_data('other', data)
+		assert wf.stored_data('labels') == [1]
+
+	def test_Load_OverMaxEntries_DropsLeastRecentlyUsed(self, wf, memo):
+		memo.max_entries = 2
+		for name in ['a', 'b', 'c']:
+			wf.cache_data(name, name)
+		wf.cached_data('a', max_age=0)
+		wf.cached_data('b', max_age=0)
+		wf.cached_data('a', max_age=0)
+		wf.cached_data('c', max_age=0)
+		assert sorted(os.path.basename(path) for path in memo._entries) == [
+			'a.cpickle', 'c.cpickle']
+
+	def test_Load_OverMaxBytes_DropsLeastRecentlyUsed(self, wf, memo):
+		wf.cache_data('small', 'x')
+		wf.cache_data('large', 'x' * 1000)
+		memo.max_bytes = os.path.getsize(wf.cachefile('large.cpickle'))
+		wf.cached_data('small', max_age=0)
+		wf.cached_data('large', max_age=0)
+		assert [os.path.basename(path) for path in memo._entries] == ['large.cpickle']
+		assert memo._bytes <= memo.max_bytes
+
+	def test_Mirror_Applied_DoesNotChangeMemoizedData(self, wf):
+		wf.store_data(MIRROR_NAME, {'sync_token': 'a', 'labels': {1: {'id': 1, 'name': 'x'}}})
+		mirror = TodoistMirror(wf, api=None)
+		mirror.apply({'sync_token': 'b', 'labels': [{'id': 1, 'is_deleted': 1}]})
+		assert TodoistMirror(wf, api=None).tables['labels'] == {1: {'id': 1, 'name': 'x'}}
+
+
+class FakeBackground():
+	"""Stands in for `run_in_background`, recording the jobs started."""
+	def __init__(self):
+		self.started = []
+		self.running = set()
+
+	def run_in_background(self, name, args):
+		if name in self.running:
+			return
+		self.started.append((name, args))
+		self.running.add(name)
+
+	def is_running(self, name):
+		return name in self.running
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+	jobs = FakeBackground()
+	monkeypatch.setattr(background, 'run_in_background', jobs.run_in_background)
+	monkeypatch.setattr(background, 'is_running', jobs.is_running)
+	return jobs
+
+
+REFRESH = ['/usr/bin/python', 'update.py']
+
+
+class TestStaleOk():
+	def test_CachedData_StaleOk_ReturnsStaleDataAndRefreshesOnce(self, wf, jobs):
+		wf.cache_data('tasks', [1])
+		fail = lambda: pytest.fail('data_func called')
+		for _ in range(3):
+			assert wf.cached_data('tasks', fail, max_age=-1, stale_ok=True, refresh=REFRESH) == [1]
+		assert [args for _, args in jobs.started] == [REFRESH]
+		assert wf.cache_refreshing('tasks')
+
+	def test_CachedData_StaleOkFresh_DoesNotRefresh(self, wf, jobs):
+		wf.cache_data('tasks', [1])
+		assert wf.cached_data('tasks', max_age=60, stale_ok=True, refresh=REFRESH) == [1]
+		assert jobs.started == []
+		assert not wf.cache_refreshing('tasks')
+
+	def test_CachedData_StaleOkNothingCached_CallsDataFunc(self, wf, jobs):
+		assert wf.cached_data('tasks', lambda: [2], stale_ok=True, refresh=REFRESH) == [2]
+		assert jobs.started == []
+
+	def test_CachedData_StaleOkNothingCachedNoDataFunc_StartsRefresh(self, wf, jobs):
+		assert wf.cached_data('tasks', stale_ok=True, refresh=REFRESH) is None
+		assert wf.cache_refreshing('tasks')
+
+	def test_CachedData_StaleOkSession_RefreshingScopedToSession(self, wf, jobs):
+		wf.cache_data('tasks', [1], session=True)
+		wf.cached_data('tasks', max_age=-1, session=True, stale_ok=True, refresh=REFRESH)
+		assert wf.cache_refreshing('tasks', session=True)
+		assert not wf.cache_refreshing('tasks')
+
+	def test_CachedData_StaleOkWithoutRefresh_RaisesValueError(self, wf):
+		with pytest.raises(ValueError):
+			wf.cached_data('tasks', stale_ok=True)
+
+
+def cache_file(cachedir, name, age, size=10):
+	"""A file in `cachedir` last modified `age` seconds ago."""
+	path = os.path.join(cachedir, name)
+	with open(path, 'wb') as fp:
+		fp.write(b'x' * size)
+	then = time.time() - age
+	os.utime(path, (then, then))
+	return path
+
+
+class TestJanitor():
+	def test_Run_NoBudget_DoesNotTrackOrStartJanitor(self, wf, jobs):
+		wf.run(lambda wf: wf.cache_data('tasks', [1]))
+		assert not os.path.exists(wf.cachefile(janitor.ACCESS_LOG_NAME))
+		assert jobs.started == []
+
+	def test_Run_WithBudget_RecordsAccessesAndStartsJanitorOnce(self, wf, jobs):
+		wf.cache_max_entries = 10
+		wf.cache_data('tasks', [1])
+		then = time.time() - wf.cache_janitor_interval
+		os.utime(wf.cachefile('tasks.cpickle'), (then, then))
+		wf.run(lambda wf: wf.cached_data('tasks', max_age=0))
+		with open(wf.cachefile(janitor.ACCESS_LOG_NAME)) as fp:
+			assert fp.read().endswith('\ttasks.cpickle\n')
+		[(name, cmd)] = jobs.started
+		assert cmd[-4:] == [wf.cachedir, '-', '10', '-']
+		assert os.path.basename(cmd[1]) == 'janitor.py'
+
+		janitor.tidy(wf.cachedir, max_entries=10)
+		jobs.running.clear()
+		wf.run(lambda wf: wf.cached_data('tasks', max_age=0))
+		assert len(jobs.started) == 1
+
+	def test_Run_WritesAndFreshReads_DoNotTouchAccessLog(self, wf, jobs):
+		wf.cache_max_entries = 10
+		wf.run(lambda wf: wf.cache_data('tasks', [1]))
+		wf.run(lambda wf: wf.cached_data('tasks', max_age=0))
+		assert not os.path.exists(wf.cachefile(janitor.ACCESS_LOG_NAME))
+
+	def test_Tidy_MaxEntries_RemovesLeastRecentlyUsed(self, wf):
+		for name, age in [('a', 300), ('b', 200), ('c', 100)]:
+			cache_file(wf.cachedir, name, age)
+		janitor.record_access(wf.cachedir, {'a': time.time() - 90})
+		assert janitor.tidy(wf.cachedir, max_entries=2) == ['b']
+		assert sorted(os.listdir(wf.cachedir)) == [janitor.INDEX_NAME, 'a', 'c']
+		assert janitor.last_run(wf.cachedir) is not None
+
+	def test_Tidy_MaxBytes_KeepsRecentlyUsedFiles(self, wf):
+		cache_file(wf.cachedir, 'old', 1000, size=100)
+		cache_file(wf.cachedir, 'used', 1000, size=100)
+		cache_file(wf.cachedir, 'new', 0, size=100)
+		janitor.record_access(wf.cachedir, {'used': time.time()})
+		assert janitor.tidy(wf.cachedir, max_bytes=50) == ['old']
+
+	def test_Tidy_MaxAge_RemovesOldAndDeadPidFiles(self, wf):
+		cache_file(wf.cachedir, '_wfsess-1-tasks.cpickle', 1000)
+		cache_file(wf.cachedir, 'fresh.cpickle', 10)
+		for name in ['alive.pid', 'dead.pid']:
+			cache_file(wf.cachedir, name, 1000)
+		with open(wf.cachefile('alive.pid'), 'wb') as fp:
+			fp.write(str(os.getpid()))
+		os.utime(wf.cachefile('alive.pid'), (0, 0))
+		for name in ['workflow.log', 'tasks.lock', 'cache.sqlite']:
+			cache_file(wf.cachedir, name, 1000)
+		removed = janitor.tidy(wf.cachedir, max_age=100)
+		assert sorted(removed) == ['_wfsess-1-tasks.cpickle', 'dead.pid']
+
+	def test_Tidy_AccessLogMergedIntoIndex(self, wf):
+		cache_file(wf.cachedir, 'a', 1000)
+		janitor.record_access(wf.cachedir, {'a': time.time()})
+		janitor.tidy(wf.cachedir, max_age=100)
+		assert not os.path.exists(wf.cachefile(janitor.ACCESS_LOG_NAME))
+		assert janitor.tidy(wf.cachedir, max_age=100) == []
+
+	def test_Janitor_AsScript_TidiesCacheDir(self, wf):
+		for name in ['a', 'b']:
+			cache_file(wf.cachedir, name, 1000)
+		subprocess.check_call([sys.executable, janitor.__file__.replace('.pyc', '.py'),
+			wf.cachedir, '-', '1', '-'])
+		assert len(os.listdir(wf.cachedir)) == 2
+
+
+def wait_for(path, timeout=5):
+	"""Wait for a file written in the background to appear."""
+	deadline = time.time() + timeout
+	while not os.path.exists(path) and time.time() < deadline:
+		time.sleep(0.01)
+	return os.path.exists(path)
+
+
+class TestWriteBehind():
+	def test_Run_CacheData_WrittenAfterRunReadableDuring(self, wf):
+		wf.write_behind = True
+		seen = []
+
+		def main(wf):
+			wf.cache_data('tasks', [1])
+			seen.append(os.path.exists(wf.cachefile('tasks.cpickle')))
+			seen.append(wf.cached_data('tasks', max_age=60))
+			seen.append(wf.cached_data_fresh('tasks', 60))
+
+		assert wf.run(main) == 0
+		assert seen == [False, [1], True]
+		assert wait_for(wf.cachefile('tasks.cpickle'))
+		assert wf.cached_data('tasks', max_age=0) == [1]
+
+	def test_Run_StoreData_SavesDataAsTheyWere(self, wf):
+		wf.write_behind = True
+		seen = []
+
+		def main(wf):
+			data = {'tasks': [1]}
+			wf.store_data('state', data, serializer='json')
+			data['tasks'].append(2)
+			seen.append(wf.stored_data('state'))
+
+		assert wf.run(main) == 0
+		assert seen == [{'tasks': [1]}]
+		assert wait_for(wf.datafile('state.json'))
+		assert wf.stored_data('state') == {'tasks': [1]}
+
+	def test_Run_Settings_SavedOnceAfterRun(self, wf):
+		wf.write_behind = True
+		seen = []
+
+		def main(wf):
+			wf.settings['count'] = 1
+			wf.settings['count'] = 2
+			seen.append(os.path.exists(wf.settings_path))
+
+		assert wf.run(main) == 0
+		assert seen == [False]
+		assert wait_for(wf.settings_path)
+		with open(wf.settings_path) as fp:
+			assert json.load(fp) == {'count': 2}
+
+	def test_Run_DeletedBeforeFlush_NotWritten(self, wf):
+		wf.write_behind = True
+
+		def main(wf):
+			wf.cache_data('tasks', [1])
+			wf.cache_data('tasks', None)
+			wf.cache_data('labels', [1])
+			wf.clear_cache()
+			wf.store_data('state', [1])
+			wf.store_data('state', None)
+			assert wf.stored_data('state') is None
+
+		assert wf.run(main) == 0
+		wf.cache_data('done', [1])
+		time.sleep(0.2)
+		assert os.listdir(wf.cachedir) == ['done.cpickle']
+		assert os.listdir(wf.datadir) == []
+
+	def test_CacheData_OutsideRun_WrittenStraightAway(self, wf):
+		wf.write_behind = True
+		wf.cache_data('tasks', [1])
+		assert os.path.exists(wf.cachefile('tasks.cpickle'))
+
+	def test_FlushWrites_InProcess_WritesInOrder(self, wf):
+		wf.write_behind = True
+		wf._running = True
+		wf.store_data('state', [1])
+		assert not os.path.exists(wf.datafile('state.cpickle'))
+		wf.flush_writes()
+		assert wf._pending_writes == {}
+		assert sorted(os.listdir(wf.datadir)) == ['.state.alfred-workflow', 'state.cpickle']
+
+
+class TestSingleFlight():
+	def test_CachedData_Stale_CallsDataFuncOnce(self, wf):
+		calls = []
+		wf.cache_data('tasks', [1])
+		data = wf.cached_data('tasks', lambda: calls.append(1) or [2], max_age=-1)
+		assert data == [2]
+		assert calls == [1]
+
+	def test_CachedData_StaleWithWriteBehind_WritesThroughWhileLocked(self, wf):
+		wf.write_behind = True
+		wf.cache_data('tasks', [1])
+		path = wf.cachefile('tasks.cpickle')
+		seen = []
+
+		def main(wf):
+			wf.cached_data('tasks', lambda: [2], max_age=-1)
+			seen.append(wf._pending_writes.keys())
+			with open(path, 'rb') as fp:
+				seen.append(cPickle.load(fp))
+
+		wf.run(main)
+		assert seen == [[], [2]]
+		assert not os.path.exists(path + '.lock')
+
+	def test_CachedData_OtherProcessRegenerating_WaitsForItsData(self, wf, monkeypatch):
+		wf.cache_data('tasks', [1])
+		path = wf.cachefile('tasks.cpickle')
+		real_sleep = time.sleep
+
+		def regenerate_elsewhere(seconds):
+			write_elsewhere(path, [2])
+			real_sleep(seconds)
+
+		with locked_elsewhere(path):
+			monkeypatch.setattr(workflow.time, 'sleep', regenerate_elsewhere)
+			data = wf.cached_data('tasks', lambda: pytest.fail('data_func called'), max_age=-1)
+		assert data == [2]
+
+	def test_CachedData_OtherProcessTooSlow_ReturnsStaleData(self, wf, monkeypatch):
+		monkeypatch.setattr(workflow, 'CACHE_LOCK_WAIT', 0.1)
+		wf.cache_data('tasks', [1])
+		with locked_elsewhere(wf.cachefile('tasks.cpickle')):
+			data = wf.cached_data('tasks', lambda: pytest.fail('data_func called'), max_age=-1)
+		assert data == [1]
+
+
+@contextlib.contextmanager
+def locked_elsewhere(path):
+	"""Hold the `LockFile` of `path` in another process."""
+	root = os.path.join(os.path.dirname(__file__), '..')
+	process = subprocess.Popen([sys.executable, '-c',
+		'import sys\n'
+		'from alfredtodoist.workflow.util import LockFile\n'
+		'LockFile(sys.argv[1]).acquire()\n'
+		'print("locked"); sys.stdout.flush(); sys.stdin.read()\n', path],
+		stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=root,
+		env=dict(os.environ, PYTHONPATH=root))
+	try:
+		assert process.stdout.readline().strip() == 'locked'
+		yield
+	finally:
+		process.communicate()
+
+
+# Run by each process of the stress test, with the data_func call log, the
+# time to start at and the cache backend as arguments.
+REGENERATE = """
+import json, os, sys, time
+from alfredtodoist.workflow import Workflow
+from alfredtodoist.workflow.workflow import SQLiteStore
+
+def fetch():
+	with open(sys.argv[1], 'a') as fp:
+		fp.write('{}\\n'.format(os.getpid()))
+	time.sleep(0.5)
+	return {'tasks': [1, 2, 3]}
+
+wf = Workflow()
+if sys.argv[3] == 'sqlite':
+	wf.cache_store = SQLiteStore(wf.cachefile('cache.sqlite'))
+time.sleep(max(0, float(sys.argv[2]) - time.time()))
+print(json.dumps(wf.cached_data('tasks', fetch, max_age=60)))
+"""
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('stale', [True, False])
+@pytest.mark.parametrize('backend', ['files', 'sqlite'])
+def test_CachedData_ConcurrentProcesses_CallDataFuncOnce(wf, tmpdir, stale, backend):
+	if stale:
+		wf.cache_data('tasks', {'tasks': []})
+		old = time.time() - 3600
+		os.utime(wf.cachefile('tasks.cpickle'), (old, old))
+		store = SQLiteStore(wf.cachefile('cache.sqlite'))
+		store.save('tasks', {'tasks': []}, 'cpickle')
+		store.conn.execute('UPDATE store SET updated = ?', (old,))
+		store.conn.commit()
+	calls = str(tmpdir.join('calls'))
+	start = time.time() + 1
+	root = os.path.join(os.path.dirname(__file__), '..')
+	processes = [
+		subprocess.Popen([sys.executable, '-c', REGENERATE, calls, str(start), backend],
+			stdout=subprocess.PIPE, cwd=root, env=dict(os.environ, PYTHONPATH=root))
+		for _ in range(8)]
+	outputs = [json.loads(process.communicate()[0]) for process in processes]
+	assert len(open(calls).readlines()) == 1
+	assert outputs == [{'tasks': [1, 2, 3]}] * 8
+
+
+@pytest.fixture
+def sqlite_wf(wf):
+	wf.data_store = SQLiteStore(wf.datafile('data.sqlite'))
+	wf.cache_store = SQLiteStore(wf.cachefile('cache.sqlite'))
+	return wf
+
+
+class TestSQLiteStore():
+	@pytest.mark.parametrize('serializer', ['cpickle', 'pickle', 'json'])
+	def test_StoredData_AfterStoreData_ReturnsData(self, sqlite_wf, serializer):
+		sqlite_wf.store_data('labels', {u'name': u'Größe'}, serializer=serializer)
+		assert sqlite_wf.stored_data('labels') == {u'name': u'Größe'}
+		assert not os.path.exists(sqlite_wf.datafile('labels.' + serializer))
+
+	def test_StoreData_None_DeletesData(self, sqlite_wf):
+		sqlite_wf.store_data('labels', [1])
+		sqlite_wf.store_data('labels', None)
+		assert sqlite_wf.stored_data('labels') is None
+
+	def test_CachedData_MaxAge_SameAsFiles(self, sqlite_wf):
+		assert sqlite_wf.cached_data('tasks', lambda: [1], max_age=60) == [1]
+		assert sqlite_wf.cached_data('tasks', lambda: [2], max_age=60) == [1]
+		assert 0 < sqlite_wf.cached_data_age('tasks') < 60
+		assert sqlite_wf.cached_data('tasks', lambda: [2], max_age=-1) == [2]
+		assert 'tasks.cpickle' not in os.listdir(sqlite_wf.cachedir)
+
+	def test_ClearSessionCache_DeletesOtherSessionsOnly(self, sqlite_wf, monkeypatch):
+		sqlite_wf.cache_data('tasks', [1])
+		sqlite_wf.cache_data('tasks', [2], session=True)
+		monkeypatch.setenv('_WF_SESSION_ID', 'old')
+		old = Workflow3()
+		old.cache_store = sqlite_wf.cache_store
+		old.cache_data('tasks', [3], session=True)
+
+		sqlite_wf.clear_session_cache()
+		assert sqlite_wf.cached_data('tasks', max_age=0, session=True) == [2]
+		assert old.cached_data('tasks', max_age=0, session=True) is None
+		sqlite_wf.clear_session_cache(current=True)
+		assert sqlite_wf.cached_data('tasks', max_age=0, session=True) is None
+		assert sqlite_wf.cached_data('tasks', max_age=0) == [1]
+
+	def test_ClearCache_DeletesValuesAndKeepsDatabase(self, sqlite_wf):
+		sqlite_wf.cache_data('tasks', [1])
+		sqlite_wf.cache_data('labels', [2])
+		sqlite_wf.clear_cache(lambda filename: filename.startswith('tasks'))
+		assert sqlite_wf.cached_data('tasks', max_age=0) is None
+		assert sqlite_wf.cached_data('labels', max_age=0) == [2]
+		sqlite_wf.reset()
+		assert sqlite_wf.cached_data('labels', max_age=0) is None
+		assert os.path.exists(sqlite_wf.cache_store.filepath)
+
+	def test_Run_DatabaseDeleted_OpensNewDatabase(self, sqlite_wf):
+		sqlite_wf.cache_data('tasks', [1])
+		for suffix in ['', '-wal', '-shm']:
+			if os.path.exists(sqlite_wf.cache_store.filepath + suffix):
+				os.unlink(sqlite_wf.cache_store.filepath + suffix)
+		sqlite_wf.run(lambda wf: None)
+		assert sqlite_wf.cached_data('tasks', max_age=0) is None
+		sqlite_wf.cache_data('tasks', [2])
+		assert SQLiteStore(sqlite_wf.cache_store.filepath).load('tasks') == [2]
+
+	def test_Conn_RepeatedUse_DoesNotStatDatabase(self, sqlite_wf, monkeypatch):
+		store = sqlite_wf.cache_store
+		store.save('tasks', [1], 'cpickle')
+		stats = []
+		real_stat = os.stat
+		monkeypatch.setattr(os, 'stat', lambda path: stats.append(path) or real_stat(path))
+		for _ in range(3):
+			store.load('tasks')
+		assert store.filepath not in stats
+
+	def test_Purge_DeletesOldValues(self, sqlite_wf):
+		store = sqlite_wf.cache_store
+		store.save('old', 1, 'cpickle')
+		store.conn.execute('UPDATE store SET updated = ?', (time.time() - 100,))
+		store.conn.commit()
+		store.save('new', 2, 'cpickle')
+		store.purge(50)
+		assert (store.load('old'), store.load('new')) == (None, 2)
+
+
+def todoist_state(tasks=2000, seed=7):
+	"""A sync response's worth of projects, labels and tasks."""
+	rand = random.Random(seed)
+	words = u'buy milk call mum review PR Größe café report tax invoice plan trip'.split()
+	projects = [{'id': 2200000000 + i, 'name': u'Project {}'.format(i), 'color': 30 + i % 20,
+		'parent_id': None, 'child_order': i, 'collapsed': 0, 'shared': False,
+		'is_deleted': 0, 'is_archived': 0, 'is_favorite': 0} for i in range(40)]
+	labels = [{'id': 2150000000 + i, 'name': u'label{}'.format(i), 'color': 40 + i % 10,
+		'item_order': i, 'is_deleted': 0, 'is_favorite': 0} for i in range(30)]
+	items = [{'id': 4000000000 + i, 'content': u' '.join(rand.sample(words, 4)),
+		'project_id': rand.choice(projects)['id'],
+		'labels': [label['id'] for label in rand.sample(labels, rand.randint(0, 3))],
+		'priority': rand.randint(1, 4), 'checked': 0, 'is_deleted': 0,
+		'due': {'date': u'2026-10-{:02d}'.format(rand.randint(1, 28)), 'timezone': None,
+			'string': u'every day', 'lang': u'en', 'is_recurring': rand.random() < 0.2},
+		'date_added': u'2026-09-01T10:00:00Z', 'child_order': i, 'parent_id': None,
+		'responsible_uid': None, 'section_id': None, 'sync_id': None}
+		for i in range(tasks)]
+	return {'sync_token': 'x' * 40, 'full_sync': True, 'projects': projects,
+		'labels': labels, 'items': items}
+
+
+class TestSerializers():
+	@pytest.mark.parametrize('name', ['compactjson', 'marshal', 'cpickle.zlib'])
+	def test_StoreData_NewSerializer_RoundTrips(self, wf, name):
+		state = todoist_state(50)
+		wf.store_data('state', state, serializer=name)
+		assert wf.stored_data('state') == state
+
+	def test_CompressedSerializer_WrapsAnySerializer(self, wf):
+		manager.register('json.zlib', CompressedSerializer(JSONSerializer, level=9))
+		try:
+			wf.cache_serializer = 'json.zlib'
+			wf.cache_data('state', {u'name': u'Größe'})
+			assert wf.cached_data('state', max_age=0) == {u'name': u'Größe'}
+		finally:
+			manager.unregister('json.zlib')
+
+	def test_MarshalSerializer_UnsupportedType_RaisesValueError(self, wf):
+		with pytest.raises(ValueError):
+			wf.store_data('state', object(), serializer='marshal')
+
+
+class TestRecords():
+	def test_StoredData_Records_ReturnsLazyMapping(self, wf):
+		tasks = {task['id']: task for task in todoist_state(500)['items']}
+		wf.store_data('tasks', tasks, serializer='records')
+		records = wf.stored_data('tasks')
+		assert isinstance(records, LazyRecords)
+		assert len(records) == 500
+		assert records[4000000123] == tasks[4000000123]
+		assert records == tasks
+
+	def test_Records_MissingKey_RaisesKeyError(self, wf):
+		wf.store_data('tasks', {1: 'a', u'b': 2}, serializer='records')
+		records = wf.stored_data('tasks')
+		with pytest.raises(KeyError):
+			records[2]
+		assert records.get([1]) is None
+		assert 'b' in records and 1L in records and '1' not in records
+
+	def test_Records_Iteration_KeepsSavedOrder(self, wf):
+		wf.store_data('tasks', workflow.OrderedDict([(3, 'c'), (1, 'a'), (2, 'b')]),
+			serializer='records')
+		assert wf.stored_data('tasks').items() == [(3, 'c'), (1, 'a'), (2, 'b')]
+
+	def test_Records_Lookup_DecodesOnlyThatRecord(self, wf, monkeypatch):
+		wf.store_data('tasks', {i: {'id': i} for i in range(1000)}, serializer='records')
+		decoded = []
+		loads = cPickle.loads
+		monkeypatch.setattr(workflow.cPickle, 'loads',
+			lambda data: decoded.append(data) or loads(data))
+		assert wf.stored_data('tasks')[765] == {'id': 765}
+		assert len(decoded) == 1
+
+	def test_Records_Empty_RoundTrips(self, wf):
+		wf.store_data('tasks', {}, serializer='records')
+		assert dict(wf.stored_data('tasks')) == {}
+
+	def test_Records_SQLiteStore_RoundTrips(self, wf):
+		wf.data_store = SQLiteStore(wf.datafile('data.sqlite'))
+		wf.store_data('tasks', {1: 'a', 2: 'b'}, serializer='records')
+		assert wf.stored_data('tasks')[2] == 'b'
+
+	def test_Records_NotARecordsFile_RaisesValueError(self):
+		with pytest.raises(ValueError):
+			LazyRecords(b'x' * 64)
+
+
+@pytest.mark.performance
+def test_StoredData_Repeated_FasterWithMemo(wf, memo):
+	wf.store_data('labels', {i: {'id': i, 'name': u'label {}'.format(i)} for i in range(2000)})
+	runs = 200
+	memoized = timeit.timeit(lambda: wf.stored_data('labels'), number=runs) / runs
+	memo.max_entries = 0
+	memo.clear()
+	loaded = timeit.timeit(lambda: wf.stored_data('labels'), number=runs) / runs
+	print('stored_data, 2000 labels: memoized: {:.3f}ms, loaded: {:.3f}ms'.format(
+		memoized * 1000, loaded * 1000))
+	assert memoized < loaded
+
+
+@pytest.mark.performance
+def test_SQLiteStore_ThousandsOfKeys_FasterThanFiles(wf, memo, tmpdir):
+	"""
+	Writes, reads and clears 2000 session-scoped keys with files and with
+	`SQLiteStore`.
+	"""
+	memo.max_entries = 0
+	names = ['task-{}'.format(i) for i in range(2000)]
+	data = {'id': 1, 'content': u'buy milk', 'labels': [1, 2, 3]}
+	timings = {}
+	for backend in ['files', 'sqlite']:
+		if backend == 'sqlite':
+			wf.cache_store = SQLiteStore(wf.cachefile('cache.sqlite'))
+			wf.data_store = SQLiteStore(wf.datafile('data.sqlite'))
+		start = time.time()
+		for name in names:
+			wf.store_data(name, data)
+		store = time.time() - start
+		start = time.time()
+		for name in names:
+			wf.stored_data(name)
+		load = time.time() - start
+		for name in names:
+			wf.cache_data(name, data, session=True)
+		start = time.time()
+		wf.clear_session_cache(current=True)
+		clear = time.time() - start
+		timings[backend] = (store, load, clear)
+		print('2000 keys, {}: store_data: {:.0f}ms, stored_data: {:.0f}ms, '
+			'clear_session_cache: {:.1f}ms'.format(
+				backend, store * 1000, load * 1000, clear * 1000))
+	assert timings['sqlite'][0] < timings['files'][0]
+	assert timings['sqlite'][1] < timings['files'][1]
+	assert timings['sqlite'][2] < timings['files'][2]
+
+
+@pytest.mark.performance
+def test_Serializers_TodoistState_Matrix(tmpdir):
+	"""
+	Size and dump/load time of each registered serializer for a full sync
+	of 2000 tasks.
+	"""
+	state = todoist_state()
+	path = str(tmpdir.join('state'))
+	results = {}
+	for name in manager.serializers:
+		serializer = manager.serializer(name)
+		runs = 5
+
+		def dump():
+			with open(path, 'wb') as fp:
+				serializer.dump(state, fp)
+
+		def load():
+			with open(path, 'rb') as fp:
+				return serializer.load(fp)
+
+		dumped = timeit.timeit(dump, number=runs) / runs
+		loaded = timeit.timeit(load, number=runs) / runs
+		assert load() == state
+		results[name] = (os.path.getsize(path), dumped, loaded)
+		print('{:>12}: {:>8} bytes, dump: {:5.1f}ms, load: {:5.1f}ms'.format(
+			name, results[name][0], dumped * 1000, loaded * 1000))
+	assert results['compactjson'][0] < results['json'][0]
+	assert results['compactjson'][1] < results['json'][1]
+	assert results['cpickle.zlib'][0] < results['cpickle'][0] / 2
+	assert results['marshal'][2] < results['cpickle'][2]
+
+
+@pytest.mark.performance
+def test_Records_OneLookup_FasterThanFullLoad(wf, memo):
+	"""
+	Time to open 20000 tasks saved with `cpickle` and with `records` and get
+	one task out.
+	"""
+	memo.max_entries = 0
+	tasks = {task['id']: task for task in todoist_state(20000)['items']}
+	timings = {}
+	for name in ['cpickle', 'marshal', 'records']:
+		wf.store_data('tasks', tasks, serializer=name)
+		runs = 20
+		timings[name] = timeit.timeit(
+			lambda: wf.stored_data('tasks')[4000012345], number=runs) / runs
+		print('{:>8}: one of 20000 tasks: {:.3f}ms'.format(name, timings[name] * 1000))
+	assert timings['records'] * 10 < timings['cpickle']
+
+
+@pytest.mark.performance
+def test_Run_WriteBehind_FeedbackSentSooner(wf):
+	"""
+	Time until a script filter that caches a sync response and a session
+	value and saves a setting has sent its feedback, and until `run` returns.
+	"""
+	state = todoist_state(200)
+	sent = []
+
+	def main(wf):
+		wf.cache_data('state', state)
+		wf.cache_data('query', u'buy milk', session=True)
+		wf.settings['last_query'] = u'buy milk'
+		wf.add_item(u'Add task: buy milk')
+		wf.send_feedback()
+		sent.append(time.time())
+
+	timings = {}
+	for write_behind in [False, True]:
+		wf.write_behind = write_behind
+		feedback, returned = [], []
+		for i in range(50):
+			state['sync_token'] = str(i)
+			wf._items = []
+			start = time.time()
+			assert wf.run(main) == 0
+			returned.append(time.time() - start)
+			feedback.append(sent.pop() - start)
+			# Keystrokes are further apart than this; don't time the
+			# previous run's background writes.
+			time.sleep(0.02)
+		timings[write_behind] = (sorted(feedback)[25], sorted(returned)[25])
+	print('synchronous writes: feedback sent in {:.2f}ms, returned in {:.2f}ms'.format(
+		*[t * 1000 for t in timings[False]]))
+	print('write-behind: feedback sent in {:.2f}ms, returned in {:.2f}ms'.format(
+		*[t * 1000 for t in timings[True]]))
+	assert timings[True][0] < timings[False][0]
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+import string
+import time
+import timeit
+
+import pytest
+
+from alfredtodoist import feedback
+from alfredtodoist.feedback import (
+	SYNCER_NAME, outbox_warning, refresh_mirror, suggest_names,
+	)
+from alfredtodoist.mirror import MIRROR_NAME, RETRY_DELAY, TodoistMirror
+from alfredtodoist.outbox import Outbox
+from alfredtodoist.parse import TaskParser
+from alfredtodoist.workflow import Workflow3
+
+
+@pytest.fixture
+def wf(tmpdir, monkeypatch):
+	monkeypatch.setenv('alfred_workflow_bundleid', 'com.example.test')
+	monkeypatch.setenv('alfred_workflow_cache', str(tmpdir.join('cache')))
+	monkeypatch.setenv('alfred_workflow_data', str(tmpdir.join('data')))
+	return Workflow3()
+
+
+def make_mirror(wf, labels=(), projects=(), synced_at=None):
+	wf.store_data(MIRROR_NAME, {
+		'sync_token': 'token-1',
+		'synced_at': time.time() if synced_at is None else synced_at,
+		'labels': {i: {'id': i, 'name': name} for i, name in enumerate(labels)},
+		'projects': {i: {'id': i, 'name': name} for i, name in enumerate(projects)},
+	})
+	return TodoistMirror(wf, api=None)
+
+
+class TestSuggestNames():
+	def test_SuggestNames_PartialLabel_CompletesLabel(self, wf):
+		mirror = make_mirror(wf, labels=[u'errands', u'phone'])
+		assert suggest_names(wf, u'buy milk @err', mirror) == [
+			(u'errands', u'buy milk @errands ')]
+
+	def test_SuggestNames_PartialProject_CompletesProject(self, wf):
+		mirror = make_mirror(wf, projects=[u'groceries', u'work'])
+		assert suggest_names(wf, u'#gro', mirror) == [(u'groceries', u'#groceries ')]
+
+	def test_SuggestNames_ProjectWithSpaces_WrapsName(self, wf):
+		mirror = make_mirror(wf, projects=[u'Home Office'])
+		assert suggest_names(wf, u'buy chair #home', mirror) == [
+			(u'Home Office', u'buy chair #(Home Office) ')]
+
+	def test_SuggestNames_AsciiPrefix_MatchesAccentedName(self, wf):
+		mirror = make_mirror(wf, projects=[u'Café', u'work'])
+		assert suggest_names(wf, u'#caf', mirror) == [(u'Café', u'#Café ')]
+
+	@pytest.mark.parametrize('marker,names', [
+		(u'@', [u'errands', u'my-label', u'Café', u'on the go']),
+		(u'#', [u'groceries', u'Home Office', u'Home & Garden', u'self-care',
+			u'Café Bar', u'a (b)']),
+	])
+	def test_SuggestNames_Completions_ParseBackToTheName(self, wf, marker, names):
+		resource = 'labels' if marker == u'@' else 'projects'
+		mirror = make_mirror(wf, **{resource: names})
+		parser = TaskParser()
+		suggestions = suggest_names(wf, u'buy ' + marker, mirror)
+		assert suggestions
+		for name, completed in suggestions:
+			task = parser.parse(completed)
+			assert (task['labels'] if marker == u'@' else [task['project']]) == [name]
+			assert task['todo'] == u'buy'
+
+	def test_SuggestNames_NameParserCannotRead_IsSkipped(self, wf):
+		mirror = make_mirror(wf, labels=[u'my-label', u'errands'],
+			projects=[u'Home & Garden', u'Home Office'])
+		assert [name for name, _ in suggest_names(wf, u'@', mirror)] == [u'errands']
+		assert [name for name, _ in suggest_names(wf, u'#home', mirror)] == [u'Home Office']
+
+	def test_SuggestNames_BareMarker_SuggestsNamesAlphabetically(self, wf):
+		mirror = make_mirror(wf, labels=[u'phone', u'Errands'])
+		names = [name for name, _ in suggest_names(wf, u'call @', mirror)]
+		assert names == [u'Errands', u'phone']
+
+	def test_SuggestNames_NameTypedInFull_SuggestsNothing(self, wf):
+		mirror = make_mirror(wf, labels=[u'errands'])
+		assert suggest_names(wf, u'buy milk @Errands', mirror) == []
+
+	def test_SuggestNames_NameNotAtEnd_SuggestsNothing(self, wf):
+		mirror = make_mirror(wf, labels=[u'errands'])
+		assert suggest_names(wf, u'buy @err milk', mirror) == []
+
+	def test_SuggestNames_EmailAddress_SuggestsNothing(self, wf):
+		mirror = make_mirror(wf, labels=[u'example'])
+		assert suggest_names(wf, u'mail bob@ex', mirror) == []
+
+
+class TestRefreshMirror():
+	@pytest.fixture
+	def background(self, monkeypatch):
+		started = []
+		monkeypatch.setattr(feedback, 'is_running', lambda name: bool(started))
+		monkeypatch.setattr(feedback, 'run_in_background',
+			lambda name, args: started.append(name))
+		return started
+
+	def test_RefreshMirror_Stale_SyncsInBackgroundAndReruns(self, wf, background):
+		refresh_mirror(wf, make_mirror(wf, synced_at=0))
+		assert background == [SYNCER_NAME]
+		assert wf.rerun
+
+	def test_RefreshMirror_Fresh_DoesNothing(self, wf, background):
+		refresh_mirror(wf, make_mirror(wf))
+		assert background == []
+		assert not wf.rerun
+
+	def test_RefreshMirror_AfterFailedSync_WaitsBeforeRetrying(self, wf, background):
+		make_mirror(wf, synced_at=0).record_failure()
+		mirror = TodoistMirror(wf, api=None)
+		refresh_mirror(wf, mirror)
+		assert background == []
+		mirror.failed_at -= RETRY_DELAY
+		refresh_mirror(wf, mirror)
+		assert background == [SYNCER_NAME]
+
+	def test_RetryDue_BacksOffAfterEachFailure(self, wf):
+		mirror = make_mirror(wf, synced_at=0)
+		mirror.record_failure()
+		assert not mirror.retry_due(mirror.failed_at + RETRY_DELAY - 1)
+		assert mirror.retry_due(mirror.failed_at + RETRY_DELAY)
+		mirror.record_failure()
+		assert not mirror.retry_due(mirror.failed_at + RETRY_DELAY)
+		assert mirror.retry_due(mirror.failed_at + RETRY_DELAY * 2)
+		mirror.apply({'sync_token': 'token-2'})
+		assert mirror.retry_due(mirror.failed_at)
+
+
+class TestOutboxWarning():
+	def test_OutboxWarning_NothingFailed_ReturnsNone(self, wf):
+		Outbox(wf).append(TaskParser().parse('buy milk'))
+		assert outbox_warning(wf) is None
+
+	def test_OutboxWarning_FlushFailed_ShowsCountAndError(self, wf):
+		outbox = Outbox(wf)
+		outbox.append(TaskParser().parse('buy milk'))
+		outbox.record_failure('network is down')
+		title, subtitle = outbox_warning(wf)
+		assert title == '1 task(s) not sent to Todoist yet'
+		assert subtitle.endswith('network is down')
+
+
+WORDS = u"""
+	Groceries, Garden, Garage, Work, Home, Office, Reading, Writing, Travel,
+	Finance, Taxes, Health, Fitness, Running, Cooking, Recipes, Music, Guitar,
+	Piano, Books, Movies, Family, Friends, Birthday, Holiday, Vacation, Car,
+	Maintenance, Repairs, Kitchen, Bathroom, Bedroom, Projects, Ideas, Someday,
+	Errands, Shopping, Clothes, School, Homework, Research, Reports, Meetings,
+	Clients, Invoices, Hiring, Planning, Budget, Insurance, Doctor, Dentist,
+	Pets, Photos, Website, Blog, Podcast, Newsletter, Volunteering, Church
+"""
+
+
+@pytest.mark.performance
+def test_SuggestNames_ThousandsOfProjects_WithinAFrame(wf):
+	words = [word.strip(string.punctuation) for word in WORDS.split()]
+	rand = random.Random(1)
+	projects = [u' '.join(rand.sample(words, 2)) for _ in range(5000)]
+	mirror = make_mirror(wf, projects=projects)
+	runs = 10
+	seconds = timeit.timeit(
+		lambda: suggest_names(wf, u'buy milk #gro', mirror), number=runs) / runs
+	print('5000 projects: {:.2f}ms'.format(seconds * 1000))
+	assert seconds < 1.0 / 60
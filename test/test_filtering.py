@@ -0,0 +1,533 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import multiprocessing
+import random
+import re
+import timeit
+import unicodedata
+
+import pytest
+
+from alfredtodoist.workflow import (
+	FilterIndex, Workflow, Workflow3,
+	MATCH_ALL, MATCH_ALLCHARS, MATCH_ATOM, MATCH_STARTSWITH, MATCH_SUBSTRING,
+	)
+from alfredtodoist.workflow import workflow
+from alfredtodoist.workflow.workflow import (
+	ASCII_REPLACEMENTS, FUZZY_MAX_SCORE, fold_to_ascii, fuzzy_score,
+	)
+
+
+WORDS = [
+	u'Groceries', u'home', u'OmniFocus', u'café', u'Übung', u'straße', u'How',
+	u'I', u'Met', u'Your', u'Mother', u'the-dukes', u'of', u'hazzard', u'x1',
+	u'Work', u'garage', u'garden',
+]
+QUERIES = [
+	u'g', u'gro', u'of', u'himym', u'doh', u'cafe', u'café', u'ubung',
+	u'strasse', u'ar', u'gr ho', u'mot her', u'zz', u'ß',
+]
+
+
+def make_items(count, seed=3):
+	rand = random.Random(seed)
+	return [u' '.join(rand.sample(WORDS, rand.randint(1, 4))) for _ in range(count)]
+
+
+@pytest.fixture
+def wf(tmpdir, monkeypatch):
+	monkeypatch.setenv('alfred_workflow_bundleid', 'com.example.test')
+	monkeypatch.setenv('alfred_workflow_cache', str(tmpdir.join('cache')))
+	monkeypatch.setenv('alfred_workflow_data', str(tmpdir.join('data')))
+	return Workflow()
+
+
+class TestFilterIndex():
+	@pytest.mark.parametrize('match_on', [MATCH_ALL, MATCH_ALL ^ MATCH_ALLCHARS])
+	def test_Filter_GivenIndex_MatchesUnindexedResults(self, wf, match_on):
+		items = make_items(500) + [u'', u'  ']
+		index = FilterIndex(items)
+		for query in QUERIES:
+			assert (wf.filter(query, index, include_score=True, match_on=match_on) ==
+				wf.filter(query, items, include_score=True, match_on=match_on))
+
+	def test_Filter_GivenIndexWithKey_ReturnsOriginalItems(self, wf):
+		items = [{'id': 1, 'name': u'Groceries'}, {'id': 2, 'name': u'Work'}]
+		index = FilterIndex(items, key=lambda item: item['name'])
+		assert wf.filter(u'gro', index) == [items[0]]
+
+	def test_Filter_EmptyQuery_ReturnsAllIndexedItems(self, wf):
+		index = FilterIndex([u'home', u'', u'work'])
+		assert wf.filter(u'', index) == [u'home', u'work']
+
+	def test_FilterIndex_CachedData_RoundTrips(self, wf):
+		items = make_items(50)
+		wf.cache_data('index', FilterIndex(items))
+		index = wf.cached_data('index', max_age=0)
+		assert wf.filter(u'gro', index) == wf.filter(u'gro', items)
+
+
+
+class TestNgramIndex():
+	@pytest.mark.parametrize('match_on', [
+		MATCH_ALL, MATCH_SUBSTRING, MATCH_STARTSWITH | MATCH_ATOM | MATCH_SUBSTRING])
+	def test_Filter_GivenNgramIndex_MatchesUnindexedResults(self, wf, match_on):
+		items = make_items(500)
+		index = FilterIndex(items, ngrams=True)
+		for query in QUERIES + [u'arag', u'gar hom', u'zzz']:
+			assert (wf.filter(query, index, include_score=True, match_on=match_on) ==
+				wf.filter(query, items, include_score=True, match_on=match_on))
+
+	def test_Add_NewItem_IsFound(self, wf):
+		index = FilterIndex([u'home', u'work'], ngrams=True)
+		index.add(u'garage')
+		assert wf.filter(u'arag', index, match_on=MATCH_SUBSTRING) == [u'garage']
+		assert len(index) == 3
+
+	def test_Remove_Item_IsNotFound(self, wf):
+		index = FilterIndex([u'garage', u'garden', u'work'], ngrams=True)
+		index.remove(u'garage')
+		assert wf.filter(u'gar', index) == [u'garden']
+		assert wf.filter(u'', index) == [u'garden', u'work']
+		assert len(index) == 2
+
+	def test_Remove_MissingItem_RaisesValueError(self):
+		with pytest.raises(ValueError):
+			FilterIndex([u'work'], ngrams=True).remove(u'home')
+
+	def test_NgramIndex_CachedData_CanBeUpdated(self, wf):
+		wf.cache_data('index', FilterIndex(make_items(50), ngrams=True))
+		index = wf.cached_data('index', max_age=0)
+		index.add(u'zebra crossing')
+		assert wf.filter(u'zeb', index) == [u'zebra crossing']
+
+
+class TestTopResults():
+	@pytest.mark.parametrize('options', [
+		{'max_results': 1},
+		{'max_results': 10},
+		{'max_results': 10, 'ascending': True},
+		{'max_results': 10, 'min_score': 80},
+	])
+	def test_Filter_MaxResults_SameAsSlicingFullRanking(self, wf, options):
+		items = make_items(500)
+		max_results = options.pop('max_results')
+		for query in QUERIES:
+			ranked = wf.filter(query, items, include_score=True, **options)
+			assert wf.filter(query, items, include_score=True,
+				max_results=max_results, **options) == ranked[:max_results]
+
+	def test_Filter_MinScore_DropsLowScores(self, wf):
+		results = wf.filter(u'g', make_items(500), include_score=True, min_score=90)
+		assert results
+		assert all(score > 90 for _, score, _ in results)
+
+	def test_Filter_LongKeyWithoutMinScore_KeepsNegativeScore(self, wf):
+		long_key = u'g' + u'x' * 300
+		assert wf.filter(u'g', [long_key]) == [long_key]
+
+
+class TestIfilter():
+	def test_Ifilter_MaxResults_StopsAfterStrongMatches(self, wf):
+		seen = []
+
+		def key(item):
+			seen.append(item)
+			return item
+
+		items = [u'garage', u'my garden', u'garden', u'groceries', u'garlic']
+		results = list(wf.ifilter(u'gar', items, key=key, max_results=2))
+		assert results == [u'garage', u'my garden', u'garden']
+		assert seen == items[:3]
+
+	def test_Ifilter_NoMaxResults_YieldsEveryMatchInItemOrder(self, wf):
+		items = make_items(200)
+		results = list(wf.ifilter(u'gro', FilterIndex(items)))
+		assert results == [item for item in items if item in set(wf.filter(u'gro', items))]
+
+	def test_Ifilter_EmptyQuery_YieldsAllItems(self, wf):
+		assert list(wf.ifilter(u' ', [u'home', u'work'])) == [u'home', u'work']
+
+
+class TestFilterMany():
+	@pytest.mark.parametrize('options', [
+		{},
+		{'max_results': 5, 'ascending': True},
+		{'min_score': 80, 'include_score': True},
+		{'match_on': MATCH_ALL ^ MATCH_ALLCHARS, 'fold_diacritics': False},
+	])
+	@pytest.mark.parametrize('make_index', [list, FilterIndex])
+	def test_FilterMany_SameAsFilterPerQuery(self, wf, options, make_index):
+		items = make_index(make_items(500) + [u'', u'  '])
+		queries = QUERIES + [u'', u' ', u'zzz']
+		assert wf.filter_many(queries, items, **options) == [
+			wf.filter(query, items, **options) for query in queries]
+
+	def test_FilterMany_ManyQueries_GetsEachKeyOnce(self, wf):
+		key = CountingKey()
+		items = make_items(100)
+		wf.filter_many(QUERIES, items, key=key)
+		assert key.calls == len(items)
+
+
+class TestParallelFilter():
+	@pytest.fixture(autouse=True)
+	def threshold(self, monkeypatch):
+		monkeypatch.setattr(workflow, 'PARALLEL_MIN_ITEMS', 100)
+
+	@pytest.mark.parametrize('options', [
+		{},
+		{'max_results': 10},
+		{'max_results': 10, 'ascending': True},
+		{'ascending': True, 'min_score': 80},
+		{'match_on': MATCH_ALL ^ MATCH_ALLCHARS},
+	])
+	@pytest.mark.parametrize('make_index', [
+		list,
+		FilterIndex,
+		lambda items: FilterIndex(items, ngrams=True),
+	])
+	def test_Filter_Parallel_SameAsSerial(self, wf, options, make_index):
+		# Few distinct keys, so there are ties across chunks
+		items = make_index(make_items(500) + [u'', u'  '])
+		for query in QUERIES + [u'zzz']:
+			assert (wf.filter(query, items, include_score=True, processes=3, **options) ==
+				wf.filter(query, items, include_score=True, **options))
+
+	def test_Filter_Parallel_ReturnsOriginalItems(self, wf):
+		items = [{'name': name} for name in make_items(500)]
+		results = wf.filter(u'gro', items, key=lambda item: item['name'], processes=3)
+		assert results
+		assert all(any(result is item for item in items) for result in results)
+
+	def test_Filter_ParallelKeyRaises_RaisesRuntimeError(self, wf):
+		with pytest.raises(RuntimeError) as err:
+			wf.filter(u'gro', make_items(500), key=lambda item: item.missing, processes=3)
+		assert 'AttributeError' in str(err.value)
+
+	def test_Filter_ParallelGivenGenerator_SameAsSerial(self, wf):
+		items = make_items(500)
+		assert (wf.filter(u'gro', (item for item in items), processes=3) ==
+			wf.filter(u'gro', items))
+
+	def test_Filter_ParallelBelowThreshold_ScoresInProcess(self, wf, monkeypatch):
+		monkeypatch.setattr(multiprocessing, 'Process', pytest.fail)
+		assert wf.filter(u'gro', make_items(99), processes=3) == wf.filter(
+			u'gro', make_items(99))
+
+
+@pytest.fixture
+def wf3(tmpdir, monkeypatch):
+	monkeypatch.setenv('alfred_workflow_bundleid', 'com.example.test')
+	monkeypatch.setenv('alfred_workflow_cache', str(tmpdir.join('cache')))
+	monkeypatch.setenv('alfred_workflow_data', str(tmpdir.join('data')))
+	monkeypatch.setenv('_WF_SESSION_ID', 'session')
+	return Workflow3()
+
+
+class CountingKey():
+	def __init__(self):
+		self.calls = 0
+
+	def __call__(self, item):
+		self.calls += 1
+		return item
+
+
+class TestIncrementalFilter():
+	KEYSTROKES = [u'g', u'ga', u'gar', u'gar ', u'gar h', u'gar', u'ga', u'h', u'ho', u'hé']
+
+	@pytest.mark.parametrize('as_index', [False, True])
+	@pytest.mark.parametrize('match_on', [MATCH_ALL, MATCH_ATOM, MATCH_ATOM | MATCH_SUBSTRING])
+	def test_Filter_Incremental_SameAsFullFilter(self, wf3, as_index, match_on):
+		items = make_items(500)
+		searched = FilterIndex(items) if as_index else items
+		for query in self.KEYSTROKES:
+			assert (wf3.filter(query, searched, include_score=True, match_on=match_on,
+					incremental='items') ==
+				wf3.filter(query, items, include_score=True, match_on=match_on))
+
+	@pytest.fixture
+	def tested(self, monkeypatch):
+		"""Number of items each call to `_score_items` tests."""
+		counts = []
+		score_items = workflow.Workflow._score_items
+
+		def spy(wf, query, items, *args):
+			items = list(items)
+			counts.append(len(items))
+			return score_items(wf, query, items, *args)
+
+		monkeypatch.setattr(workflow.Workflow, '_score_items', spy)
+		return counts
+
+	def test_Filter_IncrementalExtendedQuery_TestsOnlyPreviousMatches(self, wf3, tested):
+		items = make_items(500)
+		matches = len(wf3.filter(u'ga', items, incremental='items'))
+		del tested[:]
+		wf3.filter(u'gar', items, incremental='items')
+		assert tested == [matches] and matches < len(items)
+
+	@pytest.mark.parametrize('as_index', [False, True])
+	def test_Filter_IncrementalListChangedSameLength_FindsNewMatches(self, wf3, as_index):
+		items = make_items(500)
+		matches = wf3.filter(u'ga', FilterIndex(items) if as_index else items,
+			incremental='items')
+		changed = list(items)
+		renamed = next(i for i, item in enumerate(items) if item not in matches)
+		changed[renamed] = u'garden tools'
+		searched = FilterIndex(changed) if as_index else changed
+		results = wf3.filter(u'gar', searched, incremental='items')
+		assert u'garden tools' in results
+		assert results == wf3.filter(u'gar', changed)
+
+	def test_Filter_IncrementalEditedBackwards_TestsEveryItem(self, wf3, tested):
+		items = make_items(500)
+		wf3.filter(u'gar', items, incremental='items')
+		del tested[:]
+		wf3.filter(u'ga', items, incremental='items')
+		assert tested == [len(items)]
+
+	def test_Filter_IncrementalMaxResults_KeepsEveryMatchForNextQuery(self, wf3):
+		items = make_items(500)
+		wf3.filter(u'g', items, max_results=1, min_score=99, incremental='items')
+		assert (wf3.filter(u'ga', items, incremental='items') ==
+			wf3.filter(u'ga', items))
+
+	def test_Filter_IncrementalOtherSession_TestsEveryItem(self, wf3, monkeypatch, tested):
+		items = make_items(500)
+		wf3.filter(u'ga', items, incremental='items')
+		monkeypatch.setenv('_WF_SESSION_ID', 'other')
+		del tested[:]
+		Workflow3().filter(u'gar', items, incremental='items')
+		assert tested == [len(items)]
+
+
+def fuzzy(value, query):
+	return fuzzy_score(value, value.lower(), query)
+
+
+EUROPEAN_WORDS = (
+	u'Übung Straße Größe Äpfel Öffnungszeiten Bürgermeister Frühstück Müller '
+	u'Käse Brötchen Fußball Rechnung bezahlen café crème brûlée français '
+	u'garçon élève hôpital Noël naïve œuvre déjà Zürich Genève réunion '
+	u'appeler Łódź Ærø'
+	).split()
+
+
+def make_european_titles(count, seed=5):
+	rand = random.Random(seed)
+	return [u' '.join(rand.sample(EUROPEAN_WORDS, rand.randint(2, 5)))
+		for _ in range(count)]
+
+
+def join_fold(text):
+	"""The per-character `fold_to_ascii` the translate table replaced."""
+	text = u''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
+	return unicode(unicodedata.normalize('NFKD', text).encode('ascii', 'ignore'))
+
+
+@pytest.fixture
+def empty_fold_cache(monkeypatch):
+	monkeypatch.setattr(workflow, '_folded', {})
+	monkeypatch.setattr(workflow, '_folded_before', {})
+
+
+class TestFoldToAscii():
+	def test_FoldToAscii_SameAsPerCharacterFolding(self, empty_fold_cache):
+		texts = make_european_titles(200) + list(ASCII_REPLACEMENTS) + [
+			u'plain', u'', u'e\u0301te\u0301', u'ﬁancé', u'日本']
+		for text in texts:
+			assert fold_to_ascii(text) == join_fold(text)
+
+	def test_FoldToAscii_Repeated_ReturnsRememberedString(self, empty_fold_cache):
+		text = u'Größe'
+		assert fold_to_ascii(text) is fold_to_ascii(u'Grö' + u'ße')
+
+	def test_FoldToAscii_ManyStrings_KeepsCacheBounded(
+			self, empty_fold_cache, monkeypatch):
+		monkeypatch.setattr(workflow, 'FOLD_CACHE_SIZE', 10)
+		for i in range(100):
+			fold_to_ascii(u'café {}'.format(i))
+		assert len(workflow._folded) + len(workflow._folded_before) <= 20
+		# The most recent strings are still there
+		assert u'café 99' in workflow._folded
+
+
+REGEX_CACHE = {}
+
+
+def regex_allchars(value, query):
+	"""The regex MATCH_ALLCHARS test `fuzzy_score` replaced."""
+	if query not in REGEX_CACHE:
+		pattern = ''.join('.*?' + re.escape(c) for c in query)
+		REGEX_CACHE[query] = re.compile(pattern, re.IGNORECASE).search
+	match = REGEX_CACHE[query](value)
+	if match:
+		return 100.0 / ((1 + match.start()) * (match.end() - match.start() + 1))
+	return 0
+
+
+class TestFuzzyScore():
+	def test_FuzzyScore_NotASubsequence_ReturnsZero(self):
+		assert fuzzy(u'garden', u'gdr') == 0
+
+	def test_FuzzyScore_ConsecutiveRun_BeatsScattered(self):
+		assert fuzzy(u'xabcx', u'abc') > fuzzy(u'xaxbxcx', u'abc')
+
+	def test_FuzzyScore_WordStarts_BeatMidWord(self):
+		assert fuzzy(u'foo bar', u'fb') > fuzzy(u'xfxxbx', u'fb')
+
+	def test_FuzzyScore_CamelCase_BeatsMidWord(self):
+		assert fuzzy(u'fooBar', u'fb') > fuzzy(u'foobar', u'fb')
+
+	def test_FuzzyScore_RepeatedFirstCharacter_UsesShortestStretch(self):
+		assert fuzzy(u'a------ab', u'ab') == fuzzy(u'-------ab', u'ab')
+
+	def test_FuzzyScore_PerfectMatch_AtMostMaxScore(self):
+		assert 0 < fuzzy(u'Foo Bar', u'fb') <= FUZZY_MAX_SCORE
+
+	def test_Filter_AllChars_RanksWordStartsFirst(self, wf):
+		items = [u'smog', u'my garage', u'ammonia gas']
+		assert wf.filter(u'mg', items, match_on=MATCH_ALLCHARS) == [
+			u'my garage', u'ammonia gas', u'smog']
+
+
+@pytest.mark.performance
+def test_FuzzyScore_FailingLongValue_LinearUnlikeRegex():
+	value = u'b' + u'a' * 400
+	regex = timeit.timeit(lambda: regex_allchars(value, u'ab'), number=1)
+	linear = timeit.timeit(lambda: fuzzy(value, u'ab'), number=1)
+	print('failing match on 401 chars: regex: {:.1f}ms, fuzzy_score: {:.3f}ms'.format(
+		regex * 1000, linear * 1000))
+	assert linear * 100 < regex
+
+
+@pytest.mark.performance
+def test_FuzzyScore_Corpus_FasterThanRegex():
+	values = make_items(20000)
+	queries = [u'gmo', u'hzd', u'ofc', u'wgr']
+	regex = timeit.timeit(
+		lambda: [regex_allchars(v, q) for q in queries for v in values], number=1)
+	linear = timeit.timeit(
+		lambda: [fuzzy(v, q) for q in queries for v in values], number=1)
+	print('20k items x {} queries: regex: {:.0f}ms, fuzzy_score: {:.0f}ms'.format(
+		len(queries), regex * 1000, linear * 1000))
+	assert linear < regex
+
+
+@pytest.mark.performance
+@pytest.mark.parametrize('query,match_on', [
+	(u'arag', MATCH_STARTSWITH | MATCH_ATOM | MATCH_SUBSTRING),
+	(u'zk', MATCH_ALL),
+])
+def test_NgramIndex_SelectiveQuery_FasterThanScanningIndex(wf, query, match_on):
+	items = make_items(50000) + [u'zkoumat {}'.format(i) for i in range(50)]
+	build = timeit.timeit(lambda: FilterIndex(items, ngrams=True), number=1)
+	index = FilterIndex(items)
+	ngrams = FilterIndex(items, ngrams=True)
+	runs = 5
+	scan = timeit.timeit(
+		lambda: wf.filter(query, index, match_on=match_on), number=runs) / runs
+	narrowed = timeit.timeit(
+		lambda: wf.filter(query, ngrams, match_on=match_on), number=runs) / runs
+	print('50k items, {!r}: build: {:.0f}ms, scan: {:.1f}ms, n-grams: {:.1f}ms'.format(
+		query, build * 1000, scan * 1000, narrowed * 1000))
+	assert narrowed < scan
+
+
+@pytest.mark.performance
+def test_Filter_SmallMaxResults_FasterThanSortingEveryMatch(wf):
+	index = FilterIndex(make_items(50000))
+	runs = 5
+	top = timeit.timeit(
+		lambda: wf.filter(u'g', index, max_results=10), number=runs) / runs
+	sliced = timeit.timeit(
+		lambda: wf.filter(u'g', index)[:10], number=runs) / runs
+	first = timeit.timeit(
+		lambda: list(wf.ifilter(u'g', index, max_results=10)), number=runs) / runs
+	print('50k items, k=10: top-k: {:.0f}ms, sort all: {:.0f}ms, ifilter: {:.2f}ms'.format(
+		top * 1000, sliced * 1000, first * 1000))
+	assert top < sliced
+	assert first < top
+
+
+@pytest.mark.performance
+def test_FilterIndex_RepeatedQueries_FasterThanUnindexed(wf):
+	items = make_items(50000)
+	queries = [u'g', u'gr', u'gro', u'groc']
+	build = timeit.timeit(lambda: FilterIndex(items), number=1)
+	index = FilterIndex(items)
+	indexed = timeit.timeit(
+		lambda: [wf.filter(q, index) for q in queries], number=1) / len(queries)
+	unindexed = timeit.timeit(
+		lambda: [wf.filter(q, items) for q in queries], number=1) / len(queries)
+	print('50k items: index build: {:.0f}ms, indexed: {:.0f}ms, unindexed: {:.0f}ms'.format(
+		build * 1000, indexed * 1000, unindexed * 1000))
+	assert indexed < unindexed
+
+
+@pytest.mark.performance
+def test_Filter_IncrementalKeystrokes_FasterThanFullFilter(wf3):
+	items = make_items(50000)
+	keystrokes = [u'g', u'ga', u'gar', u'gara', u'garag']
+	full = timeit.timeit(
+		lambda: [wf3.filter(q, items, max_results=20) for q in keystrokes], number=1)
+	incremental = timeit.timeit(
+		lambda: [wf3.filter(q, items, max_results=20, incremental='items')
+			for q in keystrokes], number=1)
+	print('50k items, {} keystrokes: incremental: {:.0f}ms, full: {:.0f}ms'.format(
+		len(keystrokes), incremental * 1000, full * 1000))
+	assert incremental < full
+
+
+@pytest.mark.performance
+def test_Filter_Parallel_Crossover(wf, monkeypatch):
+	"""
+	Times serial and parallel filtering of growing lists, to show where
+	`PARALLEL_MIN_ITEMS` should be.
+	"""
+	monkeypatch.setattr(workflow, 'PARALLEL_MIN_ITEMS', 0)
+	processes = max(multiprocessing.cpu_count(), 2)
+	timings = {}
+	for count in [1000, 5000, 20000, 50000, 100000]:
+		items = make_items(count)
+		serial = timeit.timeit(
+			lambda: wf.filter(u'gro', items, max_results=20), number=3) / 3
+		parallel = timeit.timeit(
+			lambda: wf.filter(u'gro', items, max_results=20, processes=processes),
+			number=3) / 3
+		timings[count] = (serial, parallel)
+		print('{} items, {} processes: serial: {:.0f}ms, parallel: {:.0f}ms'.format(
+			count, processes, serial * 1000, parallel * 1000))
+	if multiprocessing.cpu_count() < 2:
+		pytest.skip('needs more than one CPU')
+	assert timings[1000][1] > timings[1000][0]
+	assert timings[100000][1] < timings[100000][0]
+
+
+@pytest.mark.performance
+def test_FilterMany_SeveralQueries_FasterThanFilterPerQuery(wf):
+	items = make_items(20000)
+	queries = [u'gro', u'home', u'cafe', u'mot', u'ga']
+	many = timeit.timeit(lambda: wf.filter_many(queries, items), number=3) / 3
+	each = timeit.timeit(
+		lambda: [wf.filter(query, items) for query in queries], number=3) / 3
+	print('20k items, {} queries: filter_many: {:.0f}ms, filter each: {:.0f}ms'.format(
+		len(queries), many * 1000, each * 1000))
+	assert many < each
+
+
+@pytest.mark.performance
+def test_FoldToAscii_EuropeanTitles_FasterThanPerCharacter(empty_fold_cache):
+	titles = make_european_titles(5000)
+	runs = 10
+	per_character = timeit.timeit(
+		lambda: [join_fold(t) for t in titles], number=runs) / runs
+	cold = timeit.timeit(lambda: [fold_to_ascii(t) for t in titles], number=1)
+	warm = timeit.timeit(
+		lambda: [fold_to_ascii(t) for t in titles], number=runs) / runs
+	print('5k titles: per character: {:.1f}ms, table: {:.1f}ms, remembered: {:.1f}ms'.format(
+		per_character * 1000, cold * 1000, warm * 1000))
+	assert cold < per_character
+	assert warm < cold
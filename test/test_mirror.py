@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+from mock import Mock
+
+import pytest
+
+from alfredtodoist.addtask import build_api_payload
+from alfredtodoist.mirror import MIRROR_NAME, TodoistMirror
+
+
+def sync_response(full_sync=True, labels=None, projects=None, token='token-2'):
+	response = Mock()
+	response.json.return_value = {
+		'full_sync': full_sync,
+		'sync_token': token,
+		'labels': labels or [],
+		'projects': projects or [],
+	}
+	return response
+
+
+@pytest.fixture
+def api():
+	api = Mock()
+	api.token = 'key'
+	api.get_api_url.return_value = 'https://todoist.com/API/v7/'
+	return api
+
+
+@pytest.fixture
+def fresh_mirror_data():
+	return {
+		'sync_token': 'token-1',
+		'synced_at': time.time(),
+		'labels': {1: {'id': 1, 'name': 'errands'}},
+		'projects': {5: {'id': 5, 'name': 'groceries'}},
+	}
+
+
+@pytest.fixture
+def mirror_wf(fake_wf, fresh_mirror_data):
+	fake_wf.stored[MIRROR_NAME] = fresh_mirror_data
+	return fake_wf
+
+
+class TestMirrorSync():
+	def test_Sync_FirstRun_SendsFullSyncTokenAndStores(self, api, fake_wf):
+		wf = fake_wf
+		api.session.post.return_value = sync_response(
+			labels=[{'id': 1, 'name': 'errands'}])
+		TodoistMirror(wf, api).sync()
+		data = api.session.post.call_args[1]['data']
+		assert data['sync_token'] == '*'
+		assert wf.stored[MIRROR_NAME]['sync_token'] == 'token-2'
+		assert wf.stored[MIRROR_NAME]['labels'] == {1: {'id': 1, 'name': 'errands'}}
+
+	def test_Sync_GivenDelta_UpdatesOnlyChangedObjects(self, api, mirror_wf):
+		wf = mirror_wf
+		api.session.post.return_value = sync_response(
+			full_sync=False,
+			labels=[{'id': 2, 'name': 'phone'}],
+			projects=[{'id': 5, 'name': 'groceries', 'is_deleted': 1}])
+		mirror = TodoistMirror(wf, api)
+		mirror.sync()
+		assert api.session.post.call_args[1]['data']['sync_token'] == 'token-1'
+		assert sorted(mirror.tables['labels']) == [1, 2]
+		assert mirror.tables['projects'] == {}
+
+
+class TestMirrorResolution():
+	def test_BuildApiPayload_FreshMirrorWithNames_MakesNoNetworkCall(self, api, mirror_wf, fresh_mirror_data):
+		mirror = TodoistMirror(mirror_wf, api)
+		task = {'labels': ['errands'], 'project': 'groceries', 'priority': 1, 'due': ''}
+		payload = build_api_payload(task, mirror)
+		api.sync.assert_not_called()
+		api.session.post.assert_not_called()
+		assert payload['labels'] == [1]
+		assert payload['project'] == 5
+
+	def test_BuildApiPayload_MissingName_DeltaSyncs(self, api, mirror_wf, fresh_mirror_data):
+		mirror = TodoistMirror(mirror_wf, api)
+		api.session.post.return_value = sync_response(
+			full_sync=False, labels=[{'id': 3, 'name': 'phone'}])
+		task = {'labels': ['phone'], 'project': '', 'priority': 1, 'due': ''}
+		payload = build_api_payload(task, mirror)
+		api.sync.assert_not_called()
+		assert api.session.post.call_count == 1
+		assert payload['labels'] == [3]
+
+	def test_BuildApiPayload_StaleMirror_DeltaSyncs(self, api, mirror_wf, fresh_mirror_data):
+		fresh_mirror_data['synced_at'] = 0
+		mirror = TodoistMirror(mirror_wf, api)
+		api.session.post.return_value = sync_response(full_sync=False)
+		task = {'labels': ['errands'], 'project': '', 'priority': 1, 'due': ''}
+		build_api_payload(task, mirror)
+		assert api.session.post.call_count == 1
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+
+from mock import Mock
+
+import pytest
+
+from alfredtodoist import flushoutbox
+from alfredtodoist import outbox as outbox_module
+from alfredtodoist.outbox import (
+	RETRY_DELAY, Outbox, SyncError, entry_commands, resume_flush,
+	)
+from alfredtodoist.workflow import notify
+
+
+def make_task(todo, notes=None):
+	return {
+		'labels': [],
+		'priority': '',
+		'project': '',
+		'due': '',
+		'notes': notes or [],
+		'todo': todo
+	}
+
+
+def build_payload(task):
+	return {'project': 0, 'labels': [], 'priority': 1, 'date_string': ''}
+
+
+@pytest.fixture
+def outbox(fake_wf):
+	return Outbox(fake_wf)
+
+
+class TestJournal():
+	def test_Append_ThenEntries_ReturnsTasksInOrder(self, outbox):
+		outbox.append(make_task('first'))
+		outbox.append(make_task('second', notes=['a note']))
+		entries = outbox.entries()
+		assert [e['task']['todo'] for e in entries] == ['first', 'second']
+		assert len(entries[1]['notes']) == 1
+
+	def test_Entries_GivenTruncatedLastLine_SkipsIt(self, outbox):
+		outbox.append(make_task('first'))
+		with open(outbox.path, 'ab') as fp:
+			fp.write('{"id": "half a li')
+		assert [e['task']['todo'] for e in outbox.entries()] == ['first']
+
+	def test_Remove_KeepsOtherEntries(self, outbox):
+		first = outbox.append(make_task('first'))
+		outbox.append(make_task('second'))
+		outbox.remove([first['id']])
+		assert [e['task']['todo'] for e in outbox.entries()] == ['second']
+
+	def test_EntryCommands_NotesReferToItemTempId(self, outbox):
+		entry = outbox.append(make_task('first', notes=['a', 'b']))
+		item, note_a, note_b = entry_commands(entry, 0, {})
+		assert note_a['args']['item_id'] == item['temp_id']
+		assert note_b['args']['item_id'] == item['temp_id']
+
+
+class TestFlush():
+	def test_Flush_AllAccepted_EmptiesJournal(self, outbox, accepting_api):
+		outbox.append(make_task('first'))
+		outbox.append(make_task('second', notes=['a note']))
+		api = accepting_api
+		assert outbox.flush(api, build_payload) == 2
+		assert outbox.entries() == []
+		assert len(api.requests) == 1
+
+	def test_Flush_GivenLimit_SendsBatchesWithinLimit(self, outbox, accepting_api):
+		for i in range(5):
+			outbox.append(make_task('task %d' % i, notes=['note']))
+		api = accepting_api
+		outbox.flush(api, build_payload, limit=4)
+		assert [len(commands) for commands in api.requests] == [4, 4, 2]
+
+	def test_Flush_AfterFailedRequest_ResendsSameUuids(self, outbox, accepting_api):
+		outbox.append(make_task('first', notes=['a note']))
+		api = accepting_api
+		failing = Mock()
+		failing.queue = []
+		failing.commit.side_effect = IOError('network is down')
+		with pytest.raises(IOError):
+			outbox.flush(failing, build_payload)
+		assert len(outbox.entries()) == 1
+
+		outbox.flush(api, build_payload)
+		assert ([cmd['uuid'] for cmd in failing.queue] ==
+			[cmd['uuid'] for cmd in api.requests[0]])
+		assert outbox.entries() == []
+
+	def test_Flush_RejectedCommand_IsDropped(self, outbox):
+		outbox.append(make_task('first'))
+		api = Mock()
+		api.queue = []
+		api.commit.side_effect = lambda raise_on_error=True: {
+			'sync_status': {cmd['uuid']: {'error': 'invalid'} for cmd in api.queue}}
+		outbox.flush(api, build_payload)
+		assert outbox.entries() == []
+
+
+class TestSyncErrors():
+	@pytest.mark.parametrize('response', [
+		{'error': 'Invalid token', 'error_code': 401, 'http_code': 403},
+		{},
+		None,
+	])
+	def test_Flush_CommitReturnsNoStatus_RaisesAndKeepsEntries(self, outbox, response):
+		outbox.append(make_task('first'))
+		api = Mock()
+		api.queue = []
+		api.commit.return_value = response
+		with pytest.raises(SyncError):
+			outbox.flush(api, build_payload)
+		assert len(outbox.entries()) == 1
+
+
+class TestFailures():
+	def test_RecordFailure_CountsFailuresInARow(self, outbox):
+		assert outbox.record_failure(IOError('network is down')) == 1
+		assert outbox.record_failure(IOError('still down')) == 2
+		assert outbox.failure()['error'] == 'still down'
+		outbox.clear_failure()
+		assert outbox.failure() is None
+
+	def test_RetryDue_BacksOffAfterEachFailure(self, outbox):
+		assert outbox.retry_due()
+		outbox.record_failure('down')
+		failed_at = outbox.failure()['failed_at']
+		assert not outbox.retry_due(failed_at + RETRY_DELAY - 1)
+		assert outbox.retry_due(failed_at + RETRY_DELAY)
+		outbox.record_failure('down')
+		failed_at = outbox.failure()['failed_at']
+		assert not outbox.retry_due(failed_at + RETRY_DELAY)
+		assert outbox.retry_due(failed_at + RETRY_DELAY * 2)
+
+	def test_ResumeFlush_OnlyWhenWaitingAndDue(self, outbox, monkeypatch):
+		started = []
+		monkeypatch.setattr(outbox_module, 'start_flusher', started.append)
+		resume_flush(outbox.wf)
+		assert started == []
+		outbox.append(make_task('first'))
+		resume_flush(outbox.wf)
+		assert started == [outbox.wf]
+		outbox.record_failure('down')
+		resume_flush(outbox.wf)
+		assert started == [outbox.wf]
+
+
+class TestFlusher():
+	@pytest.fixture
+	def notifications(self, monkeypatch):
+		notifications = []
+		monkeypatch.setattr(notify, 'notify',
+			lambda title, text: notifications.append(title))
+		return notifications
+
+	def test_Main_FlushFails_RecordsAndNotifiesOnce(self, outbox, notifications, monkeypatch):
+		def fail(wf, outbox):
+			raise IOError('network is down')
+		monkeypatch.setattr(flushoutbox, 'send_outbox', fail)
+		outbox.append(make_task('first'))
+		flushoutbox.main(outbox.wf)
+		flushoutbox.main(outbox.wf)
+		assert outbox.failure()['failures'] == 2
+		assert notifications == ['Tasks not sent to Todoist']
+		assert len(outbox.entries()) == 1
+		outbox.wf.logger.exception.assert_called()
+
+	def test_Main_CommitReturnsError_RecordsFailureAndBacksOff(self, outbox, notifications,
+			monkeypatch):
+		api = Mock()
+		api.queue = []
+		api.commit.return_value = {'error': 'Invalid token', 'http_code': 403}
+		monkeypatch.setattr(flushoutbox, 'send_outbox',
+			lambda wf, outbox: outbox.flush(api, build_payload))
+		outbox.append(make_task('first'))
+		flushoutbox.main(outbox.wf)
+		assert outbox.failure()['error'] == 'Invalid token'
+		assert notifications == ['Tasks not sent to Todoist']
+		assert len(outbox.entries()) == 1
+		assert not outbox.retry_due()
+
+	def test_Main_SentSeveral_NotifiesThroughput(self, outbox, monkeypatch):
+		notifications = []
+		monkeypatch.setattr(notify, 'notify',
+			lambda title, text: notifications.append(text))
+		monkeypatch.setattr(flushoutbox, 'send_outbox', lambda wf, outbox: 30)
+		flushoutbox.main(outbox.wf)
+		[text] = notifications
+		assert text.startswith('Added 30 tasks in ')
+		assert text.endswith(' tasks/s)')
+		outbox.wf.logger.info.assert_called_with(text)
+
+	def test_Throughput_GivenSentAndSeconds_ReportsRate(self):
+		assert flushoutbox.throughput(30, 1.2) == 'Added 30 tasks in 1.20s (25.0 tasks/s)'
+		assert flushoutbox.throughput(0, 0) == 'Added 0 tasks in 0.00s (0.0 tasks/s)'
+
+	def test_Main_FlushSucceeds_ClearsFailure(self, outbox, notifications, monkeypatch):
+		monkeypatch.setattr(flushoutbox, 'send_outbox', lambda wf, outbox: 0)
+		outbox.record_failure('down')
+		flushoutbox.main(outbox.wf)
+		assert outbox.failure() is None
+		assert notifications == []
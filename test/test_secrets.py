@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pytest
+
+from alfredtodoist.workflow import Workflow3, PasswordNotFound
+from alfredtodoist.workflow.workflow import CachingBackend, FileBackend
+
+
+class CountingBackend(FileBackend):
+	"""Counts the calls that reach the backend, i.e. would spawn `security`."""
+	calls = 0
+
+	def get(self, service, account):
+		self.calls += 1
+		return FileBackend.get(self, service, account)
+
+
+@pytest.fixture
+def wf(tmpdir, monkeypatch):
+	monkeypatch.setenv('alfred_workflow_bundleid', 'com.example.test')
+	monkeypatch.setenv('alfred_workflow_cache', str(tmpdir.join('cache')))
+	monkeypatch.setenv('alfred_workflow_data', str(tmpdir.join('data')))
+	monkeypatch.setenv('_WF_SESSION_ID', 'session')
+	return Workflow3()
+
+
+class TestFileBackend():
+	def test_GetPassword_AfterSave_ReturnsPassword(self, wf):
+		wf.secret_backend = FileBackend(wf.datafile('passwords.json'))
+		wf.save_password('todoist', 'key')
+		assert wf.get_password('todoist') == 'key'
+
+	def test_GetPassword_AfterDelete_RaisesNotFound(self, wf):
+		wf.secret_backend = FileBackend(wf.datafile('passwords.json'))
+		wf.save_password('todoist', 'key')
+		wf.delete_password('todoist')
+		with pytest.raises(PasswordNotFound):
+			wf.get_password('todoist')
+
+	def test_Save_CreatesFileReadableOnlyByUser(self, wf):
+		backend = FileBackend(wf.datafile('passwords.json'))
+		backend.save('service', 'account', 'key')
+		assert os.stat(backend.filepath).st_mode & 0o777 == 0o600
+
+
+class TestCachingBackend():
+	def test_GetPassword_RepeatedAcrossProcesses_CallsBackendOnce(self, wf):
+		backend = CountingBackend(wf.datafile('passwords.json'))
+		backend.save('com.example.test', 'todoist', 'key')
+		cache_path = wf.cachefile('passwords.cache')
+		for _ in range(5):
+			# A fresh CachingBackend per run, as in a new Script Filter process
+			wf.secret_backend = CachingBackend(backend, cache_path, ttl=60)
+			assert wf.get_password('todoist') == 'key'
+		assert backend.calls == 1
+
+	def test_Get_CacheHit_CountsWithoutWriting(self, wf):
+		backend = CountingBackend(wf.datafile('passwords.json'))
+		backend.save('service', 'account', 'key')
+		cache = CachingBackend(backend, wf.cachefile('passwords.cache'), ttl=60)
+		cache.get('service', 'account')
+		os.utime(cache.filepath, (1000, 1000))
+		for _ in range(4):
+			cache.get('service', 'account')
+		assert cache.calls_saved == 4
+		assert os.stat(cache.filepath).st_mtime == 1000
+
+	def test_Save_AfterHits_PersistsCount(self, wf):
+		backend = CountingBackend(wf.datafile('passwords.json'))
+		cache = CachingBackend(backend, wf.cachefile('passwords.cache'))
+		cache.save('service', 'account', 'key')
+		cache.get('service', 'account')
+		cache.save('service', 'other', 'key')
+		assert CachingBackend(backend, cache.filepath).calls_saved == 1
+
+	def test_Save_DropsExpiredEntries(self, wf):
+		backend = CountingBackend(wf.datafile('passwords.json'))
+		cache = CachingBackend(backend, wf.cachefile('passwords.cache'))
+		cache.save('service', 'old', 'key')
+		cache.data['entries']['service\nold'][1] = time.time() - 1
+		cache.save('service', 'new', 'key')
+		reloaded = CachingBackend(backend, cache.filepath)
+		assert list(reloaded.data['entries']) == ['service\nnew']
+
+	def test_Get_AfterTtl_CallsBackendAgain(self, wf):
+		backend = CountingBackend(wf.datafile('passwords.json'))
+		backend.save('service', 'account', 'key')
+		cache = CachingBackend(backend, wf.cachefile('passwords.cache'), ttl=60)
+		cache.get('service', 'account')
+		cache.data['entries']['service\naccount'][1] = time.time() - 1
+		cache.get('service', 'account')
+		assert backend.calls == 2
+
+	def test_Save_UpdatesCachedPassword(self, wf):
+		backend = CountingBackend(wf.datafile('passwords.json'))
+		cache = CachingBackend(backend, wf.cachefile('passwords.cache'))
+		cache.save('service', 'account', 'old')
+		cache.save('service', 'account', 'new')
+		assert cache.get('service', 'account') == 'new'
+		assert backend.calls == 0
+
+	def test_PasswordCacheTtl_DefaultBackend_IsSessionScoped(self, wf):
+		wf.password_cache_ttl = 30
+		backend = wf.secret_backend
+		assert isinstance(backend, CachingBackend)
+		assert os.path.basename(backend.filepath) == '_wfsess-session-passwords.json'
+
+	def test_PasswordCacheTtl_NewSession_RemovesStaleSessionCaches(self, wf):
+		stale = wf.cachefile('_wfsess-old-passwords.json')
+		recent = wf.cachefile('_wfsess-other-passwords.json')
+		for path in (stale, recent):
+			with open(path, 'wb') as fp:
+				fp.write('{}')
+		os.utime(stale, (time.time() - 60, time.time() - 60))
+		wf.password_cache_ttl = 30
+		wf.secret_backend
+		assert not os.path.exists(stale)
+		assert os.path.exists(recent)
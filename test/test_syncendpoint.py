@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests that talk to a local stand-in for Todoist's sync endpoint.
+"""
+import BaseHTTPServer
+import json
+import threading
+import urlparse
+
+import pytest
+
+from alfredtodoist.outbox import entry_commands, new_entry, send_commands
+
+todoist = pytest.importorskip('todoist')
+
+
+class FakeSyncHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	def do_POST(self):
+		length = int(self.headers.getheader('content-length'))
+		form = urlparse.parse_qs(self.rfile.read(length))
+		commands = json.loads(form.get('commands', ['[]'])[0])
+		self.server.requests.append({'path': self.path, 'commands': commands})
+
+		ids = iter(range(1000, 2000))
+		body = json.dumps({
+			'sync_token': 'token-%d' % len(self.server.requests),
+			'full_sync': False,
+			'sync_status': {cmd['uuid']: 'ok' for cmd in commands},
+			'temp_id_mapping': {
+				cmd['temp_id']: next(ids) for cmd in commands if 'temp_id' in cmd
+			},
+		})
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+@pytest.fixture
+def sync_server():
+	server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FakeSyncHandler)
+	server.requests = []
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+
+
+def fake_api(server):
+	endpoint = 'http://127.0.0.1:%d' % server.server_address[1]
+	return todoist.TodoistAPI('key', api_endpoint=endpoint, cache=None)
+
+
+def send_task(server, notes):
+	task = {'todo': 'test todo', 'notes': notes}
+	commands = entry_commands(new_entry(task), 0, {})
+	return send_commands(fake_api(server), commands)
+
+
+@pytest.mark.integration
+class TestSendTaskRoundTrips():
+	@pytest.mark.parametrize('note_count', [0, 1, 5, 50])
+	def test_SendCommands_GivenNotes_SendsSingleRequest(self, sync_server, note_count):
+		notes = ['note %d' % i for i in range(note_count)]
+		status = send_task(sync_server, notes)
+		assert len(sync_server.requests) == 1
+		assert len(status) == note_count + 1
+		commands = sync_server.requests[0]['commands']
+		assert len(commands) == note_count + 1
+
+	def test_SendCommands_GivenNotes_NotesReferToTaskTempId(self, sync_server):
+		send_task(sync_server, ['a', 'b'])
+		item_add, note_a, note_b = sync_server.requests[0]['commands']
+		assert item_add['type'] == 'item_add'
+		assert note_a['type'] == note_b['type'] == 'note_add'
+		assert note_a['args']['item_id'] == item_add['temp_id']
+		assert note_b['args']['item_id'] == item_add['temp_id']
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import re
+import timeit
+
+import pytest
+
+from alfredtodoist.parse import TaskParser
+
+
+class LegacyTaskParser:
+	"""
+	The multi-pass parser `TaskParser` replaced. Kept as the reference for
+	parity and latency checks.
+	"""
+	label_regex = r'(?<=@)\w+'
+	priority_regex = r'(?P<prefix>!!|p)(?P<priority>[1234])'
+	project_regex = r'''#([`{\("'](?P<project_space>[\w ]+)[`}\)"']|(?P<project>[-\w]+))'''
+
+	def _pop_labels(self, text):
+		labels = [g for g in re.findall(self.label_regex, text)]
+		for label in labels:
+			text = text.replace('@' + label, '')
+		return labels, text
+
+	def _pop_priority(self, text):
+		priority = re.search(self.priority_regex, text)
+		if priority:
+			priority_number = priority.group('priority')
+			replacement = priority.group('prefix') + priority_number
+			text = text.replace(replacement, '')
+		else:
+			priority_number = ''
+		return priority_number, text
+
+	def _pop_project(self, text):
+		project = re.search(self.project_regex, text)
+		if project:
+			for groupname in ['project_space', 'project']:
+				if project.group(groupname):
+					project_name = project.group(groupname)
+
+			text = re.sub(self.project_regex, '', text)
+		else:
+			project_name = ''
+		return project_name, text
+
+	def _pop_due_date(self, text):
+		if 'due:' not in text:
+			return '', text
+		# if `note:` follows `due:`, get all of the text up until then. If
+		# there is no note, this just gets the entire string after `due:`.
+		due_text = text.split('due:')[1]
+		due_text = due_text.split('note:')[0]
+		return due_text.strip(), text.replace('due:' + due_text, '')
+
+	def _pop_notes(self, text):
+		if 'note:' not in text:
+			return [], text
+		note_fragments = text.split('note:')
+		notes = []
+		for fragment in note_fragments[1:]:
+			notes.append(fragment.strip())
+			text = note_fragments[0].strip()
+		return notes, text
+
+	def parse(self, text):
+		labels, text = self._pop_labels(text)
+		priority, text = self._pop_priority(text)
+		project, text = self._pop_project(text)
+		due, text = self._pop_due_date(text)
+		notes, text = self._pop_notes(text)
+
+		return {
+			'labels': labels,
+			'priority': priority,
+			'project': project,
+			'due': due,
+			'notes': notes,
+			'todo': text.strip()
+		}
+
+
+# Every input used in `test_parsing.py`
+CORPUS = [
+	'pick up groceries',
+	'pick up groceries @errands',
+	'pick up groceries @errands @grocery',
+	'pick up groceries @on_the_go',
+	'pick up groceries !!1',
+	'pick up groceries p1',
+	'pick up groceries #shopping',
+	'pick up groceries #shopping !!3 @errands @grocery',
+	'pick up groceries #{grocery shopping} !!3 @errands @grocery',
+	'pick up groceries #(grocery shopping) !!3 @errands @grocery',
+	'pick up groceries #`grocery shopping` !!3 @errands @grocery',
+	'pick up groceries #"grocery shopping" !!3 @errands @grocery',
+	"pick up groceries #'grocery shopping' !!3 @errands @grocery",
+	'pick up groceries #grocery_shopping !!3 @errands @grocery',
+	'pick up groceries #grocery-shopping !!3 @errands @grocery',
+	'pick up groceries #grocery_shopping2 !!3 @errands @grocery',
+	'pick up groceries due:tonight',
+	'pick up groceries due:every monday starting on the first',
+	'pick up groceries due: next week',
+	'pick up groceries due: next week @errands',
+	'pick up groceries due: next week note: go to the new place',
+	'pick up groceries note: go to the new place due: next week',
+	'pick up groceries !!1 #groceries @errands',
+	'pick up groceries !!1 #groceries @errands note: check the grocery list',
+	'pick up groceries !!1 #groceries @errands note: check the grocery list note: check it again',
+	'pick up groceries !!1 #groceries @errands due: next week note: check the grocery list note: check it again',
+	'pick up groceries !!1 #groceries @errands note: check the grocery list note: check it again due: next week',
+	'pick up groceries !!1 @errands',
+	'pick up groceries !!1 @errands due:tomorrow note:check the grocery list note:check it twice',
+	'pick up groceries note: check the grocery list',
+	'pick up groceries #groceries',
+	'pick up groceries !!1 #groceries @errands due: tomorrow',
+	'pick up groceries !!1 #groceries @errands due: next week',
+	'pick up groceries !!1 #groceries @errands due: next week note: check the grocery list',
+	'pick up groceries !!1 #groceries @errands due: tomorrow note: check the grocery list',
+	'!!1 pick up groceries',
+	'p1 pick up groceries',
+	'!!1 @errands pick up groceries',
+	'@on_the_go pick up groceries',
+	'!!1 pick up groceries @errands due:tomorrow note:check the grocery list note:check it twice',
+	'#groceries pick up groceries',
+	'!!1 #groceries @errands pick up groceries due: tomorrow',
+	'!!1 #groceries @errands pick up groceries due: next week',
+	'!!1 #groceries @errands pick up groceries due: next week note: check the grocery list',
+	'!!1 #groceries @errands pick up groceries due: tomorrow note: check the grocery list',
+	'!!1 #groceries @errands pick up groceries note: check the grocery list',
+]
+
+
+class TestParserParity():
+	def test_Parse_GivenCorpus_MatchesLegacyParser(self):
+		parser = TaskParser()
+		legacy = LegacyTaskParser()
+		for task in CORPUS:
+			assert parser.parse(task) == legacy.parse(task), task
+
+	def test_Parse_GivenRepeatedDueAndNotes_MatchesLegacyParser(self):
+		parser = TaskParser()
+		legacy = LegacyTaskParser()
+		inputs = [
+			'pick up groceries due: today due: tomorrow',
+			'pick up groceries note: a due: today note: b due: tomorrow',
+			'pick up groceries !!1 p2 !!1',
+			'pick up groceries #one #two',
+			'pick up @errands groceries',
+			'',
+		]
+		for task in inputs:
+			assert parser.parse(task) == legacy.parse(task), task
+
+	@pytest.mark.parametrize('text,changed,legacy_values', [
+		('@ab @abc', {'todo': ''}, {'todo': 'c'}),
+		('buy @ab @abc', {'todo': 'buy'}, {'todo': 'buy  c'}),
+		('#p1x', {'project': 'p1x', 'priority': ''},
+			{'project': 'x', 'priority': '1'}),
+		('#xp1 !!2', {'project': 'xp1', 'priority': '2', 'todo': ''},
+			{'project': 'x', 'priority': '1', 'todo': '!!2'}),
+		('due: due: buy', {'todo': 'due: buy'}, {'todo': 'buy'}),
+		(u'@caf\xe9 buy', {'labels': [u'caf\xe9'], 'todo': u'buy'},
+			{'labels': [u'caf'], 'todo': u'\xe9 buy'}),
+	])
+	def test_Parse_GivenDocumentedDifference_DiffersOnlyThere(self, text,
+			changed, legacy_values):
+		"""The differences from the legacy parser listed in `parse`."""
+		new = TaskParser().parse(text)
+		old = LegacyTaskParser().parse(text)
+		assert {key: new[key] for key in changed} == changed
+		assert {key: old[key] for key in legacy_values} == legacy_values
+		for key in changed:
+			del new[key], old[key]
+		assert new == old
+
+
+class TestTokenizing():
+	def setup_method(self):
+		self.parser = TaskParser()
+
+	def test_Tokenize_GivenLabelsAndProject_ReturnsSpans(self):
+		text = 'pick up groceries #shopping @errands'
+		tokens = self.parser.tokenize(text)
+		spans = {kind: text[start:end] for kind, _, start, end in tokens}
+		assert spans == {'project': '#shopping', 'label': '@errands'}
+
+	def test_Tokenize_GivenDueAndNotes_ValueSpansCoverText(self):
+		text = 'pick up groceries due: tomorrow note: whole milk'
+		tokens = self.parser.tokenize(text)
+		spans = {kind: text[start:end] for kind, _, start, end in tokens}
+		assert spans['due'] == ' tomorrow '
+		assert spans['note'] == ' whole milk'
+		assert 'todo' not in spans
+
+	def test_Tokenize_GivenPlainText_ReturnsNoTokens(self):
+		assert self.parser.tokenize('pick up groceries') == []
+
+
+@pytest.mark.performance
+def test_Parse_GivenCorpus_IsFasterThanLegacyParser():
+	parser = TaskParser()
+	legacy = LegacyTaskParser()
+
+	def run(p):
+		for task in CORPUS:
+			p.parse(task)
+
+	# Interleave the runs so both parsers see the same machine load.
+	new_times, old_times = [], []
+	for _ in range(10):
+		new_times.append(timeit.timeit(lambda: run(parser), number=20))
+		old_times.append(timeit.timeit(lambda: run(legacy), number=20))
+	new_time, old_time = min(new_times), min(old_times)
+	print('tokenizer: {:.2f}ms, legacy: {:.2f}ms'.format(
+		new_time * 1000, old_time * 1000))
+	assert new_time < old_time